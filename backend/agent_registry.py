@@ -0,0 +1,176 @@
+# backend/agent_registry.py
+"""
+In-process agent registry.
+
+All reads are served from memory (a dict plus secondary indexes). Heartbeats only
+mark the agent dirty; a background thread writes dirty records to the AgentStore
+in batches, either every `flush_interval` seconds or as soon as `flush_threshold`
+agents are waiting. On start the registry is rebuilt from the store snapshot.
+"""
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+from backend.agent_store import AgentStore
+
+FLUSH_INTERVAL = 2.0      # seconds between write-behind flushes
+FLUSH_THRESHOLD = 500     # flush early once this many agents are dirty
+
+INDEXED_FIELDS = ("hostname", "os", "ip_address")
+
+
+class AgentRegistry:
+    def __init__(self, store: AgentStore, flush_interval: float = FLUSH_INTERVAL,
+                 flush_threshold: int = FLUSH_THRESHOLD):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+
+        self._lock = threading.RLock()
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._indexes: Dict[str, Dict[str, Set[str]]] = {f: {} for f in INDEXED_FIELDS}
+        self._index_keys: Dict[str, List[str]] = {f: [] for f in INDEXED_FIELDS}  # sorted, for prefix search
+        self._sorted_ids: List[str] = []                                          # for paging by agent_id
+        self._dirty: Set[str] = set()
+
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # -------------------------------
+    # Lifecycle
+    # -------------------------------
+    def start(self):
+        """Load the last snapshot from the store and start the flusher thread."""
+        with self._lock:
+            for agent_id, record in self.store.all().items():
+                self._put_locked(agent_id, record)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name="agent-registry-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write everything still pending."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print("[ERROR] agent registry flush failed:", e)
+
+    def flush(self) -> int:
+        """Persist all dirty agents in one batch. Returns the number written."""
+        with self._lock:
+            if not self._dirty:
+                return 0
+            batch = [(agent_id, dict(self._records[agent_id])) for agent_id in self._dirty]
+            self._dirty = set()
+        try:
+            self.store.upsert_many(batch)
+        except Exception:
+            # keep them dirty so the next flush retries
+            with self._lock:
+                self._dirty.update(agent_id for agent_id, _ in batch)
+            raise
+        return len(batch)
+
+    # -------------------------------
+    # Writes
+    # -------------------------------
+    def _index_key(self, value):
+        return str(value).lower() if value is not None else None
+
+    def _unindex_locked(self, agent_id, record):
+        for field in INDEXED_FIELDS:
+            key = self._index_key(record.get(field))
+            bucket = self._indexes[field].get(key)
+            if bucket is not None:
+                bucket.discard(agent_id)
+                if not bucket:
+                    del self._indexes[field][key]
+                    keys = self._index_keys[field]
+                    del keys[bisect.bisect_left(keys, key)]
+
+    def _put_locked(self, agent_id, record):
+        old = self._records.get(agent_id)
+        if old is not None:
+            self._unindex_locked(agent_id, old)
+        else:
+            bisect.insort(self._sorted_ids, agent_id)
+        self._records[agent_id] = record
+        for field in INDEXED_FIELDS:
+            key = self._index_key(record.get(field))
+            if key is None:
+                continue
+            bucket = self._indexes[field].get(key)
+            if bucket is None:
+                bucket = self._indexes[field][key] = set()
+                bisect.insort(self._index_keys[field], key)
+            bucket.add(agent_id)
+
+    def put(self, agent_id: str, record: Dict[str, Any]):
+        """Insert/replace an agent record. Never touches disk."""
+        with self._lock:
+            self._put_locked(agent_id, record)
+            self._dirty.add(agent_id)
+            pending = len(self._dirty)
+        if pending >= self.flush_threshold:
+            self._wake.set()
+
+    # -------------------------------
+    # Reads (memory only)
+    # -------------------------------
+    def get(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._records.get(agent_id)
+
+    def get_many(self, agent_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Records for agent_ids, in order (None where unknown)."""
+        with self._lock:
+            return [self._records.get(i) for i in agent_ids]
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return dict(self._records)
+
+    def find(self, field: str, value) -> List[Dict[str, Any]]:
+        """Lookup by a secondary index: hostname, os or ip_address (case-insensitive)."""
+        with self._lock:
+            ids = self._indexes[field].get(self._index_key(value), ())
+            return [self._records[i] for i in ids]
+
+    def find_prefix(self, field: str, prefix: str) -> Set[str]:
+        """Agent ids whose indexed `field` starts with `prefix` (case-insensitive)."""
+        prefix = prefix.lower()
+        out: Set[str] = set()
+        with self._lock:
+            keys = self._index_keys[field]
+            i = bisect.bisect_left(keys, prefix)
+            while i < len(keys) and keys[i].startswith(prefix):
+                out |= self._indexes[field][keys[i]]
+                i += 1
+        return out
+
+    def page_ids(self, after: Optional[str] = None, limit: int = 0) -> List[str]:
+        """Agent ids in agent_id order, starting after `after`."""
+        with self._lock:
+            start = bisect.bisect_right(self._sorted_ids, after) if after else 0
+            end = start + limit if limit else len(self._sorted_ids)
+            return self._sorted_ids[start:end]
+
+    def pending_writes(self) -> int:
+        """Dirty agents not yet flushed to the store."""
+        with self._lock:
+            return len(self._dirty)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._records)
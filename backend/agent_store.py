@@ -0,0 +1,228 @@
+# backend/agent_store.py
+"""
+Pluggable persistence for agent records.
+
+main.py only talks to the AgentStore interface, so the storage engine can be
+swapped without touching the API handlers:
+
+- SqliteAgentStore: default. WAL journal, one row per agent, per-agent upserts.
+- JsonAgentStore:   legacy agents_db.json layout (whole-file rewrite, locked).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+AGENT_DB_FILE = os.environ.get("SYS_AI_AGENT_DB", "sysai_backend.db")
+LEGACY_AGENT_FILE = "agents_db.json"
+
+
+# -------------------------------
+# Interface
+# -------------------------------
+class AgentStore:
+    """Storage interface used by the agent API handlers."""
+
+    def upsert(self, agent_id: str, record: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def upsert_many(self, records: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+        for agent_id, record in records:
+            self.upsert(agent_id, record)
+
+    def get(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        return len(self.all())
+
+    def close(self) -> None:
+        pass
+
+
+# -------------------------------
+# SQLite (WAL) backend
+# -------------------------------
+class SqliteAgentStore(AgentStore):
+    """
+    One row per agent. Indexed columns are kept alongside the full JSON record
+    so listings can be filtered without decoding every row.
+    """
+
+    def __init__(self, path: str = AGENT_DB_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS agent_records (
+                agent_id   TEXT PRIMARY KEY,
+                hostname   TEXT,
+                username   TEXT,
+                os         TEXT,
+                ip_address TEXT,
+                last_seen  REAL,
+                record     TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_agent_records_last_seen ON agent_records(last_seen)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_agent_records_hostname ON agent_records(hostname)")
+
+    @staticmethod
+    def _row(agent_id, record):
+        return (
+            agent_id,
+            record.get("hostname"),
+            record.get("username"),
+            record.get("os"),
+            record.get("ip_address"),
+            record.get("last_seen", 0),
+            json.dumps(record),
+        )
+
+    _UPSERT_SQL = """
+        INSERT INTO agent_records (agent_id, hostname, username, os, ip_address, last_seen, record)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(agent_id) DO UPDATE SET
+            hostname=excluded.hostname,
+            username=excluded.username,
+            os=excluded.os,
+            ip_address=excluded.ip_address,
+            last_seen=excluded.last_seen,
+            record=excluded.record
+    """
+
+    def upsert(self, agent_id, record):
+        with self._lock:
+            self._conn.execute(self._UPSERT_SQL, self._row(agent_id, record))
+
+    def upsert_many(self, records):
+        rows = [self._row(agent_id, record) for agent_id, record in records]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(self._UPSERT_SQL, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get(self, agent_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT record FROM agent_records WHERE agent_id = ?", (agent_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def all(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT agent_id, record FROM agent_records").fetchall()
+        return {agent_id: json.loads(record) for agent_id, record in rows}
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM agent_records").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# -------------------------------
+# Legacy JSON backend
+# -------------------------------
+class JsonAgentStore(AgentStore):
+    """agents_db.json layout. Kept for compatibility; every write rewrites the file."""
+
+    def __init__(self, path: str = LEGACY_AGENT_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save(self, data):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp, self.path)
+
+    def upsert(self, agent_id, record):
+        self.upsert_many([(agent_id, record)])
+
+    def upsert_many(self, records):
+        with self._lock:
+            db = self._load()
+            for agent_id, record in records:
+                db[agent_id] = record
+            self._save(db)
+
+    def get(self, agent_id):
+        with self._lock:
+            return self._load().get(agent_id)
+
+    def all(self):
+        with self._lock:
+            return self._load()
+
+
+# -------------------------------
+# Factory + migration
+# -------------------------------
+def open_agent_store(kind: Optional[str] = None) -> AgentStore:
+    """Select the backend with SYS_AI_AGENT_STORE=sqlite|json (default sqlite)."""
+    kind = (kind or os.environ.get("SYS_AI_AGENT_STORE", "sqlite")).lower()
+    if kind == "json":
+        return JsonAgentStore()
+    if kind == "sqlite":
+        return SqliteAgentStore()
+    raise ValueError(f"Unknown agent store: {kind}")
+
+
+def migrate_json_agents(store: AgentStore, json_path: str = LEGACY_AGENT_FILE) -> int:
+    """
+    One-shot import of agents_db.json into `store`.
+    Only runs when the target store is empty; returns the number of agents imported.
+    """
+    if isinstance(store, JsonAgentStore) or not os.path.exists(json_path):
+        return 0
+    if store.count() > 0:
+        return 0
+    try:
+        with open(json_path, "r") as f:
+            legacy = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return 0
+
+    records = []
+    for agent_id, record in legacy.items():
+        if not isinstance(record, dict):
+            continue
+        record = dict(record)
+        record.setdefault("agent_id", agent_id)
+        record.setdefault("last_seen", 0)
+        records.append((agent_id, record))
+    store.upsert_many(records)
+    return len(records)
+
+
+if __name__ == "__main__":
+    # python -m backend.agent_store  -> migrate agents_db.json into the SQLite store
+    s = SqliteAgentStore()
+    started = time.time()
+    n = migrate_json_agents(s)
+    print(f"[MIGRATE] imported {n} agents into {s.path} in {time.time() - started:.2f}s")
@@ -1,10 +1,15 @@
 # modules/backend_client.py
-import os, requests
+import os, sys
+
+# shared client libraries live in src/sys-ai/modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "sys-ai"))
+from modules.http_client import get_client
+
 BACKEND = os.environ.get("SYS_AI_BACKEND", "http://YOUR_BACKEND_HOST:8000")
 API_TOKEN = os.environ.get("SYS_AI_BACKEND_TOKEN", "replace-with-strong-token")
 HEADERS = {"Authorization": f"Bearer {API_TOKEN}", "Content-Type": "application/json"}
 
 def list_agents():
-    r = requests.get(f"{BACKEND}/api/agents", headers=HEADERS, timeout=10)
+    r = get_client(BACKEND, headers=HEADERS).get("/api/agents", timeout=10)
     r.raise_for_status()
     return r.json()
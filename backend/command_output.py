@@ -0,0 +1,115 @@
+# backend/command_output.py
+"""
+Live output of running commands.
+
+Agents stream output to /api/agent/command_output in sequence-numbered
+chunks while a command runs; the portal tails them with
+/api/commands/{id}/output?after_seq=N before the final result arrives.
+
+Chunks are ordered by seq and de-duplicated (an agent may resend one after a
+timeout). Each command keeps at most MAX_STREAM_CHARS; later chunks are
+dropped and a single truncation marker is appended instead. Kept in memory
+for the newest MAX_COMMANDS commands only (in Redis, with a TTL, when
+SYS_AI_STATE_BACKEND=redis: see RedisCommandOutputs); the stored result
+(backend/command_results.py) outlives it.
+"""
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+MAX_COMMANDS = 1000
+MAX_STREAM_CHARS = 1024 * 1024   # per command
+MAX_CHUNK_CHARS = 64 * 1024      # per request
+# final results carry the head and tail of the output (32 KB each on the
+# agent, see command_runner.py) plus markers; older agents send everything,
+# so larger results are cut down the same way by cap_result()
+RESULT_HEAD_CHARS = 32 * 1024
+RESULT_TAIL_CHARS = 32 * 1024
+MAX_RESULT_CHARS = RESULT_HEAD_CHARS + RESULT_TAIL_CHARS + 1024
+TRUNCATION_MARKER = "\n...[output truncated: streamed output is limited to {limit} characters]\n"
+
+
+class CommandOutputs:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._outputs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def _get_or_create_locked(self, command_id, agent_id):
+        out = self._outputs.get(command_id)
+        if out is None:
+            out = self._outputs[command_id] = {
+                "command_id": command_id,
+                "agent_id": agent_id,
+                "seqs": [],          # sorted, parallel to chunks
+                "chunks": [],
+                "chars": 0,
+                "truncated": False,
+                "updated_at": time.time(),
+                "done": False,
+            }
+            while len(self._outputs) > MAX_COMMANDS:
+                self._outputs.popitem(last=False)
+        return out
+
+    def append(self, command_id: str, agent_id: str, text: str, seq: Optional[int] = None) -> bool:
+        """
+        Store one chunk. seq=None appends after the last chunk. Returns False if
+        the chunk was a duplicate, came from another agent or was over the limit.
+        """
+        with self._lock:
+            out = self._get_or_create_locked(command_id, agent_id)
+            if out["agent_id"] != agent_id or out["truncated"]:
+                return False
+            seqs = out["seqs"]
+            if seq is None:
+                seq = seqs[-1] + 1 if seqs else 0
+            pos = bisect.bisect_left(seqs, seq)
+            if pos < len(seqs) and seqs[pos] == seq:
+                return False
+
+            out["updated_at"] = time.time()
+            room = MAX_STREAM_CHARS - out["chars"]
+            if len(text) > room:
+                text = text[:room] + TRUNCATION_MARKER.format(limit=MAX_STREAM_CHARS)
+                out["truncated"] = True
+            seqs.insert(pos, seq)
+            out["chunks"].insert(pos, text)
+            out["chars"] += len(text)
+            return True
+
+    def finish(self, command_id: str):
+        with self._lock:
+            out = self._outputs.get(command_id)
+            if out is not None:
+                out["done"] = True
+
+    def get(self, command_id: str, after_seq: int = -1) -> Optional[Dict[str, Any]]:
+        """Chunks with seq > after_seq; pass the returned last_seq back to tail."""
+        with self._lock:
+            out = self._outputs.get(command_id)
+            if out is None:
+                return None
+            seqs = out["seqs"]
+            start = bisect.bisect_right(seqs, after_seq)
+            chunks = [{"seq": s, "text": t} for s, t in zip(seqs[start:], out["chunks"][start:])]
+            return {
+                "command_id": command_id,
+                "agent_id": out["agent_id"],
+                "chunks": chunks,
+                "output": "".join(c["text"] for c in chunks),
+                "last_seq": seqs[-1] if seqs else after_seq,
+                "truncated": out["truncated"],
+                "updated_at": out["updated_at"],
+                "done": out["done"],
+            }
+
+
+def cap_result(output: Optional[str]) -> Optional[str]:
+    """Head and tail of a final result over MAX_RESULT_CHARS, with a marker for the rest."""
+    if output is None or len(output) <= MAX_RESULT_CHARS:
+        return output
+    omitted = len(output) - RESULT_HEAD_CHARS - RESULT_TAIL_CHARS
+    return (output[:RESULT_HEAD_CHARS] + f"\n...[{omitted} characters omitted by the backend]...\n"
+            + output[-RESULT_TAIL_CHARS:])
@@ -0,0 +1,418 @@
+# backend/command_queue.py
+"""
+Per-agent command queue with leases and explicit acknowledgement.
+
+- enqueue / lease / ack are O(1) per command (deque + dicts in memory).
+- A leased command stays invisible for lease_seconds(): at least
+  `visibility_timeout`, and long enough for the command to run out its own
+  "timeout". extend() renews the leases of commands the agent reports as
+  still queued or running (sync heartbeats, output chunks). If the
+  agent does not ack it via /api/agent/command_response in that time it is
+  handed out again (at-least-once delivery), up to MAX_ATTEMPTS times; then
+  it is dropped and reported to `on_drop(agent_id, entry)`, so it still gets
+  a (failed) result.
+- Commands may carry a `dedup_key`; while a command with the same key is still
+  unacknowledged for that agent, further enqueues collapse into it.
+- Every enqueue/ack is written through to SQLite, so a restart redelivers
+  everything that was not acknowledged. With a PersistenceQueue as `writer`
+  those writes run on its worker thread instead of the caller's.
+- lease_wait() is the long-poll variant: it parks the request until a command
+  is enqueued for the agent or the timeout passes.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from backend.agent_store import AGENT_DB_FILE
+from backend.persistence import PersistenceQueue
+
+LEGACY_COMMAND_FILE = "commands_db.json"
+
+VISIBILITY_TIMEOUT = 120   # seconds a leased command stays hidden before redelivery
+MAX_ATTEMPTS = 3           # deliveries before an unacknowledged command is dropped
+DEFAULT_COMMAND_TIMEOUT = 300   # the agent's run timeout for commands without "timeout"
+LEASE_SLACK = 60           # on top of the run timeout: result upload, clock skew
+
+# Power actions must never be replayed (a reboot can race the ack),
+# so they are acknowledged as soon as they are handed out.
+DELIVER_ONCE_TYPES = {"shutdown", "restart"}
+
+
+class BaseCommandQueue:
+    """
+    Shared by the in-process CommandQueue and the Redis-backed queue in
+    backend/shared_state.py: long-poll waiters and the JSON migration.
+    Subclasses implement enqueue_many / lease / ack / pending_count / close.
+    """
+
+    # queues whose lease() does network I/O set this, so long-polls run it off the event loop
+    BLOCKING_LEASE = False
+
+    def __init__(self):
+        self._waiters_lock = threading.Lock()
+        self._waiters: Dict[str, set] = {}                     # agent_id -> {(loop, asyncio.Event)}
+        # called with (agent_id, entry) for each command dropped after MAX_ATTEMPTS
+        self.on_drop: Optional[Callable[[str, Dict[str, Any]], None]] = None
+
+    def _report_dropped(self, agent_id, entries):
+        for entry in entries:
+            print(f"[COMMAND QUEUE] dropping {entry['command']['id']} for {agent_id} "
+                  f"after {entry['attempts']} attempts")
+            if self.on_drop is not None:
+                try:
+                    self.on_drop(agent_id, entry)
+                except Exception as e:
+                    print("[ERROR] dropped command callback failed:", e)
+
+    def enqueue(self, agent_id: str, command: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue `command` for `agent_id`. Returns (command, duplicate).
+        A missing `id` is filled in; `dedup_key` collapses repeats.
+        """
+        results = self.enqueue_many([(agent_id, command)])
+        return results[0]
+
+    def _notify(self, agent_ids):
+        """Wake long-polls parked in this process for these agents."""
+        with self._waiters_lock:
+            for agent_id in agent_ids:
+                for loop, event in self._waiters.get(agent_id, ()):
+                    loop.call_soon_threadsafe(event.set)
+
+    def lease_seconds(self, command: Dict[str, Any]) -> float:
+        """How long a delivered command stays leased before it is handed out again."""
+        if command.get("visibility_timeout") is not None:
+            return float(command["visibility_timeout"])
+        try:
+            timeout = float(command.get("timeout") or DEFAULT_COMMAND_TIMEOUT)
+        except (TypeError, ValueError):
+            timeout = DEFAULT_COMMAND_TIMEOUT
+        return max(self.visibility_timeout, timeout + LEASE_SLACK)
+
+    async def _lease(self, agent_id):
+        if self.BLOCKING_LEASE:
+            return await asyncio.to_thread(self.lease, agent_id)
+        return self.lease(agent_id)
+
+    async def lease_wait(self, agent_id: str, timeout: float) -> List[Dict[str, Any]]:
+        """
+        Long-poll lease: return as soon as a command is available for the agent,
+        or an empty list after `timeout` seconds.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            commands = await self._lease(agent_id)
+            remaining = deadline - loop.time()
+            if commands or remaining <= 0:
+                return commands
+
+            waiter = (loop, asyncio.Event())
+            with self._waiters_lock:
+                self._waiters.setdefault(agent_id, set()).add(waiter)
+            try:
+                # re-check after registering so an enqueue in between is not missed
+                commands = await self._lease(agent_id)
+                if commands:
+                    return commands
+                await asyncio.wait_for(waiter[1].wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._waiters_lock:
+                    waiters = self._waiters.get(agent_id)
+                    if waiters is not None:
+                        waiters.discard(waiter)
+                        if not waiters:
+                            del self._waiters[agent_id]
+
+    # -------------------------------
+    # Migration
+    # -------------------------------
+    def migrate_json(self, json_path: str = LEGACY_COMMAND_FILE) -> int:
+        """
+        One-shot import of commands_db.json. Identical commands queued repeatedly
+        for the same agent (e.g. dozens of quick_assist clicks) collapse into one.
+        """
+        name = f"commands_json:{os.path.abspath(json_path)}"
+        if self._migration_applied(name):
+            return 0
+        legacy = {}
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, "r") as f:
+                    legacy = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                legacy = {}
+
+        items = []
+        for agent_id, commands in legacy.items():
+            seen = set()
+            for cmd in commands or []:
+                if not isinstance(cmd, dict):
+                    continue
+                cmd = dict(cmd)
+                fingerprint = json.dumps({k: v for k, v in cmd.items() if k != "id"}, sort_keys=True)
+                if fingerprint in seen:
+                    continue
+                seen.add(fingerprint)
+                items.append((agent_id, cmd))
+        imported = sum(1 for _, dup in self.enqueue_many(items) if not dup)
+        self._record_migration(name)
+        return imported
+
+    def _migration_applied(self, name: str) -> bool:
+        raise NotImplementedError
+
+    def _record_migration(self, name: str):
+        raise NotImplementedError
+
+
+class CommandQueue(BaseCommandQueue):
+    def __init__(self, path: str = AGENT_DB_FILE, visibility_timeout: float = VISIBILITY_TIMEOUT,
+                 writer: Optional[PersistenceQueue] = None):
+        super().__init__()
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.writer = writer
+        self._db_lock = threading.Lock()
+
+        self._lock = threading.RLock()
+        self._entries: Dict[str, Dict[str, Any]] = {}          # command_id -> entry
+        self._ready: Dict[str, deque] = {}                     # agent_id -> deque[command_id]
+        self._leased: Dict[str, Dict[str, float]] = {}         # agent_id -> command_id -> deadline
+        self._dedup: Dict[Tuple[str, str], str] = {}           # (agent_id, key) -> command_id
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS command_queue (
+                seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+                command_id  TEXT UNIQUE NOT NULL,
+                agent_id    TEXT NOT NULL,
+                dedup_key   TEXT,
+                payload     TEXT NOT NULL,
+                enqueued_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS migrations (
+                name       TEXT PRIMARY KEY,
+                applied_at REAL
+            )
+        """)
+        self._load()
+
+    # -------------------------------
+    # Persistence
+    # -------------------------------
+    def _load(self):
+        rows = self._conn.execute(
+            "SELECT command_id, agent_id, dedup_key, payload, enqueued_at FROM command_queue ORDER BY seq"
+        ).fetchall()
+        with self._lock:
+            for command_id, agent_id, dedup_key, payload, enqueued_at in rows:
+                self._add_locked(agent_id, json.loads(payload), dedup_key, enqueued_at)
+
+    def _write(self, fn, *args):
+        # deletes must not be dropped, so they wait for room in the writer queue
+        if self.writer is not None:
+            self.writer.submit(fn, *args, block=True)
+        else:
+            fn(*args)
+
+    def _persist_many(self, entries):
+        rows = [
+            (e["command"]["id"], e["agent_id"], e["dedup_key"], json.dumps(e["command"]), e["enqueued_at"])
+            for e in entries
+        ]
+        self._write(self._insert_rows, rows)
+
+    def _insert_rows(self, rows):
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO command_queue (command_id, agent_id, dedup_key, payload, enqueued_at) "
+                    "VALUES (?, ?, ?, ?, ?)", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _delete(self, command_id):
+        self._write(self._delete_row, command_id)
+
+    def _delete_row(self, command_id):
+        with self._db_lock:
+            self._conn.execute("DELETE FROM command_queue WHERE command_id = ?", (command_id,))
+
+    # -------------------------------
+    # In-memory bookkeeping
+    # -------------------------------
+    def _add_locked(self, agent_id, command, dedup_key, enqueued_at):
+        entry = {
+            "agent_id": agent_id,
+            "command": command,
+            "dedup_key": dedup_key,
+            "enqueued_at": enqueued_at,
+            "attempts": 0,
+        }
+        self._entries[command["id"]] = entry
+        self._ready.setdefault(agent_id, deque()).append(command["id"])
+        if dedup_key:
+            self._dedup[(agent_id, dedup_key)] = command["id"]
+        return entry
+
+    def _remove_locked(self, command_id):
+        entry = self._entries.pop(command_id, None)
+        if entry is None:
+            return None
+        agent_id = entry["agent_id"]
+        leased = self._leased.get(agent_id)
+        if leased is not None:
+            leased.pop(command_id, None)
+        if entry["dedup_key"] and self._dedup.get((agent_id, entry["dedup_key"])) == command_id:
+            del self._dedup[(agent_id, entry["dedup_key"])]
+        return entry
+
+    def _requeue_expired_locked(self, agent_id, now):
+        """Put expired leases back in front of the queue; returns the entries dropped instead."""
+        leased = self._leased.get(agent_id)
+        if not leased:
+            return []
+        expired = [command_id for command_id, deadline in leased.items() if deadline <= now]
+        ready = self._ready.setdefault(agent_id, deque())
+        dropped = []
+        for command_id in reversed(expired):
+            del leased[command_id]
+            if self._entries[command_id]["attempts"] >= MAX_ATTEMPTS:
+                dropped.append(self._remove_locked(command_id))
+                self._delete(command_id)
+            else:
+                ready.appendleft(command_id)
+        return dropped
+
+    # -------------------------------
+    # Public API
+    # -------------------------------
+    def enqueue_many(self, items: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[Dict[str, Any], bool]]:
+        """
+        Queue several commands in one SQLite transaction. Raises Backpressure
+        (nothing queued) when the persistence writer is saturated.
+        """
+        if self.writer is not None:
+            self.writer.check()
+        results, new_entries = [], []
+        now = time.time()
+        with self._lock:
+            for agent_id, command in items:
+                command = dict(command)
+                command.setdefault("id", str(uuid.uuid4()))
+                dedup_key = command.get("dedup_key")
+                existing = self._dedup.get((agent_id, dedup_key)) if dedup_key else None
+                if existing is not None:
+                    results.append((self._entries[existing]["command"], True))
+                    continue
+                if command["id"] in self._entries:
+                    results.append((self._entries[command["id"]]["command"], True))
+                    continue
+                new_entries.append(self._add_locked(agent_id, command, dedup_key, now))
+                results.append((command, False))
+            if new_entries:
+                self._persist_many(new_entries)
+        self._notify({e["agent_id"] for e in new_entries})
+        return results
+
+    def lease(self, agent_id: str) -> List[Dict[str, Any]]:
+        """Hand out every visible command for the agent and start its visibility timer."""
+        now = time.time()
+        out = []
+        with self._lock:
+            dropped = self._requeue_expired_locked(agent_id, now)
+            ready = self._ready.get(agent_id) or ()
+            leased = self._leased.setdefault(agent_id, {})
+            while ready:
+                command_id = ready.popleft()
+                entry = self._entries.get(command_id)
+                if entry is None:
+                    continue
+                entry["attempts"] += 1
+                entry["leased_at"] = now
+                out.append(entry["command"])
+                if entry["command"].get("type") in DELIVER_ONCE_TYPES:
+                    self._remove_locked(command_id)
+                    self._delete(command_id)
+                else:
+                    leased[command_id] = now + self.lease_seconds(entry["command"])
+        self._report_dropped(agent_id, dropped)
+        return out
+
+    def extend(self, agent_id: str, command_ids: List[str]) -> int:
+        """
+        Renew the leases of commands the agent still has queued or running, so
+        a long or queued-behind-others command isn't redelivered (and dropped).
+        Returns the number of leases renewed.
+        """
+        now = time.time()
+        renewed = 0
+        with self._lock:
+            leased = self._leased.get(agent_id)
+            if not leased:
+                return 0
+            for command_id in command_ids:
+                if command_id in leased:
+                    deadline = now + self.lease_seconds(self._entries[command_id]["command"])
+                    leased[command_id] = max(leased[command_id], deadline)
+                    renewed += 1
+        return renewed
+
+    def ack(self, agent_id: str, command_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Remove a delivered command and return its entry (command, enqueued_at,
+        leased_at, attempts). None if it was unknown or already acked.
+        """
+        with self._lock:
+            entry = self._entries.get(command_id)
+            if entry is None or entry["agent_id"] != agent_id:
+                return None
+            self._remove_locked(command_id)
+            self._delete(command_id)
+            return entry
+
+    def cancel_pending(self, agent_id: str, command_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Drop a command that has not been handed out yet and return its entry.
+        None if it is unknown or already leased (then the agent must cancel it).
+        """
+        with self._lock:
+            if command_id in self._leased.get(agent_id, ()):
+                return None
+            return self.ack(agent_id, command_id)
+
+    def pending_count(self, agent_id: str) -> int:
+        with self._lock:
+            return len(self._ready.get(agent_id, ())) + len(self._leased.get(agent_id, ()))
+
+    def close(self):
+        # call after the writer has been stopped (drained)
+        with self._db_lock:
+            self._conn.close()
+
+    def _migration_applied(self, name):
+        with self._db_lock:
+            return self._conn.execute("SELECT 1 FROM migrations WHERE name = ?", (name,)).fetchone() is not None
+
+    def _record_migration(self, name):
+        self._write(self._mark_migrated, name)
+
+    def _mark_migrated(self, name):
+        with self._db_lock:
+            self._conn.execute("INSERT INTO migrations (name, applied_at) VALUES (?, ?)", (name, time.time()))
@@ -0,0 +1,204 @@
+# backend/command_results.py
+"""
+Persisted command results.
+
+/api/agent/command_response hands results to record(), which only queues them;
+a writer thread stores them in SQLite in batches, so the request thread never
+waits on disk (or the console).
+
+- command_results: one small, indexed row per command (agent, timing, success,
+  sizes, a short preview). Lookups by command id, agent + time range, or time.
+- command_outputs: the zlib-compressed output, stored out-of-line so large
+  outputs don't bloat the index table. Outputs above MAX_OUTPUT are truncated.
+"""
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+from backend.agent_store import AGENT_DB_FILE
+
+MAX_OUTPUT = 1024 * 1024     # bytes of output kept per command
+PREVIEW_CHARS = 200
+TRUNCATION_MARKER = "\n...[output truncated: {dropped} bytes dropped]"
+
+WRITE_BATCH = 200
+WRITE_INTERVAL = 1.0         # seconds
+
+
+class CommandResults:
+    def __init__(self, path: str = AGENT_DB_FILE):
+        self.path = path
+        self._pending: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self._db_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS command_outputs (
+                id   INTEGER PRIMARY KEY AUTOINCREMENT,
+                data BLOB NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS command_results (
+                command_id   TEXT PRIMARY KEY,
+                agent_id     TEXT NOT NULL,
+                job_id       TEXT,
+                type         TEXT,
+                enqueued_at  REAL,
+                delivered_at REAL,
+                completed_at REAL NOT NULL,
+                success      INTEGER NOT NULL,
+                output_size  INTEGER NOT NULL,
+                truncated    INTEGER NOT NULL DEFAULT 0,
+                preview      TEXT,
+                output_id    INTEGER REFERENCES command_outputs(id)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_command_results_agent ON command_results(agent_id, completed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_command_results_time ON command_results(completed_at)")
+
+    # -------------------------------
+    # Lifecycle
+    # -------------------------------
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._write_loop, name="command-results-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self._write_batch(self._drain())
+        with self._db_lock:
+            self._conn.close()
+
+    def _drain(self, limit: int = 0):
+        batch = []
+        while not limit or len(batch) < limit:
+            try:
+                batch.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_loop(self):
+        while not self._stopping.is_set():
+            try:
+                first = self._pending.get(timeout=WRITE_INTERVAL)
+            except queue.Empty:
+                continue
+            batch = [first] + self._drain(WRITE_BATCH - 1)
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                print("[ERROR] command results write failed:", e)
+
+    # -------------------------------
+    # Writes
+    # -------------------------------
+    def record(self, command_id: str, agent_id: str, success: bool, output: str,
+               command: Optional[Dict[str, Any]] = None, enqueued_at: Optional[float] = None,
+               delivered_at: Optional[float] = None, completed_at: Optional[float] = None):
+        """Queue a result for storage. Returns immediately."""
+        command = command or {}
+        self._pending.put({
+            "command_id": command_id,
+            "agent_id": agent_id,
+            "job_id": command.get("job_id"),
+            "type": command.get("type"),
+            "enqueued_at": enqueued_at,
+            "delivered_at": delivered_at,
+            "completed_at": completed_at or time.time(),
+            "success": bool(success),
+            "output": output or "",
+        })
+
+    def pending(self) -> int:
+        """Results queued but not yet written."""
+        return self._pending.qsize()
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                for r in batch:
+                    raw = r["output"].encode("utf-8", errors="replace")
+                    truncated = len(raw) > MAX_OUTPUT
+                    if truncated:
+                        dropped = len(raw) - MAX_OUTPUT
+                        raw = raw[:MAX_OUTPUT] + TRUNCATION_MARKER.format(dropped=dropped).encode()
+                    cur = self._conn.execute("INSERT INTO command_outputs (data) VALUES (?)",
+                                             (zlib.compress(raw),))
+                    old = self._conn.execute("SELECT output_id FROM command_results WHERE command_id = ?",
+                                             (r["command_id"],)).fetchone()
+                    self._conn.execute("""
+                        INSERT OR REPLACE INTO command_results (command_id, agent_id, job_id, type,
+                            enqueued_at, delivered_at, completed_at, success, output_size, truncated,
+                            preview, output_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, (r["command_id"], r["agent_id"], r["job_id"], r["type"], r["enqueued_at"],
+                          r["delivered_at"], r["completed_at"], int(r["success"]), len(r["output"]),
+                          int(truncated), r["output"][:PREVIEW_CHARS], cur.lastrowid))
+                    if old and old[0]:
+                        self._conn.execute("DELETE FROM command_outputs WHERE id = ?", (old[0],))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # -------------------------------
+    # Reads
+    # -------------------------------
+    _COLUMNS = ("command_id", "agent_id", "job_id", "type", "enqueued_at", "delivered_at",
+                "completed_at", "success", "output_size", "truncated", "preview")
+
+    def _row(self, row):
+        out = dict(zip(self._COLUMNS, row))
+        out["success"] = bool(out["success"])
+        out["truncated"] = bool(out["truncated"])
+        return out
+
+    def get(self, command_id: str) -> Optional[Dict[str, Any]]:
+        """Full result including the decompressed output."""
+        with self._db_lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)}, output_id FROM command_results WHERE command_id = ?",
+                (command_id,)).fetchone()
+            if row is None:
+                return None
+            data = self._conn.execute("SELECT data FROM command_outputs WHERE id = ?", (row[-1],)).fetchone()
+        out = self._row(row[:-1])
+        out["output"] = zlib.decompress(data[0]).decode("utf-8", errors="replace") if data else ""
+        return out
+
+    def query(self, agent_id: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Result metadata (with preview, without full output), newest first."""
+        where, args = [], []
+        if agent_id:
+            where.append("agent_id = ?")
+            args.append(agent_id)
+        if since is not None:
+            where.append("completed_at > ?")
+            args.append(since)
+        if until is not None:
+            where.append("completed_at <= ?")
+            args.append(until)
+        sql = f"SELECT {', '.join(self._COLUMNS)} FROM command_results"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY completed_at DESC LIMIT ?"
+        args.append(max(1, min(limit, 500)))
+        with self._db_lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [self._row(r) for r in rows]
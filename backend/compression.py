@@ -0,0 +1,78 @@
+# backend/compression.py
+"""
+Request-body decompression.
+
+Clients (modules/http_client.py, the agents' offline replay) gzip large JSON
+bodies and send Content-Encoding: gzip. This ASGI middleware inflates them
+before FastAPI parses the body, so every endpoint accepts compressed bodies.
+Inflation is bounded by MAX_BODY_BYTES. Responses are compressed by
+Starlette's GZipMiddleware.
+"""
+import asyncio
+import json
+import zlib
+
+MAX_BODY_BYTES = 16 * 1024 * 1024   # after decompression
+INLINE_LIMIT = 64 * 1024            # larger bodies are inflated off the event loop
+
+
+def _inflate(body: bytes, limit: int) -> bytes:
+    # bounded, so a small body can't expand into gigabytes
+    return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(body, limit + 1)
+
+
+class GzipRequestMiddleware:
+    def __init__(self, app, max_body: int = MAX_BODY_BYTES):
+        self.app = app
+        self.max_body = max_body
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = scope["headers"]
+        encoding = next((v for k, v in headers if k == b"content-encoding"), b"").lower()
+        if encoding != b"gzip":
+            return await self.app(scope, receive, send)
+
+        chunks, size, more = [], 0, True
+        while more:
+            message = await receive()
+            if message["type"] != "http.request":
+                return
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body:
+                return await self._error(send, 413, "Request body too large")
+            chunks.append(chunk)
+            more = message.get("more_body", False)
+        body = b"".join(chunks)
+        try:
+            if len(body) > INLINE_LIMIT:
+                body = await asyncio.to_thread(_inflate, body, self.max_body)
+            else:
+                body = _inflate(body, self.max_body)
+        except zlib.error:
+            return await self._error(send, 400, "Invalid gzip body")
+        if len(body) > self.max_body:
+            return await self._error(send, 413, "Request body too large")
+
+        scope = dict(scope)
+        scope["headers"] = [(k, v) for k, v in headers if k not in (b"content-encoding", b"content-length")]
+        scope["headers"].append((b"content-length", str(len(body)).encode()))
+        delivered = False
+
+        async def replay():
+            nonlocal delivered
+            if not delivered:
+                delivered = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        await self.app(scope, replay, send)
+
+    async def _error(self, send, status, detail):
+        payload = json.dumps({"detail": detail}).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(payload)).encode())]})
+        await send({"type": "http.response.body", "body": payload})
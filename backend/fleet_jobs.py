@@ -0,0 +1,95 @@
+# backend/fleet_jobs.py
+"""
+Bulk command jobs.
+
+A job fans one command out to many agents (queued in a single CommandQueue
+transaction) and aggregates the /api/agent/command_response posts that come
+back, so the portal can poll one job instead of hundreds of agents.
+Jobs are kept in memory; the newest MAX_JOBS are retained.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+MAX_JOBS = 200
+OUTPUT_PREVIEW = 500   # characters of each agent's output kept on the job
+
+
+def summarize(job: Dict[str, Any], results: Dict[str, Any], include_results: bool = False) -> Dict[str, Any]:
+    total = len(job["targets"])
+    succeeded = sum(1 for r in results.values() if r["success"])
+    out = {
+        "job_id": job["job_id"],
+        "created_at": job["created_at"],
+        "command": job["command"],
+        "total": total,
+        "completed": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "pending": total - len(results),
+        "done": len(results) == total,
+    }
+    if include_results:
+        out["results"] = results
+        out["pending_agents"] = sorted(a for a in job["targets"] if a not in results)
+    return out
+
+
+class FleetJobs:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._by_command: Dict[str, str] = {}   # command_id -> job_id
+
+    def new_job_id(self) -> str:
+        return f"job-{uuid.uuid4().hex[:12]}"
+
+    def create(self, job_id: str, command: Dict[str, Any], targets: Dict[str, str]) -> Dict[str, Any]:
+        """targets: agent_id -> command_id queued for that agent."""
+        job = {
+            "job_id": job_id,
+            "created_at": time.time(),
+            "command": command,
+            "targets": dict(targets),
+            "results": {},   # agent_id -> result
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            for command_id in targets.values():
+                self._by_command[command_id] = job_id
+            while len(self._jobs) > MAX_JOBS:
+                _, old = self._jobs.popitem(last=False)
+                for command_id in old["targets"].values():
+                    self._by_command.pop(command_id, None)
+        return job
+
+    def record_result(self, command_id: str, agent_id: str, success: bool, output: str) -> Optional[str]:
+        """Attach a command response to its job. Returns the job id, or None if not a fleet command."""
+        with self._lock:
+            job_id = self._by_command.get(command_id)
+            if job_id is None:
+                return None
+            job = self._jobs[job_id]
+            if job["targets"].get(agent_id) != command_id:
+                return None
+            job["results"][agent_id] = {
+                "command_id": command_id,
+                "success": success,
+                "output": (output or "")[:OUTPUT_PREVIEW],
+                "received_at": time.time(),
+            }
+            return job_id
+
+    def summary(self, job_id: str, include_results: bool = False) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return summarize(job, dict(job["results"]), include_results)
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            job_ids = list(self._jobs)[-limit:]
+        return [self.summary(job_id) for job_id in reversed(job_ids)]
@@ -1,30 +1,157 @@
 # backend/main.py
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Dict, Any
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, Any, List, Optional
+import asyncio
+import base64
+import fnmatch
+import hashlib
+import json
+import os
 import time
-import json, os
+
+from backend.agent_store import open_agent_store, migrate_json_agents
+from backend.agent_registry import AgentRegistry
+from backend.command_queue import CommandQueue
+from backend.metrics_history import MetricsHistory
+from backend.presence import PresenceTracker
+from backend.fleet_jobs import FleetJobs
+from backend.command_results import CommandResults
+from backend.command_output import MAX_CHUNK_CHARS, CommandOutputs, cap_result
+from backend.persistence import Backpressure, LoadGate, PersistenceQueue
+from backend.compression import MAX_BODY_BYTES, GzipRequestMiddleware
 
 app = FastAPI()
+# gzip responses above 1 KB; inflate gzip request bodies (Content-Encoding: gzip)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+app.add_middleware(GzipRequestMiddleware)
 
 DB_FILE = "agents_db.json"
 CMD_FILE = "commands_db.json"
+LONG_POLL_MAX_WAIT = 30  # seconds
+
+# Heartbeat pacing hints (next_interval in sync/update responses)
+DEFAULT_AGENT_INTERVAL = 30   # assumed when the agent doesn't report its interval
+MIN_AGENT_INTERVAL = 2
+MAX_AGENT_INTERVAL = 300
+CRITICAL_METRICS = {"cpu_usage": 90, "ram_usage": 90, "disk_usage": 95}
+
+# Agent records live behind a pluggable store (SQLite/WAL by default).
+# The first start imports the legacy agents_db.json once.
+agent_store = open_agent_store()
+migrate_json_agents(agent_store, DB_FILE)
+
+# One bounded writer thread for request-path writes (command queue inserts/acks).
+persistence = PersistenceQueue()
+
+# SYS_AI_STATE_BACKEND=redis keeps registry, command queues, presence and fleet
+# jobs in Redis so several workers/nodes can serve the same fleet.
+STATE_BACKEND = os.environ.get("SYS_AI_STATE_BACKEND", "local").lower()
+
+if STATE_BACKEND == "redis":
+    from backend import shared_state
+    redis_client = shared_state.connect()
+    registry = shared_state.RedisAgentRegistry(redis_client, agent_store)
+    command_queue = shared_state.RedisCommandQueue(redis_client)
+    command_queue.start()
+    presence = shared_state.RedisPresence(redis_client)
+    fleet_jobs = shared_state.RedisFleetJobs(redis_client)
+    # Live output chunks of running commands, readable from every worker.
+    command_outputs = shared_state.RedisCommandOutputs(redis_client)
+elif STATE_BACKEND == "local":
+    # Requests are served from the in-memory registry; the store is only
+    # written in batches by the registry's write-behind thread.
+    registry = AgentRegistry(agent_store)
+    # Per-agent command queues with leases/acks (replaces commands_db.json).
+    command_queue = CommandQueue(writer=persistence)
+    # Online/offline tracking ordered by last_seen (no full scans per listing).
+    presence = PresenceTracker()
+    # Bulk command jobs (fan-out + aggregated results).
+    fleet_jobs = FleetJobs()
+    # Live output chunks of running commands (in memory).
+    command_outputs = CommandOutputs()
+else:
+    raise ValueError(f"Unknown state backend: {STATE_BACKEND}")
+
+registry.start()
+command_queue.migrate_json(CMD_FILE)
+persistence.start()
+presence.load(registry.all())
+presence.start()
+
+# Per-agent CPU/RAM/disk history with 1m / 1h rollups.
+metrics_history = MetricsHistory()
+metrics_history.start()
+
+# Stored command results (written off the request thread).
+command_results = CommandResults()
+command_results.start()
+
+# Heartbeats/results are refused with 429 + Retry-After while any write-behind
+# backlog is over its high-water mark, instead of buffering without bound.
+load_gate = LoadGate()
+load_gate.add("persistence queue", persistence.depth, int(persistence.maxsize * persistence.high_water))
+load_gate.add("agent registry", registry.pending_writes, 50000)
+load_gate.add("metrics history", metrics_history.pending, 200000)
+load_gate.add("command results", command_results.pending, 20000)
+
+async def state_call(fn, *args):
+    """
+    Call into the shared state. In redis mode every call is a network round
+    trip on the sync client, so it runs on a worker thread instead of
+    blocking the event loop; the in-process structures are called directly.
+    """
+    if STATE_BACKEND == "redis":
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+@app.exception_handler(Backpressure)
+async def backpressure_handler(request: Request, exc: Backpressure):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": f"Backend busy ({exc.reason}), retry later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 # -------------------------------
-# Helpers
+# Helpers: cursors, projection, ETags
 # -------------------------------
-def load_json(path):
-    if not os.path.exists(path):
-        return {}
+def encode_cursor(agent_id):
+    return base64.urlsafe_b64encode(json.dumps({"after": agent_id}).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
     try:
-        with open(path, "r") as f:
-            return json.load(f)
-    except:
-        return {}
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded))["after"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields):
+    if not fields:
+        return None
+    return {f.strip() for f in fields.split(",") if f.strip()}
+
+def project(record, wanted):
+    if wanted is None:
+        return record
+    return {k: v for k, v in record.items() if k in wanted}
 
-def save_json(path, data):
-    with open(path, "w") as f:
-        json.dump(data, f, indent=4)
+def etag_response(request: Request, payload):
+    """
+    Serialize once, tag with a content hash, and answer 304 when the client
+    already holds that version (If-None-Match).
+    """
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 # -------------------------------
 # Models
@@ -37,95 +164,504 @@ class AgentUpdate(BaseModel):
     ip_address: str
     metrics: dict
     device_info: dict
+    interval: Optional[float] = None   # agent's configured heartbeat interval
+
+class AgentSync(BaseModel):
+    """
+    Heartbeat for /api/agent/sync. Static inventory (hostname, username, os,
+    ip_address, device_info) is only sent when its hash changes; otherwise the
+    agent sends just metrics + inventory_hash and the stored values are kept.
+    """
+    agent_id: str
+    metrics: dict
+    inventory_hash: Optional[str] = None
+    hostname: Optional[str] = None
+    username: Optional[str] = None
+    os: Optional[str] = None
+    ip_address: Optional[str] = None
+    device_info: Optional[dict] = None
+    interval: Optional[float] = None
+    running: Optional[List[str]] = None   # command ids queued or running on the agent
+
+class FleetSelector(BaseModel):
+    os: Optional[str] = None                 # OS prefix, e.g. "Windows-11"
+    hostname_pattern: Optional[str] = None   # glob, e.g. "INL-FIN-*"
+    online: Optional[bool] = None
+
+class FleetCommand(BaseModel):
+    command: Dict[str, Any]
+    agent_ids: Optional[List[str]] = None
+    selector: Optional[FleetSelector] = None
+    all: bool = False   # required for a selector that doesn't narrow by os/hostname
+
+class CommandOutputChunk(BaseModel):
+    agent_id: str
+    command_id: str
+    seq: Optional[int] = None      # per command, from 0; None appends
+    output: str = Field(..., max_length=MAX_CHUNK_CHARS)
 
 class CommandResponse(BaseModel):
     agent_id: str
     command_id: str
-    output: str
+    output: str     # cut to head + tail by record_command_result
+    success: bool
+
+class BufferedResult(BaseModel):
+    command_id: str
+    output: str = ""
     success: bool
+    completed_at: Optional[float] = None
+
+class AgentBatch(BaseModel):
+    """Replay of samples/results an agent buffered while it was offline."""
+    agent_id: str
+    metrics: List[dict] = []          # each with "timestamp"
+    results: List[BufferedResult] = []
 
 # -------------------------------
 # Register / Update Agent
 # -------------------------------
+INVENTORY_FIELDS = ("hostname", "username", "os", "ip_address", "device_info")
+
+def record_heartbeat(data, wait: float = 0):
+    """
+    Merge an AgentUpdate / AgentSync into the stored record. Fields the agent
+    left out keep their stored value. Returns the inventory hash now on file.
+    `wait` is the long poll the agent asked for; with the pacing hint it
+    bounds when the next beat is due, which sets the agent's presence window.
+    """
+    record = dict(registry.get(data.agent_id) or {"agent_id": data.agent_id})
+    for field in INVENTORY_FIELDS:
+        value = getattr(data, field)
+        if value is not None:
+            record[field] = value
+    inventory_hash = getattr(data, "inventory_hash", None)
+    if inventory_hash and all(getattr(data, f) is not None for f in INVENTORY_FIELDS):
+        record["inventory_hash"] = inventory_hash
+    elif inventory_hash is None:
+        # full update from an agent that doesn't hash its inventory
+        record.pop("inventory_hash", None)
+    record["metrics"] = data.metrics
+    record["last_seen"] = time.time()
+    # pending commands only ever shorten the hint, so this is an upper bound
+    record["heartbeat_interval"] = max(next_interval(data, False), wait, data.interval or 0)
+    registry.put(data.agent_id, record)
+    presence.touch(data.agent_id, record["last_seen"], record["heartbeat_interval"])
+    metrics_history.record(data.agent_id, record["last_seen"], data.metrics)
+    return record.get("inventory_hash")
+
 @app.post("/api/agent/update")
-def update_agent_info(data: AgentUpdate):
-    db = load_json(DB_FILE)
-    db[data.agent_id] = {
-        "agent_id": data.agent_id,
-        "hostname": data.hostname,
-        "username": data.username,
-        "os": data.os,
-        "ip_address": data.ip_address,
-        "metrics": data.metrics,
-        "device_info": data.device_info,
-        "last_seen": time.time()
-    }
-    save_json(DB_FILE, db)
-    return {"status": "ok", "message": "agent info updated"}
+async def update_agent_info(data: AgentUpdate):
+    load_gate.check()
+    has_commands = await state_call(update_heartbeat, data)
+    return {"status": "ok", "message": "agent info updated",
+            "next_interval": next_interval(data, has_commands)}
+
+def update_heartbeat(data):
+    record_heartbeat(data)
+    return command_queue.pending_count(data.agent_id) > 0
+
+def next_interval(data, has_commands):
+    """
+    Server-side pacing: agents with work waiting or critical metrics beat
+    faster; the whole fleet slows down as the write backlogs fill up.
+    """
+    interval = data.interval or DEFAULT_AGENT_INTERVAL
+    if has_commands:
+        interval = MIN_AGENT_INTERVAL
+    elif has_critical_metrics(data.metrics):
+        interval = interval / 2
+    load = load_gate.load()
+    if load > 0.5:
+        interval *= 1 + 4 * (load - 0.5)
+    return round(min(max(interval, MIN_AGENT_INTERVAL), MAX_AGENT_INTERVAL), 1)
+
+def has_critical_metrics(metrics):
+    for field, limit in CRITICAL_METRICS.items():
+        try:
+            if float(metrics.get(field) or 0) >= limit:
+                return True
+        except (TypeError, ValueError):
+            pass
+    return False
+
+# -------------------------------
+# Heartbeat + command poll in one round trip
+# -------------------------------
+@app.post("/api/agent/sync")
+async def sync_agent(data: AgentSync, wait: float = 0):
+    """
+    Records the heartbeat and returns the agent's pending commands.
+    With ?wait=N the response is held (long poll) until a command arrives or
+    N seconds pass, so an agent can use its beat interval as the wait.
+    The stored inventory_hash is echoed back; when it differs from the agent's
+    own hash the agent resends its full inventory on the next beat.
+    next_interval tells the agent when to beat again (see next_interval()).
+    `running` (command ids the agent still has queued or running) renews
+    their leases, so long commands aren't redelivered while they run.
+    Answers 429 + Retry-After while the backend is shedding load.
+    """
+    load_gate.check()
+    wait = max(0.0, min(wait, LONG_POLL_MAX_WAIT))
+    inventory_hash = await state_call(record_heartbeat, data, wait)
+    if data.running:
+        # still working on them: keep their leases from expiring into redeliveries
+        await state_call(command_queue.extend, data.agent_id, data.running[:256])
+    if wait:
+        commands = await command_queue.lease_wait(data.agent_id, wait)
+    else:
+        commands = await state_call(command_queue.lease, data.agent_id)
+    has_commands = bool(commands) or await state_call(command_queue.pending_count, data.agent_id) > 0
+    return {"status": "ok", "commands": commands, "inventory_hash": inventory_hash,
+            "next_interval": next_interval(data, has_commands)}
 
 # -------------------------------
 # Get pending commands for agent
 # -------------------------------
 @app.get("/api/agent/commands/{agent_id}")
-def fetch_commands(agent_id: str):
-    cmds = load_json(CMD_FILE)
-    if agent_id not in cmds:
-        return {"commands": []}
-    pending = cmds[agent_id]
-    cmds[agent_id] = []  # clear after sending
-    save_json(CMD_FILE, cmds)
-    return {"commands": pending}
+async def fetch_commands(agent_id: str, wait: float = 0):
+    """
+    ?wait=N turns this into a long poll: the request is held until a command
+    is queued for the agent or N seconds (max LONG_POLL_MAX_WAIT) pass.
+    Commands stay leased until acked through /api/agent/command_response.
+    """
+    wait = max(0.0, min(wait, LONG_POLL_MAX_WAIT))
+    if wait:
+        return {"commands": await command_queue.lease_wait(agent_id, wait)}
+    return {"commands": await state_call(command_queue.lease, agent_id)}
 
 # -------------------------------
 # Receive Command Response from Agent
 # -------------------------------
 @app.post("/api/agent/command_response")
-def receive_command_response(resp: CommandResponse):
-    print(f"[COMMAND RESPONSE] {resp.agent_id} | CMD: {resp.command_id}")
-    print("SUCCESS:", resp.success)
-    print("OUTPUT:")
-    print(resp.output)
-    print("------------------------------------")
-    return {"status": "received"}
+async def receive_command_response(resp: CommandResponse):
+    load_gate.check()
+    entry = await state_call(record_command_result, resp.agent_id, resp.command_id, resp.success, resp.output)
+    return {"status": "received", "acked": entry is not None}
+
+def record_command_result(agent_id, command_id, success, output, completed_at=None, entry=None):
+    """
+    Ack the command, attach the result to its fleet job and store it.
+    Pass `entry` when the command already left the queue (cancelled, dropped).
+    """
+    output = cap_result(output)
+    if entry is None:
+        entry = command_queue.ack(agent_id, command_id)
+    fleet_jobs.record_result(command_id, agent_id, success, output)
+    command_results.record(
+        command_id, agent_id, success, output,
+        command=entry["command"] if entry else None,
+        enqueued_at=entry["enqueued_at"] if entry else None,
+        delivered_at=entry.get("leased_at") if entry else None,
+        completed_at=completed_at,
+    )
+    command_outputs.finish(command_id)
+    return entry
+
+def record_undelivered(agent_id, entry):
+    # the queue gave up on it: resolve its result and fleet job instead of leaving them pending
+    record_command_result(agent_id, entry["command"]["id"], False,
+                          f"[undelivered after {entry['attempts']} attempts]", entry=entry)
+
+command_queue.on_drop = record_undelivered
+
+# -------------------------------
+# Live output while a command runs
+# -------------------------------
+@app.post("/api/agent/command_output")
+async def receive_command_output(chunk: CommandOutputChunk):
+    stored = await state_call(record_output_chunk, chunk)
+    return {"status": "ok" if stored else "ignored"}
+
+def record_output_chunk(chunk: CommandOutputChunk):
+    # output proves the command is still running on the agent
+    command_queue.extend(chunk.agent_id, [chunk.command_id])
+    return command_outputs.append(chunk.command_id, chunk.agent_id, chunk.output, chunk.seq)
+
+@app.get("/api/commands/{command_id}/output")
+async def get_command_output(command_id: str, after_seq: int = -1):
+    """
+    Output streamed so far. Tail it by passing the previous response's
+    last_seq as ?after_seq; done=true once the final result arrived.
+    """
+    out = await state_call(command_outputs.get, command_id, after_seq)
+    if out is None:
+        raise HTTPException(status_code=404, detail="No output for this command")
+    return out
+
+# -------------------------------
+# Batch replay from the agent's offline buffer
+# -------------------------------
+@app.post("/api/agent/batch")
+async def ingest_batch(request: Request):
+    """
+    Body: AgentBatch JSON, usually gzip-compressed (Content-Encoding: gzip,
+    inflated by GzipRequestMiddleware, up to MAX_BODY_BYTES).
+    Metrics samples go to the history with their original timestamps;
+    results are handled like /api/agent/command_response.
+    """
+    load_gate.check()
+    body = await request.body()
+    if len(body) > MAX_BODY_BYTES:
+        raise HTTPException(status_code=413, detail="Batch too large")
+    try:
+        batch = AgentBatch(**json.loads(body))
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    metrics_history.record_many(batch.agent_id, batch.metrics)
+    acked = await state_call(record_batch_results, batch)
+    return {"status": "ok", "metrics": len(batch.metrics), "results": len(batch.results), "acked": acked}
+
+def record_batch_results(batch):
+    acked = 0
+    for result in batch.results:
+        entry = record_command_result(batch.agent_id, result.command_id, result.success,
+                                      result.output, result.completed_at)
+        acked += entry is not None
+    return acked
+
+# -------------------------------
+# Command results
+# -------------------------------
+@app.get("/api/commands/results")
+async def list_command_results(
+    agent_id: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = 50,
+):
+    """
+    Newest first, metadata + preview only. Poll with since=<newest completed_at
+    already seen> to get only new results.
+    """
+    results = await asyncio.to_thread(command_results.query, agent_id, since, until, limit)
+    return {"results": results}
+
+@app.get("/api/commands/{command_id}/result")
+async def get_command_result(command_id: str):
+    result = await asyncio.to_thread(command_results.get, command_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return result
 
 # -------------------------------
 # Admin -> queue command for agent
 # -------------------------------
 @app.post("/api/agent/send/{agent_id}")
-def send_command(agent_id: str, command: Dict[str, Any]):
-    cmds = load_json(CMD_FILE)
-    if agent_id not in cmds:
-        cmds[agent_id] = []
-    cmds[agent_id].append(command)
-    save_json(CMD_FILE, cmds)
-    return {"status": "queued", "command": command}
+async def send_command(agent_id: str, command: Dict[str, Any]):
+    # optional "dedup_key": repeats collapse into the still-pending command
+    queued, duplicate = await state_call(command_queue.enqueue, agent_id, command)
+    return {"status": "duplicate" if duplicate else "queued", "command": queued}
+
+@app.post("/api/agent/{agent_id}/commands/{command_id}/cancel")
+async def cancel_command(agent_id: str, command_id: str):
+    """
+    A command still waiting in the queue is dropped; one already handed out
+    is cancelled on the agent (its process is killed, the result says so).
+    """
+    return await state_call(cancel_or_forward, agent_id, command_id)
+
+def cancel_or_forward(agent_id, command_id):
+    entry = command_queue.cancel_pending(agent_id, command_id)
+    if entry is not None:
+        record_command_result(agent_id, command_id, False, "[cancelled before delivery]", entry=entry)
+        return {"status": "cancelled"}
+    queued, _ = command_queue.enqueue(agent_id, {"type": "cancel", "target": command_id,
+                                                 "dedup_key": f"cancel:{command_id}"})
+    return {"status": "cancel_sent", "command": queued}
+
+# -------------------------------
+# Admin -> queue one command for many agents
+# -------------------------------
+@app.post("/api/fleet/commands")
+async def send_fleet_command(req: FleetCommand):
+    """
+    Targets = agent_ids + every agent matching selector (os prefix,
+    hostname glob, online state). A selector without os or hostname_pattern
+    matches the whole fleet and is refused unless "all": true is sent.
+    All commands are queued in one transaction; poll /api/fleet/jobs/{job_id}
+    for progress.
+    """
+    return await state_call(queue_fleet_command, req)
+
+def queue_fleet_command(req: FleetCommand):
+    selector = req.selector
+    if selector is not None and not (selector.os or selector.hostname_pattern) and not req.all:
+        raise HTTPException(status_code=400,
+                            detail="Selector matches the whole fleet; narrow it or send \"all\": true")
+    if selector is None and req.all:
+        selector = FleetSelector()
+    targets = set(req.agent_ids or [])
+    if selector is not None:
+        targets |= select_fleet(selector)
+    if not targets:
+        raise HTTPException(status_code=400, detail="No agents matched")
+
+    job_id = fleet_jobs.new_job_id()
+    items = []
+    for n, agent_id in enumerate(sorted(targets)):
+        command = dict(req.command, id=f"{job_id}-{n}", job_id=job_id)
+        items.append((agent_id, command))
+    queued = command_queue.enqueue_many(items)
+
+    # a dedup_key may have collapsed into an already-pending command
+    command_ids = {agent_id: cmd["id"] for (agent_id, _), (cmd, _) in zip(items, queued)}
+    fleet_jobs.create(job_id, req.command, command_ids)
+    return {"status": "queued", "job_id": job_id, "targets": len(command_ids),
+            "duplicates": sum(1 for _, dup in queued if dup)}
+
+def select_fleet(selector: FleetSelector):
+    pattern = selector.hostname_pattern
+    prefix = None
+    if pattern:
+        # literal part before the first wildcard narrows the index lookup
+        prefix = pattern.split("*")[0].split("?")[0].split("[")[0]
+    ids = select_agent_ids(selector.online, selector.os, prefix or None)
+    if pattern:
+        pattern = pattern.lower()
+        ids = [i for i, info in zip(ids, registry.get_many(ids))
+               if fnmatch.fnmatchcase(str((info or {}).get("hostname", "")).lower(), pattern)]
+    return set(ids)
+
+@app.get("/api/fleet/jobs")
+async def list_fleet_jobs(limit: int = 20):
+    return {"jobs": await state_call(fleet_jobs.recent, limit)}
+
+@app.get("/api/fleet/jobs/{job_id}")
+async def fleet_job_status(job_id: str, include_results: bool = False):
+    job = await state_call(fleet_jobs.summary, job_id, include_results)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 # -------------------------------
 # List agents
 # -------------------------------
 @app.get("/api/agent/list")
-def list_agents():
-    db = load_json(DB_FILE)
+async def list_agents(
+    request: Request,
+    online: Optional[bool] = None,
+    os: Optional[str] = None,
+    hostname_prefix: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 0,
+    fields: Optional[str] = None,
+):
+    """
+    Filters: online=true|false, os=<prefix, e.g. Windows>, hostname_prefix=<prefix>.
+    Paging: limit=N, then pass the returned next_cursor as cursor=.
+    Projection: fields=agent_id,hostname,online
+    Sends an ETag; If-None-Match with an unchanged listing returns 304.
+    """
+    after = decode_cursor(cursor)
+    wanted = parse_fields(fields)
+    devices = await state_call(list_devices, online, os, hostname_prefix, after, limit)
+    next_cursor = None
+    if limit and len(devices) == limit:
+        next_cursor = encode_cursor(devices[-1]["agent_id"])
+    return etag_response(request, {"devices": [project(d, wanted) for d in devices],
+                                   "next_cursor": next_cursor})
+
+def list_devices(online, os, hostname_prefix, after, limit):
+    # one batched read for the records and one for presence, not two per agent
+    ids = select_agent_ids(online, os, hostname_prefix, after, limit)
     devices = []
-    for agent_id, info in db.items():
-        last_seen = info.get("last_seen", 0)
-        online = (time.time() - last_seen) < 30  # online if heartbeat < 30 sec
+    for agent_id, info, is_online in zip(ids, registry.get_many(ids), presence.online_many(ids)):
+        if info is None:
+            continue
         devices.append({
             "agent_id": agent_id,
             "hostname": info.get("hostname"),
             "username": info.get("username"),
             "ip_address": info.get("ip_address"),
             "os": info.get("os"),
-            "online": online
+            "online": is_online
         })
-    return {"devices": devices}
+    return devices
+
+def select_agent_ids(online=None, os=None, hostname_prefix=None, after=None, limit=0):
+    """Agent ids matching the filters, in agent_id order, using the in-memory indexes."""
+    if online is None and not os and not hostname_prefix:
+        return registry.page_ids(after, limit)
+
+    candidates = None
+    if online is True:
+        candidates = set(presence.online_agents())
+    if os:
+        matched = registry.find_prefix("os", os)
+        candidates = matched if candidates is None else candidates & matched
+    if hostname_prefix:
+        matched = registry.find_prefix("hostname", hostname_prefix)
+        candidates = matched if candidates is None else candidates & matched
+    if candidates is None:
+        candidates = set(registry.page_ids())
+    if online is False:
+        candidates -= set(presence.online_agents())
+
+    ids = sorted(i for i in candidates if not after or i > after)
+    return ids[:limit] if limit else ids
+
+# -------------------------------
+# Presence
+# -------------------------------
+@app.get("/api/agent/presence/online")
+async def online_agents():
+    ids = await state_call(presence.online_agents)
+    return {"count": len(ids), "agents": ids}
+
+@app.get("/api/agent/presence/offline")
+async def offline_agents(minutes: float = 5, limit: int = 0):
+    """Agents with no heartbeat for more than N minutes, longest-silent first."""
+    agents = await state_call(presence.offline_for, minutes * 60, limit)
+    return {"count": len(agents), "agents": agents}
+
+@app.get("/api/agent/presence/events")
+async def presence_events(since: int = 0):
+    """Online/offline transitions after event number `since`."""
+    return {"events": await state_call(presence.events_since, since)}
 
 # -------------------------------
 # Full agent info
 # -------------------------------
 @app.get("/api/agent/info/{agent_id}")
-def full_agent_info(agent_id: str):
-    db = load_json(DB_FILE)
-    if agent_id not in db:
+async def full_agent_info(agent_id: str, request: Request, fields: Optional[str] = None):
+    """fields=username,hostname,metrics limits the response; ETag/If-None-Match supported."""
+    info = await state_call(registry.get, agent_id)
+    if info is None:
         raise HTTPException(status_code=404, detail="Agent not found")
-    return db[agent_id]
+    return etag_response(request, project(info, parse_fields(fields)))
+
+# -------------------------------
+# Metrics history
+# -------------------------------
+@app.get("/api/agent/metrics/history")
+async def metrics_history_range(
+    agent_id: List[str] = Query(...),
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    resolution: str = "auto",
+):
+    """
+    ?agent_id=A&agent_id=B&start=<epoch>&end=<epoch>&resolution=raw|1m|1h|auto
+    Defaults to the last hour.
+    """
+    end = end or time.time()
+    start = start or end - 3600
+    try:
+        series = await asyncio.to_thread(metrics_history.query, agent_id, start, end, resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if resolution == "auto":
+        resolution = metrics_history.pick_resolution(start, end)
+    return {"start": start, "end": end, "resolution": resolution, "series": series}
+
+@app.on_event("shutdown")
+def close_stores():
+    command_results.stop()
+    presence.stop()
+    metrics_history.stop()
+    registry.stop()
+    agent_store.close()
+    persistence.stop()
+    command_queue.close()
@@ -0,0 +1,242 @@
+# backend/metrics_history.py
+"""
+Per-agent CPU / RAM / disk history.
+
+Heartbeats only append to an in-memory buffer; a background thread writes the
+buffer to SQLite in one transaction and folds it into 1-minute and 1-hour
+rollups (count/sum/min/max per bucket). Each resolution has its own retention:
+
+    raw  -> RAW_RETENTION      (short window, full detail)
+    1m   -> MINUTE_RETENTION
+    1h   -> HOUR_RETENTION
+"""
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from backend.agent_store import AGENT_DB_FILE
+
+FIELDS = ("cpu_usage", "ram_usage", "disk_usage")
+
+RESOLUTIONS = {"1m": 60, "1h": 3600}
+RAW_RETENTION = 6 * 3600            # seconds
+MINUTE_RETENTION = 7 * 86400
+HOUR_RETENTION = 90 * 86400
+
+FLUSH_INTERVAL = 5.0                # seconds
+PRUNE_INTERVAL = 300.0
+
+
+# NULL-tolerant merge of a new sample into an existing rollup bucket
+_ROLLUP_MERGE = ", ".join(
+    f"{p}_n = {p}_n + excluded.{p}_n, "
+    f"{p}_sum = CASE WHEN excluded.{p}_sum IS NULL THEN {p}_sum ELSE IFNULL({p}_sum, 0) + excluded.{p}_sum END, "
+    f"{p}_min = IFNULL(MIN({p}_min, excluded.{p}_min), IFNULL({p}_min, excluded.{p}_min)), "
+    f"{p}_max = IFNULL(MAX({p}_max, excluded.{p}_max), IFNULL({p}_max, excluded.{p}_max))"
+    for p in ("cpu", "ram", "disk")
+)
+
+
+def _num(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class MetricsHistory:
+    def __init__(self, path: str = AGENT_DB_FILE, flush_interval: float = FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()        # guards the buffer
+        self._db_lock = threading.Lock()     # guards the connection
+        self._buffer: List[tuple] = []
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_prune = 0.0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS metric_samples (
+                agent_id   TEXT NOT NULL,
+                ts         REAL NOT NULL,
+                cpu_usage  REAL,
+                ram_usage  REAL,
+                disk_usage REAL,
+                PRIMARY KEY (agent_id, ts)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_metric_samples_ts ON metric_samples(ts)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS metric_rollups (
+                agent_id   TEXT NOT NULL,
+                resolution INTEGER NOT NULL,
+                bucket     INTEGER NOT NULL,
+                n          INTEGER NOT NULL,
+                cpu_n INTEGER, cpu_sum REAL, cpu_min REAL, cpu_max REAL,
+                ram_n INTEGER, ram_sum REAL, ram_min REAL, ram_max REAL,
+                disk_n INTEGER, disk_sum REAL, disk_min REAL, disk_max REAL,
+                PRIMARY KEY (agent_id, resolution, bucket)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_metric_rollups_bucket ON metric_rollups(resolution, bucket)")
+
+    # -------------------------------
+    # Lifecycle
+    # -------------------------------
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name="metrics-history-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+    def _flush_loop(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.time() - self._last_prune > PRUNE_INTERVAL:
+                    self.prune()
+            except Exception as e:
+                print("[ERROR] metrics history flush failed:", e)
+
+    # -------------------------------
+    # Writes
+    # -------------------------------
+    def record(self, agent_id: str, ts: float, metrics: dict):
+        """Buffer one sample. Never touches disk."""
+        values = tuple(_num(metrics.get(f)) for f in FIELDS)
+        if all(v is None for v in values):
+            return
+        with self._lock:
+            self._buffer.append((agent_id, ts) + values)
+
+    def record_many(self, agent_id: str, samples: Iterable[dict]):
+        """Buffer several samples, each with its own "timestamp"."""
+        for sample in samples:
+            ts = _num(sample.get("timestamp"))
+            if ts is not None:
+                self.record(agent_id, ts, sample)
+
+    def pending(self) -> int:
+        """Buffered samples not yet written."""
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self) -> int:
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+
+        rollup_rows = []
+        for resolution in RESOLUTIONS.values():
+            for agent_id, ts, cpu, ram, disk in batch:
+                rollup_rows.append((
+                    agent_id, resolution, int(ts // resolution) * resolution,
+                    int(cpu is not None), cpu, cpu, cpu,
+                    int(ram is not None), ram, ram, ram,
+                    int(disk is not None), disk, disk, disk,
+                ))
+
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO metric_samples (agent_id, ts, cpu_usage, ram_usage, disk_usage) "
+                    "VALUES (?, ?, ?, ?, ?)", batch)
+                self._conn.executemany("""
+                    INSERT INTO metric_rollups (agent_id, resolution, bucket, n,
+                        cpu_n, cpu_sum, cpu_min, cpu_max, ram_n, ram_sum, ram_min, ram_max,
+                        disk_n, disk_sum, disk_min, disk_max)
+                    VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(agent_id, resolution, bucket) DO UPDATE SET
+                        n = n + 1, """ + _ROLLUP_MERGE + """
+                """, rollup_rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                with self._lock:
+                    self._buffer[:0] = batch
+                raise
+        return len(batch)
+
+    def prune(self, now: Optional[float] = None):
+        """Apply the retention policy for every resolution."""
+        now = now or time.time()
+        with self._db_lock:
+            self._conn.execute("DELETE FROM metric_samples WHERE ts < ?", (now - RAW_RETENTION,))
+            self._conn.execute("DELETE FROM metric_rollups WHERE resolution = ? AND bucket < ?",
+                               (RESOLUTIONS["1m"], now - MINUTE_RETENTION))
+            self._conn.execute("DELETE FROM metric_rollups WHERE resolution = ? AND bucket < ?",
+                               (RESOLUTIONS["1h"], now - HOUR_RETENTION))
+        self._last_prune = now
+
+    # -------------------------------
+    # Reads
+    # -------------------------------
+    @staticmethod
+    def pick_resolution(start: float, end: float) -> str:
+        span = end - start
+        if span <= 2 * 3600:
+            return "raw"
+        if span <= 3 * 86400:
+            return "1m"
+        return "1h"
+
+    def query(self, agent_ids: List[str], start: float, end: float,
+              resolution: str = "auto") -> Dict[str, List[dict]]:
+        """
+        Samples for each agent in [start, end], oldest first.
+        resolution: raw | 1m | 1h | auto (picked from the range length).
+        Rollup points carry *_avg / *_min / *_max per metric.
+        """
+        if resolution == "auto":
+            resolution = self.pick_resolution(start, end)
+        if resolution != "raw" and resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+
+        out: Dict[str, List[dict]] = {agent_id: [] for agent_id in agent_ids}
+        if not agent_ids:
+            return out
+        marks = ",".join("?" * len(agent_ids))
+
+        with self._db_lock:
+            if resolution == "raw":
+                rows = self._conn.execute(
+                    f"SELECT agent_id, ts, cpu_usage, ram_usage, disk_usage FROM metric_samples "
+                    f"WHERE agent_id IN ({marks}) AND ts BETWEEN ? AND ? ORDER BY agent_id, ts",
+                    (*agent_ids, start, end)).fetchall()
+            else:
+                size = RESOLUTIONS[resolution]
+                rows = self._conn.execute(
+                    f"SELECT agent_id, bucket, n, cpu_n, cpu_sum, cpu_min, cpu_max, ram_n, ram_sum, ram_min, ram_max, "
+                    f"disk_n, disk_sum, disk_min, disk_max FROM metric_rollups "
+                    f"WHERE resolution = ? AND agent_id IN ({marks}) AND bucket BETWEEN ? AND ? "
+                    f"ORDER BY agent_id, bucket",
+                    (size, *agent_ids, int(start // size) * size, end)).fetchall()
+
+        # samples still in the write buffer are only visible once flushed (<= FLUSH_INTERVAL)
+        for row in rows:
+            if resolution == "raw":
+                agent_id, ts, cpu, ram, disk = row
+                out[agent_id].append({"timestamp": ts, "cpu_usage": cpu, "ram_usage": ram, "disk_usage": disk})
+            else:
+                agent_id, bucket, n = row[:3]
+                point = {"timestamp": bucket, "samples": n}
+                for i, field in enumerate(FIELDS):
+                    count, total, lo, hi = row[3 + 4 * i: 7 + 4 * i]
+                    point[f"{field}_avg"] = round(total / count, 2) if count else None
+                    point[f"{field}_min"] = lo
+                    point[f"{field}_max"] = hi
+                out[agent_id].append(point)
+        return out
@@ -0,0 +1,109 @@
+# backend/persistence.py
+"""
+Bounded write queue + backpressure for the async backend.
+
+Request handlers never write to SQLite themselves: they hand small write jobs
+to a PersistenceQueue, which runs them in order on one worker thread. The queue
+is bounded; when it (or any other write-behind buffer) is over its high-water
+mark, heartbeat-style endpoints answer 429 with a Retry-After hint instead of
+letting memory and latency grow without limit.
+"""
+import queue
+import threading
+from typing import Callable, List, Optional
+
+WRITE_QUEUE_SIZE = 10000
+RETRY_AFTER_MIN = 2      # seconds
+RETRY_AFTER_MAX = 60
+
+
+class Backpressure(Exception):
+    """Raised when the backend is shedding load. Mapped to HTTP 429 + Retry-After."""
+
+    def __init__(self, retry_after: int, reason: str = "backend busy"):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def retry_after_for(load: float) -> int:
+    """Scale the Retry-After hint with how far over the high-water mark we are."""
+    return int(min(RETRY_AFTER_MAX, max(RETRY_AFTER_MIN, RETRY_AFTER_MIN * load * load)))
+
+
+class PersistenceQueue:
+    def __init__(self, maxsize: int = WRITE_QUEUE_SIZE, high_water: float = 0.8):
+        self.maxsize = maxsize
+        self.high_water = high_water
+        self._jobs: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=maxsize)
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="persistence-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Finish every queued job, then stop the worker."""
+        if self._thread:
+            self._jobs.put(None)
+            self._thread.join(timeout=30)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            fn, args = job
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"[ERROR] persistence job {getattr(fn, '__name__', fn)} failed:", e)
+
+    def depth(self) -> int:
+        return self._jobs.qsize()
+
+    def load(self) -> float:
+        """Queue fill relative to the high-water mark (>= 1.0 means shed load)."""
+        return self.depth() / (self.maxsize * self.high_water)
+
+    def check(self):
+        """Raise Backpressure if new work should be refused right now."""
+        load = self.load()
+        if load >= 1.0:
+            raise Backpressure(retry_after_for(load), "persistence queue full")
+
+    def submit(self, fn: Callable, *args, block: bool = False):
+        """
+        Queue fn(*args) for the writer thread. With block=False a full queue
+        raises Backpressure; block=True waits (for writes that must not be lost).
+        """
+        if self._thread is None:
+            fn(*args)   # not started (scripts / migrations): write inline
+            return
+        try:
+            self._jobs.put((fn, args), block=block)
+        except queue.Full:
+            raise Backpressure(RETRY_AFTER_MAX, "persistence queue full")
+
+
+class LoadGate:
+    """
+    Combines several pending-work gauges into one admission check.
+    Each gauge is (name, callable returning pending count, high-water mark).
+    """
+
+    def __init__(self):
+        self._gauges: List[tuple] = []
+
+    def add(self, name: str, pending: Callable[[], int], high_water: int):
+        self._gauges.append((name, pending, high_water))
+
+    def load(self) -> float:
+        return max((pending() / high_water for _, pending, high_water in self._gauges), default=0.0)
+
+    def check(self):
+        for name, pending, high_water in self._gauges:
+            load = pending() / high_water
+            if load >= 1.0:
+                raise Backpressure(retry_after_for(load), f"{name} backlog")
@@ -0,0 +1,179 @@
+# backend/presence.py
+"""
+Online/offline presence tracking.
+
+An agent stays online for two of its heartbeat cycles plus PRESENCE_GRACE
+after each beat (never less than ONLINE_WINDOW), so agents the backend paces
+slowly (next_interval) don't flap offline between beats.
+
+- _last_seen: OrderedDict of every agent in heartbeat order (a beat moves the
+              agent to the end, like an LRU) -> "offline for more than N
+              minutes" walks from the oldest end and stops at the first
+              recent agent.
+- _online:    online agents -> their expiry deadline; a heap of deadlines lets
+              the sweep pop expired agents in O(log n) per transition, and
+              online listings never look at offline agents.
+
+Transitions are recorded as numbered events and passed to listeners.
+"""
+import heapq
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional
+
+ONLINE_WINDOW = 30      # minimum seconds since the last heartbeat to count as online
+PRESENCE_GRACE = 15     # slack on top of two heartbeat cycles (request latency, jitter)
+SWEEP_INTERVAL = 2.0    # seconds between background sweeps
+EVENT_BACKLOG = 1000    # transition events kept for /api/agent/presence/events
+
+
+class PresenceTracker:
+    def __init__(self, online_window: float = ONLINE_WINDOW):
+        self.online_window = online_window
+        self._lock = threading.Lock()
+        self._last_seen: "OrderedDict[str, float]" = OrderedDict()
+        self._online: "OrderedDict[str, float]" = OrderedDict()   # agent_id -> deadline
+        self._expiry: List[tuple] = []                             # heap of (deadline, agent_id)
+        self._events = deque(maxlen=EVENT_BACKLOG)
+        self._event_seq = 0
+        self._listeners: List[Callable[[dict], None]] = []
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def window_for(self, interval: Optional[float]) -> float:
+        """Seconds an agent beating every `interval` seconds counts as online after a beat."""
+        if not interval:
+            return self.online_window
+        return max(self.online_window, 2 * float(interval) + PRESENCE_GRACE)
+
+    # -------------------------------
+    # Lifecycle
+    # -------------------------------
+    def load(self, records: Dict[str, dict], now: Optional[float] = None):
+        """Seed from stored agent records (no events are emitted)."""
+        now = now or time.time()
+        ordered = sorted(((r.get("last_seen") or 0, agent_id, r.get("heartbeat_interval"))
+                          for agent_id, r in records.items()))
+        with self._lock:
+            for last_seen, agent_id, interval in ordered:
+                self._last_seen[agent_id] = last_seen
+                deadline = last_seen + self.window_for(interval)
+                if deadline >= now:
+                    self._online[agent_id] = deadline
+                    heapq.heappush(self._expiry, (deadline, agent_id))
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._sweep_loop, name="presence-sweep", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _sweep_loop(self):
+        while not self._stopping.wait(SWEEP_INTERVAL):
+            try:
+                self.sweep()
+            except Exception as e:
+                print("[ERROR] presence sweep failed:", e)
+
+    def add_listener(self, callback: Callable[[dict], None]):
+        """callback(event) for every transition; event = {seq, agent_id, online, ts}."""
+        self._listeners.append(callback)
+
+    # -------------------------------
+    # Updates
+    # -------------------------------
+    def _emit_locked(self, agent_id, online, ts):
+        self._event_seq += 1
+        event = {"seq": self._event_seq, "agent_id": agent_id, "online": online, "ts": ts}
+        self._events.append(event)
+        return event
+
+    def _notify(self, events):
+        for event in events:
+            for callback in self._listeners:
+                try:
+                    callback(event)
+                except Exception as e:
+                    print("[ERROR] presence listener failed:", e)
+
+    def touch(self, agent_id: str, ts: Optional[float] = None, interval: Optional[float] = None):
+        """Record a heartbeat; `interval` is when the agent is expected to beat again."""
+        ts = ts or time.time()
+        deadline = ts + self.window_for(interval)
+        events = []
+        with self._lock:
+            self._last_seen.pop(agent_id, None)
+            self._last_seen[agent_id] = ts
+            was_online = self._online.pop(agent_id, None) is not None
+            self._online[agent_id] = deadline
+            heapq.heappush(self._expiry, (deadline, agent_id))
+            if not was_online:
+                events.append(self._emit_locked(agent_id, True, ts))
+        self._notify(events)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Mark agents whose heartbeat expired as offline. Returns the number of transitions."""
+        now = now or time.time()
+        events = []
+        with self._lock:
+            while self._expiry and self._expiry[0][0] < now:
+                deadline, agent_id = heapq.heappop(self._expiry)
+                # entries superseded by a later beat are just dropped
+                if self._online.get(agent_id) == deadline:
+                    del self._online[agent_id]
+                    events.append(self._emit_locked(agent_id, False, now))
+        self._notify(events)
+        return len(events)
+
+    # -------------------------------
+    # Queries
+    # -------------------------------
+    def is_online(self, agent_id: str) -> bool:
+        with self._lock:
+            deadline = self._online.get(agent_id)
+        return deadline is not None and deadline >= time.time()
+
+    def online_many(self, agent_ids: List[str]) -> List[bool]:
+        """is_online() for several agents at once, in order."""
+        now = time.time()
+        with self._lock:
+            return [self._online.get(i, 0) >= now for i in agent_ids]
+
+    def last_seen(self, agent_id: str) -> Optional[float]:
+        with self._lock:
+            return self._last_seen.get(agent_id)
+
+    def online_agents(self) -> List[str]:
+        """Online agent ids, most recent heartbeat last."""
+        self.sweep()
+        with self._lock:
+            return list(self._online)
+
+    def online_count(self) -> int:
+        self.sweep()
+        with self._lock:
+            return len(self._online)
+
+    def offline_for(self, seconds: float, limit: int = 0, now: Optional[float] = None) -> List[dict]:
+        """Agents with no heartbeat for more than `seconds`, longest-silent first."""
+        now = now or time.time()
+        cutoff = now - max(seconds, self.online_window)
+        out = []
+        with self._lock:
+            for agent_id, last_seen in self._last_seen.items():
+                if last_seen >= cutoff or (limit and len(out) >= limit):
+                    break
+                if self._online.get(agent_id, 0) >= now:
+                    continue   # slow-paced agent, still inside its window
+                out.append({"agent_id": agent_id, "last_seen": last_seen,
+                            "offline_for": round(now - last_seen, 1)})
+        return out
+
+    def events_since(self, seq: int = 0) -> List[dict]:
+        with self._lock:
+            return [e for e in self._events if e["seq"] > seq]
@@ -0,0 +1,654 @@
+# backend/shared_state.py
+"""
+Redis-backed shared state, so the backend can run with several uvicorn workers
+or on several nodes behind a load balancer.
+
+Enabled with SYS_AI_STATE_BACKEND=redis (SYS_AI_REDIS_URL, default
+redis://localhost:6379/0). Each class exposes the same methods as its
+in-process counterpart, so main.py does not care which one it talks to:
+
+    RedisAgentRegistry  <-> AgentRegistry
+    RedisCommandQueue   <-> CommandQueue
+    RedisPresence       <-> PresenceTracker
+    RedisFleetJobs      <-> FleetJobs
+    RedisCommandOutputs <-> CommandOutputs
+
+Multi-key updates (enqueue, lease, ack, registry put, presence sweep) run as
+Lua scripts, so they are atomic across workers. A command enqueued on one
+worker is published on a channel; every worker subscribes and wakes the
+long-polls parked on it for that agent.
+
+Per-agent queue keys share a {hash tag}, so the scripts also work on Redis
+Cluster. Requires the optional `redis` package.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+try:
+    import redis
+except ImportError:   # only needed when SYS_AI_STATE_BACKEND=redis
+    redis = None
+
+from backend.agent_registry import INDEXED_FIELDS
+from backend.agent_store import AgentStore
+from backend.command_output import MAX_STREAM_CHARS, TRUNCATION_MARKER, CommandOutputs
+from backend.command_queue import (
+    BaseCommandQueue, DELIVER_ONCE_TYPES, MAX_ATTEMPTS, VISIBILITY_TIMEOUT,
+)
+from backend.fleet_jobs import MAX_JOBS, OUTPUT_PREVIEW, FleetJobs, summarize
+from backend.presence import EVENT_BACKLOG, ONLINE_WINDOW, PresenceTracker
+
+REDIS_URL = os.environ.get("SYS_AI_REDIS_URL", "redis://localhost:6379/0")
+KEY_PREFIX = os.environ.get("SYS_AI_REDIS_PREFIX", "sysai")
+
+LEX_MAX = "\U0010ffff"   # sorts after any other character (for ZRANGEBYLEX prefix ranges)
+
+
+def connect(url: str = REDIS_URL):
+    if redis is None:
+        raise RuntimeError("SYS_AI_STATE_BACKEND=redis requires the 'redis' package (pip install redis)")
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+# -------------------------------
+# Agent registry
+# -------------------------------
+# KEYS: records hash, index-keys hash, ids zset, one index zset per field
+# ARGV: agent_id, record json, index-keys json, then one index key per field ("" = unset)
+_REGISTRY_PUT = """
+local old = redis.call('HGET', KEYS[2], ARGV[1])
+if old then
+  local keys = cjson.decode(old)
+  for i = 1, #keys do
+    if keys[i] ~= '' then redis.call('ZREM', KEYS[3 + i], keys[i] .. '\\0' .. ARGV[1]) end
+  end
+end
+for i = 4, #ARGV do
+  if ARGV[i] ~= '' then redis.call('ZADD', KEYS[i], 0, ARGV[i] .. '\\0' .. ARGV[1]) end
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+redis.call('ZADD', KEYS[3], 0, ARGV[1])
+"""
+
+
+class RedisAgentRegistry:
+    """AgentRegistry on Redis. Writes go straight to Redis, so there is no write-behind."""
+
+    def __init__(self, client, store: Optional[AgentStore] = None, prefix: str = KEY_PREFIX):
+        self.client = client
+        self.store = store
+        self._records_key = f"{prefix}:agents"
+        self._index_keys_key = f"{prefix}:agents:index_keys"
+        self._ids_key = f"{prefix}:agents:ids"
+        self._field_keys = {f: f"{prefix}:agents:idx:{f}" for f in INDEXED_FIELDS}
+        self._put_script = client.register_script(_REGISTRY_PUT)
+
+    def start(self):
+        """Seed Redis from the local store the first time the shared registry is used."""
+        if self.store is not None and not self.client.hlen(self._records_key):
+            for agent_id, record in self.store.all().items():
+                self.put(agent_id, record)
+
+    def stop(self):
+        pass
+
+    def flush(self) -> int:
+        return 0
+
+    def pending_writes(self) -> int:
+        return 0
+
+    def _index_key(self, value):
+        return str(value).lower() if value is not None else ""
+
+    def put(self, agent_id: str, record: Dict[str, Any]):
+        index_keys = [self._index_key(record.get(f)) for f in INDEXED_FIELDS]
+        self._put_script(
+            keys=[self._records_key, self._index_keys_key, self._ids_key]
+                 + [self._field_keys[f] for f in INDEXED_FIELDS],
+            args=[agent_id, json.dumps(record), json.dumps(index_keys)] + index_keys,
+        )
+
+    def get(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.hget(self._records_key, agent_id)
+        return json.loads(raw) if raw else None
+
+    def get_many(self, agent_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        if not agent_ids:
+            return []
+        return [json.loads(raw) if raw else None for raw in self.client.hmget(self._records_key, agent_ids)]
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        return {agent_id: json.loads(raw) for agent_id, raw in self.client.hgetall(self._records_key).items()}
+
+    def _ids_in_range(self, field, low, high) -> Set[str]:
+        members = self.client.zrangebylex(self._field_keys[field], low, high)
+        return {m.split("\0", 1)[1] for m in members}
+
+    def find(self, field: str, value) -> List[Dict[str, Any]]:
+        key = self._index_key(value)
+        ids = self._ids_in_range(field, f"[{key}\0", f"[{key}\0{LEX_MAX}")
+        if not ids:
+            return []
+        return [json.loads(raw) for raw in self.client.hmget(self._records_key, sorted(ids)) if raw]
+
+    def find_prefix(self, field: str, prefix: str) -> Set[str]:
+        prefix = prefix.lower()
+        return self._ids_in_range(field, f"[{prefix}", f"[{prefix}{LEX_MAX}")
+
+    def page_ids(self, after: Optional[str] = None, limit: int = 0) -> List[str]:
+        low = f"({after}" if after else "-"
+        if limit:
+            return self.client.zrangebylex(self._ids_key, low, "+", start=0, num=limit)
+        return self.client.zrangebylex(self._ids_key, low, "+")
+
+    def __len__(self):
+        return self.client.hlen(self._records_key)
+
+
+# -------------------------------
+# Command queue
+# -------------------------------
+# Entries are stored as JSON with the command kept as an encoded string, so
+# Lua never re-encodes the admin's payload.
+# KEYS (all per agent): entries hash, ready list, leased zset, dedup hash
+_ENQUEUE = """
+if ARGV[2] ~= '' then
+  local existing = redis.call('HGET', KEYS[4], ARGV[2])
+  if existing then
+    local e = redis.call('HGET', KEYS[1], existing)
+    if e then return e end
+  end
+end
+local e = redis.call('HGET', KEYS[1], ARGV[1])
+if e then return e end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+redis.call('RPUSH', KEYS[2], ARGV[1])
+if ARGV[2] ~= '' then redis.call('HSET', KEYS[4], ARGV[2], ARGV[1]) end
+redis.call('PUBLISH', ARGV[5], ARGV[4])
+return false
+"""
+
+_LEASE = """
+local now = tonumber(ARGV[1])
+local max_attempts = tonumber(ARGV[2])
+local once = cjson.decode(ARGV[3])
+
+local function forget(id, e)
+  redis.call('HDEL', KEYS[1], id)
+  if e.dedup_key ~= '' and redis.call('HGET', KEYS[4], e.dedup_key) == id then
+    redis.call('HDEL', KEYS[4], e.dedup_key)
+  end
+end
+
+-- expired leases go back to the front of the queue (or are dropped and returned)
+local dropped = {}
+local expired = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now)
+for i = #expired, 1, -1 do
+  local id = expired[i]
+  redis.call('ZREM', KEYS[3], id)
+  local raw = redis.call('HGET', KEYS[1], id)
+  if raw then
+    local e = cjson.decode(raw)
+    if e.attempts >= max_attempts then
+      forget(id, e)
+      table.insert(dropped, raw)
+    else
+      redis.call('LPUSH', KEYS[2], id)
+    end
+  end
+end
+
+local out = {}
+local ids = redis.call('LRANGE', KEYS[2], 0, -1)
+redis.call('DEL', KEYS[2])
+for _, id in ipairs(ids) do
+  local raw = redis.call('HGET', KEYS[1], id)
+  if raw then
+    local e = cjson.decode(raw)
+    e.attempts = e.attempts + 1
+    e.leased_at = now
+    table.insert(out, e.command)
+    if once[e.type] then
+      forget(id, e)
+    else
+      redis.call('ZADD', KEYS[3], now + e.visibility_timeout, id)
+      redis.call('HSET', KEYS[1], id, cjson.encode(e))
+    end
+  end
+end
+return {out, dropped}
+"""
+
+_ACK = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+if not raw then return false end
+local e = cjson.decode(raw)
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('LREM', KEYS[2], 0, ARGV[1])
+if e.dedup_key ~= '' and redis.call('HGET', KEYS[4], e.dedup_key) == ARGV[1] then
+  redis.call('HDEL', KEYS[4], e.dedup_key)
+end
+return raw
+"""
+
+
+# ARGV: now, then command ids. Pushes the lease deadline of each still-leased
+# command to now + its lease length (never earlier).
+_EXTEND = """
+local renewed = 0
+for i = 2, #ARGV do
+  local score = redis.call('ZSCORE', KEYS[3], ARGV[i])
+  local raw = score and redis.call('HGET', KEYS[1], ARGV[i])
+  if raw then
+    local deadline = tonumber(ARGV[1]) + cjson.decode(raw).visibility_timeout
+    if deadline > tonumber(score) then redis.call('ZADD', KEYS[3], deadline, ARGV[i]) end
+    renewed = renewed + 1
+  end
+end
+return renewed
+"""
+
+# Same as _ACK, but only while the command is still waiting (not leased).
+_CANCEL_PENDING = "if redis.call('ZSCORE', KEYS[3], ARGV[1]) then return false end\n" + _ACK
+
+
+class RedisCommandQueue(BaseCommandQueue):
+    """CommandQueue on Redis: same lease / ack / dedup semantics, shared by all workers."""
+
+    BLOCKING_LEASE = True
+
+    def __init__(self, client, visibility_timeout: float = VISIBILITY_TIMEOUT, prefix: str = KEY_PREFIX):
+        super().__init__()
+        self.client = client
+        self.visibility_timeout = visibility_timeout
+        self.prefix = prefix
+        self.channel = f"{prefix}:commands:notify"
+        self._enqueue_script = client.register_script(_ENQUEUE)
+        self._lease_script = client.register_script(_LEASE)
+        self._ack_script = client.register_script(_ACK)
+        self._cancel_script = client.register_script(_CANCEL_PENDING)
+        self._extend_script = client.register_script(_EXTEND)
+        self._deliver_once = json.dumps({t: True for t in DELIVER_ONCE_TYPES})
+        self._pubsub = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _keys(self, agent_id):
+        base = f"{self.prefix}:q:{{{agent_id}}}"
+        return [f"{base}:entries", f"{base}:ready", f"{base}:leased", f"{base}:dedup"]
+
+    # -------------------------------
+    # Cross-worker wake-ups
+    # -------------------------------
+    def start(self):
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(self.channel)
+        self._thread = threading.Thread(target=self._listen, name="command-queue-notify", daemon=True)
+        self._thread.start()
+
+    def _listen(self):
+        while self._pubsub is not None:
+            try:
+                message = self._pubsub.get_message(timeout=1.0)
+                if message and message["type"] == "message":
+                    self._notify({message["data"]})
+            except Exception as e:
+                if self._pubsub is None:
+                    break
+                print("[ERROR] command queue notify listener failed:", e)
+                time.sleep(1)
+
+    def close(self):
+        pubsub, self._pubsub = self._pubsub, None
+        if self._thread:
+            self._thread.join(timeout=5)
+        if pubsub is not None:
+            pubsub.close()
+
+    # -------------------------------
+    # Public API
+    # -------------------------------
+    def _decode_entry(self, raw):
+        entry = json.loads(raw)
+        entry["command"] = json.loads(entry["command"])
+        entry["dedup_key"] = entry["dedup_key"] or None
+        return entry
+
+    def enqueue_many(self, items: List[Tuple[str, Dict[str, Any]]]) -> List[Tuple[Dict[str, Any], bool]]:
+        """Queue several commands in one round trip (each enqueue is atomic)."""
+        now = time.time()
+        commands = []
+        pipe = self.client.pipeline(transaction=False)
+        for agent_id, command in items:
+            command = dict(command)
+            command.setdefault("id", str(uuid.uuid4()))
+            commands.append(command)
+            entry = {
+                "agent_id": agent_id,
+                "command": json.dumps(command),
+                "type": command.get("type") or "",
+                "dedup_key": command.get("dedup_key") or "",
+                "enqueued_at": now,
+                "attempts": 0,
+                "visibility_timeout": self.lease_seconds(command),
+            }
+            self._enqueue_script(
+                keys=self._keys(agent_id),
+                args=[command["id"], entry["dedup_key"], json.dumps(entry), agent_id, self.channel],
+                client=pipe,
+            )
+        results = []
+        for command, existing in zip(commands, pipe.execute()):
+            if existing:
+                results.append((self._decode_entry(existing)["command"], True))
+            else:
+                results.append((command, False))
+        return results
+
+    def lease(self, agent_id: str) -> List[Dict[str, Any]]:
+        commands, dropped = self._lease_script(
+            keys=self._keys(agent_id),
+            args=[time.time(), MAX_ATTEMPTS, self._deliver_once],
+        )
+        self._report_dropped(agent_id, [self._decode_entry(raw) for raw in dropped])
+        return [json.loads(c) for c in commands]
+
+    def ack(self, agent_id: str, command_id: str) -> Optional[Dict[str, Any]]:
+        raw = self._ack_script(keys=self._keys(agent_id), args=[command_id])
+        return self._decode_entry(raw) if raw else None
+
+    def extend(self, agent_id: str, command_ids: List[str]) -> int:
+        if not command_ids:
+            return 0
+        return self._extend_script(keys=self._keys(agent_id), args=[time.time()] + list(command_ids))
+
+    def cancel_pending(self, agent_id: str, command_id: str) -> Optional[Dict[str, Any]]:
+        raw = self._cancel_script(keys=self._keys(agent_id), args=[command_id])
+        return self._decode_entry(raw) if raw else None
+
+    def pending_count(self, agent_id: str) -> int:
+        keys = self._keys(agent_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.llen(keys[1])
+        pipe.zcard(keys[2])
+        return sum(pipe.execute())
+
+    def _migration_applied(self, name):
+        # SADD claims the migration, so only the first worker to start imports the file
+        return not self.client.sadd(f"{self.prefix}:migrations", name)
+
+    def _record_migration(self, name):
+        pass
+
+
+# -------------------------------
+# Presence
+# -------------------------------
+# KEYS: online zset (scored by expiry deadline). ARGV: now. Removes and returns
+# expired agents atomically, so each offline transition is reported by exactly one worker.
+_SWEEP = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[1], 'LIMIT', 0, 1000)
+for _, id in ipairs(ids) do redis.call('ZREM', KEYS[1], id) end
+return ids
+"""
+
+
+class RedisPresence(PresenceTracker):
+    """
+    PresenceTracker on Redis: last_seen and online sorted sets (the latter
+    scored by each agent's expiry deadline), plus a shared event log.
+    """
+
+    def __init__(self, client, online_window: float = ONLINE_WINDOW, prefix: str = KEY_PREFIX):
+        super().__init__(online_window)
+        self.client = client
+        self._last_seen_key = f"{prefix}:presence:last_seen"
+        self._online_key = f"{prefix}:presence:online"
+        self._events_key = f"{prefix}:presence:events"
+        self._seq_key = f"{prefix}:presence:seq"
+        self._sweep_script = client.register_script(_SWEEP)
+
+    def load(self, records: Dict[str, dict], now: Optional[float] = None):
+        now = now or time.time()
+        last_seen = {agent_id: r.get("last_seen") or 0 for agent_id, r in records.items()}
+        if not last_seen:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zadd(self._last_seen_key, last_seen, nx=True)
+        deadlines = {agent_id: last_seen[agent_id] + self.window_for(r.get("heartbeat_interval"))
+                     for agent_id, r in records.items()}
+        online = {agent_id: deadline for agent_id, deadline in deadlines.items() if deadline >= now}
+        if online:
+            pipe.zadd(self._online_key, online, nx=True)
+        pipe.execute()
+
+    def _emit(self, agent_id, online, ts):
+        event = {"seq": self.client.incr(self._seq_key), "agent_id": agent_id, "online": online, "ts": ts}
+        pipe = self.client.pipeline(transaction=False)
+        pipe.lpush(self._events_key, json.dumps(event))
+        pipe.ltrim(self._events_key, 0, EVENT_BACKLOG - 1)
+        pipe.execute()
+        return event
+
+    def touch(self, agent_id: str, ts: Optional[float] = None, interval: Optional[float] = None):
+        ts = ts or time.time()
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zadd(self._last_seen_key, {agent_id: ts})
+        pipe.zadd(self._online_key, {agent_id: ts + self.window_for(interval)})
+        _, added = pipe.execute()
+        if added:
+            self._notify([self._emit(agent_id, True, ts)])
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        now = now or time.time()
+        expired = self._sweep_script(keys=[self._online_key], args=[now])
+        self._notify([self._emit(agent_id, False, now) for agent_id in expired])
+        return len(expired)
+
+    def is_online(self, agent_id: str) -> bool:
+        deadline = self.client.zscore(self._online_key, agent_id)
+        return deadline is not None and deadline >= time.time()
+
+    def online_many(self, agent_ids: List[str]) -> List[bool]:
+        if not agent_ids:
+            return []
+        now = time.time()
+        return [d is not None and d >= now for d in self.client.zmscore(self._online_key, agent_ids)]
+
+    def last_seen(self, agent_id: str) -> Optional[float]:
+        return self.client.zscore(self._last_seen_key, agent_id)
+
+    def online_agents(self) -> List[str]:
+        self.sweep()
+        return self.client.zrange(self._online_key, 0, -1)
+
+    def online_count(self) -> int:
+        self.sweep()
+        return self.client.zcard(self._online_key)
+
+    def offline_for(self, seconds: float, limit: int = 0, now: Optional[float] = None) -> List[dict]:
+        now = now or time.time()
+        cutoff = now - max(seconds, self.online_window)
+        rows = self.client.zrangebyscore(self._last_seen_key, "-inf", f"({cutoff}", withscores=True,
+                                         start=0 if limit else None, num=limit or None)
+        if not rows:
+            return []
+        # slow-paced agents can still be inside their online window
+        deadlines = self.client.zmscore(self._online_key, [agent_id for agent_id, _ in rows])
+        return [{"agent_id": agent_id, "last_seen": last_seen, "offline_for": round(now - last_seen, 1)}
+                for (agent_id, last_seen), deadline in zip(rows, deadlines)
+                if deadline is None or deadline < now]
+
+    def events_since(self, seq: int = 0) -> List[dict]:
+        events = [json.loads(raw) for raw in self.client.lrange(self._events_key, 0, -1)]
+        return sorted((e for e in events if e["seq"] > seq), key=lambda e: e["seq"])
+
+
+# -------------------------------
+# Fleet jobs
+# -------------------------------
+class RedisFleetJobs(FleetJobs):
+    """FleetJobs on Redis, so a result posted to any worker lands on the job."""
+
+    def __init__(self, client, prefix: str = KEY_PREFIX):
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+        self._jobs_key = f"{prefix}:jobs"
+        self._by_command_key = f"{prefix}:jobs:by_command"
+
+    def _job_key(self, job_id):
+        return f"{self.prefix}:job:{job_id}"
+
+    def create(self, job_id: str, command: Dict[str, Any], targets: Dict[str, str]) -> Dict[str, Any]:
+        job = {"job_id": job_id, "created_at": time.time(), "command": command,
+               "targets": dict(targets), "results": {}}
+        pipe = self.client.pipeline()
+        pipe.set(self._job_key(job_id), json.dumps({k: v for k, v in job.items() if k != "results"}))
+        pipe.zadd(self._jobs_key, {job_id: job["created_at"]})
+        if targets:
+            pipe.hset(self._by_command_key, mapping={cid: job_id for cid in targets.values()})
+        pipe.execute()
+        self._trim()
+        return job
+
+    def _trim(self):
+        for old_id in self.client.zrange(self._jobs_key, 0, -(MAX_JOBS + 1)):
+            raw = self.client.get(self._job_key(old_id))
+            pipe = self.client.pipeline()
+            if raw:
+                command_ids = list(json.loads(raw)["targets"].values())
+                if command_ids:
+                    pipe.hdel(self._by_command_key, *command_ids)
+            pipe.delete(self._job_key(old_id), self._job_key(old_id) + ":results")
+            pipe.zrem(self._jobs_key, old_id)
+            pipe.execute()
+
+    def record_result(self, command_id: str, agent_id: str, success: bool, output: str) -> Optional[str]:
+        job_id = self.client.hget(self._by_command_key, command_id)
+        if job_id is None:
+            return None
+        raw = self.client.get(self._job_key(job_id))
+        if raw is None or json.loads(raw)["targets"].get(agent_id) != command_id:
+            return None
+        self.client.hset(self._job_key(job_id) + ":results", agent_id, json.dumps({
+            "command_id": command_id,
+            "success": success,
+            "output": (output or "")[:OUTPUT_PREVIEW],
+            "received_at": time.time(),
+        }))
+        return job_id
+
+    def summary(self, job_id: str, include_results: bool = False) -> Optional[Dict[str, Any]]:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(self._job_key(job_id))
+        pipe.hgetall(self._job_key(job_id) + ":results")
+        raw, results = pipe.execute()
+        if raw is None:
+            return None
+        results = {agent_id: json.loads(r) for agent_id, r in results.items()}
+        return summarize(json.loads(raw), results, include_results)
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        job_ids = self.client.zrevrange(self._jobs_key, 0, limit - 1)
+        return [s for s in (self.summary(job_id) for job_id in job_ids) if s is not None]
+
+
+# -------------------------------
+# Live command output
+# -------------------------------
+OUTPUT_TTL = 6 * 3600   # seconds a command's streamed output is kept after its last chunk
+
+# KEYS: meta hash, chunks zset (scored by seq, member "<seq>:<text>")
+# ARGV: agent_id, seq ("" = next), text, text length in characters, limit,
+#       now, ttl, "1" to store over the limit (the text is already truncated)
+# Returns {1, seq} stored, {0, 0} ignored, {2, room} over the limit.
+_OUTPUT_APPEND = """
+local owner = redis.call('HGET', KEYS[1], 'agent_id')
+if (owner and owner ~= ARGV[1]) or redis.call('HGET', KEYS[1], 'truncated') == '1' then
+  return {0, 0}
+end
+local seq
+if ARGV[2] == '' then
+  local last = redis.call('ZRANGE', KEYS[2], -1, -1, 'WITHSCORES')
+  seq = last[2] and tonumber(last[2]) + 1 or 0
+else
+  seq = tonumber(ARGV[2])
+  if redis.call('ZCOUNT', KEYS[2], seq, seq) > 0 then return {0, 0} end
+end
+local chars = tonumber(redis.call('HGET', KEYS[1], 'chars') or '0')
+local room = tonumber(ARGV[5]) - chars
+if ARGV[8] ~= '1' and tonumber(ARGV[4]) > room then return {2, room} end
+redis.call('ZADD', KEYS[2], seq, seq .. ':' .. ARGV[3])
+redis.call('HSET', KEYS[1], 'agent_id', ARGV[1], 'chars', chars + tonumber(ARGV[4]), 'updated_at', ARGV[6])
+if ARGV[8] == '1' then redis.call('HSET', KEYS[1], 'truncated', '1') end
+redis.call('EXPIRE', KEYS[1], ARGV[7])
+redis.call('EXPIRE', KEYS[2], ARGV[7])
+return {1, seq}
+"""
+
+_OUTPUT_FINISH = """
+if redis.call('EXISTS', KEYS[1]) == 1 then redis.call('HSET', KEYS[1], 'done', '1') end
+"""
+
+
+class RedisCommandOutputs(CommandOutputs):
+    """
+    CommandOutputs on Redis, so chunks posted to any worker can be tailed
+    from any other. Entries expire OUTPUT_TTL after their last chunk
+    instead of being capped at MAX_COMMANDS.
+    """
+
+    def __init__(self, client, prefix: str = KEY_PREFIX):
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+        self._append_script = client.register_script(_OUTPUT_APPEND)
+        self._finish_script = client.register_script(_OUTPUT_FINISH)
+
+    def _keys(self, command_id):
+        base = f"{self.prefix}:output:{{{command_id}}}"
+        return [base, f"{base}:chunks"]
+
+    def append(self, command_id: str, agent_id: str, text: str, seq: Optional[int] = None) -> bool:
+        keys = self._keys(command_id)
+        args = [agent_id, "" if seq is None else int(seq), text, len(text), MAX_STREAM_CHARS,
+                time.time(), OUTPUT_TTL, ""]
+        code, room = self._append_script(keys=keys, args=args)
+        if code == 2:
+            text = text[:max(room, 0)] + TRUNCATION_MARKER.format(limit=MAX_STREAM_CHARS)
+            args[2], args[3], args[7] = text, len(text), "1"
+            code, _ = self._append_script(keys=keys, args=args)
+        return code == 1
+
+    def finish(self, command_id: str):
+        self._finish_script(keys=self._keys(command_id)[:1])
+
+    def get(self, command_id: str, after_seq: int = -1) -> Optional[Dict[str, Any]]:
+        meta_key, chunks_key = self._keys(command_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hgetall(meta_key)
+        pipe.zrangebyscore(chunks_key, f"({after_seq}", "+inf")
+        meta, members = pipe.execute()
+        if not meta:
+            return None
+        chunks = []
+        for member in members:
+            seq, text = member.split(":", 1)
+            chunks.append({"seq": int(seq), "text": text})
+        return {
+            "command_id": command_id,
+            "agent_id": meta.get("agent_id"),
+            "chunks": chunks,
+            "output": "".join(c["text"] for c in chunks),
+            "last_seq": chunks[-1]["seq"] if chunks else after_seq,
+            "truncated": meta.get("truncated") == "1",
+            "updated_at": float(meta.get("updated_at") or 0),
+            "done": meta.get("done") == "1",
+        }
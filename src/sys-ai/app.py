@@ -1,7 +1,5 @@
 # src/sys-ai/app.py  (FULL updated file)
-import json
 import streamlit as st
-import requests
 import socket
 import pandas as pd
 import psutil
@@ -13,12 +11,14 @@ import uuid
 import getpass
 
 from st_aggrid import AgGrid, GridOptionsBuilder
-from modules.ticket_classifier import classify_ticket, save_ticket
+from modules.ticket_classifier import save_ticket
+from modules.ticket_store import get_store
 from modules.chatbot import get_chatbot_response
 from modules.auto_troubleshoot import restart_service
 from modules.application_installer import application_installer_ui, admin_approval_ui
 from modules.proactive_health import system_health_prediction
 from modules.chat_support import add_message, get_chat_for_user, get_active_users, load_chat
+from modules.http_client import get_client
 
 # Add admin machine agent IDs here
 ADMIN_AGENT_IDS = [
@@ -34,6 +34,10 @@ current_user = getpass.getuser()
 st.set_page_config(page_title="SYS AI - L1 Support", layout="wide")
 BACKEND_URL = st.session_state.get("backend_url", "http://172.16.1.41:8000")  # change as needed
 
+def backend():
+    """Shared keep-alive client for BACKEND_URL (pooling, retries, gzip, latency counters)."""
+    return get_client(BACKEND_URL)
+
 # -------------------------
 # Helpers
 # -------------------------
@@ -56,8 +60,9 @@ def launch_quick_assist():
     
 def trigger_quick_assist(agent_id: str):
     try:
-        payload = {"id": f"qa-{int(time.time())}", "type": "quick_assist"}
-        r = requests.post(f"{BACKEND_URL}/api/agent/send/{agent_id}", json=payload, timeout=5)
+        # dedup_key: repeated clicks collapse into the still-pending command
+        payload = {"id": f"qa-{int(time.time())}", "type": "quick_assist", "dedup_key": "quick_assist"}
+        r = backend().post(f"/api/agent/send/{agent_id}", json=payload, timeout=5)
         return r.status_code == 200
     except:
         return False
@@ -81,10 +86,38 @@ def get_client_ip():
             pass
     return None
 
-def fetch_agents():
+@st.cache_resource
+def _etag_cache():
+    """url+params -> (etag, json) shared across reruns and sessions."""
+    return {}
+
+def backend_get_json(path, params=None, timeout=5):
+    """
+    GET a backend endpoint with If-None-Match; a 304 reuses the cached body.
+    Returns (status_code, json_or_None).
+    """
+    cache = _etag_cache()
+    key = (path, tuple(sorted((params or {}).items())))
+    headers = {}
+    if key in cache:
+        headers["If-None-Match"] = cache[key][0]
+    r = backend().get(path, params=params, headers=headers, timeout=timeout)
+    if r.status_code == 304 and key in cache:
+        return 200, cache[key][1]
+    if r.status_code != 200:
+        return r.status_code, None
+    data = r.json()
+    if r.headers.get("ETag"):
+        cache[key] = (r.headers["ETag"], data)
+    return 200, data
+
+# Only what the identity detection and device pickers need
+AGENT_LIST_FIELDS = "agent_id,hostname,ip_address,online"
+
+def fetch_agents(fields=AGENT_LIST_FIELDS):
     try:
-        r = requests.get(f"{BACKEND_URL}/api/agent/list", timeout=5)
-        return r.json().get("devices", [])
+        _, data = backend_get_json("/api/agent/list", {"fields": fields} if fields else None)
+        return (data or {}).get("devices", [])
     except Exception:
         return []
 
@@ -122,16 +155,31 @@ def detect_agent_by_identity(param_agent=None, client_ip=None, local_hostname=No
 
     return None
 
-def get_agent_info(agent_id):
-    """Fetch full agent info from backend or return None."""
+def get_agent_info(agent_id, fields=None):
+    """Fetch agent info (optionally only `fields`, e.g. "username,hostname") or return None."""
     try:
-        r = requests.get(f"{BACKEND_URL}/api/agent/info/{agent_id}", timeout=5)
-        if r.status_code == 200:
-            return r.json()
+        status, data = backend_get_json(f"/api/agent/info/{agent_id}", {"fields": fields} if fields else None)
+        if status == 200:
+            return data
     except Exception:
         pass
     return None
 
+def get_metrics_history(agent_id, seconds=3600, resolution="auto"):
+    """CPU/RAM/disk series for an agent from the backend history store."""
+    try:
+        now = time.time()
+        r = backend().get(
+            "/api/agent/metrics/history",
+            params={"agent_id": agent_id, "start": now - seconds, "end": now, "resolution": resolution},
+            timeout=5,
+        )
+        if r.status_code == 200:
+            return r.json().get("series", {}).get(agent_id, [])
+    except Exception:
+        pass
+    return []
+
 def set_custom_css():
     st.markdown("""
 <style>
@@ -380,7 +428,7 @@ viewer_username = None
 viewer_agent_id = None
 if viewer_agent:
     viewer_agent_id = viewer_agent.get("agent_id")
-    info_tmp = get_agent_info(viewer_agent_id)
+    info_tmp = get_agent_info(viewer_agent_id, fields="username")
     if info_tmp:
         viewer_username = info_tmp.get("username")
 
@@ -549,25 +597,21 @@ elif page == "Ticket Classifier":
     issue = st.text_area("🔍 IT Issue", height=150, placeholder="Enter issue details...")
     if st.button("🚀 Classify & Create Ticket"):
         if issue.strip():
-            category = classify_ticket(issue)
-            new_ticket = save_ticket(issue)
+            # title/category arrive with the enrichment; don't hold the page longer than this
+            new_ticket = save_ticket(issue, wait=15)
+            category = new_ticket.get("category")
             # Ensure created ticket has the correct username/hostname if we detected agent
             detected_agent_id = st.session_state.get("current_user_agent")
             if detected_agent_id:
-                # patch the ticket file to override username/hostname to agent's username/hostname
+                # override username/hostname with the agent's username/hostname
                 try:
-                    with open("tickets.json", "r", encoding="utf-8") as tf:
-                        tickets = json.load(tf)
-                    # find the ticket we just created
-                    for t in tickets[::-1]:
-                        if t.get("ticket_id") == new_ticket.get("ticket_id"):
-                            info_local = get_agent_info(detected_agent_id)
-                            if info_local:
-                                t["username"] = info_local.get("username", t.get("username"))
-                                t["hostname"] = info_local.get("hostname", t.get("hostname"))
-                            break
-                    with open("tickets.json", "w", encoding="utf-8") as tf:
-                        json.dump(tickets, tf, indent=4)
+                    info_local = get_agent_info(detected_agent_id, fields="username,hostname")
+                    if info_local:
+                        get_store().update(
+                            new_ticket["ticket_id"],
+                            username=info_local.get("username", new_ticket.get("username")),
+                            hostname=info_local.get("hostname", new_ticket.get("hostname")),
+                        )
                 except Exception:
                     pass
             st.success(f"Ticket created ({new_ticket['ticket_id']}), category: {category}")
@@ -640,12 +684,13 @@ elif page == "Admin Portal":
     if st.button("🟢 Launch Quick Assist on Admin Machine"):
         cmd_payload = {
             "id": f"admin-qa-{int(time.time())}",
-            "type": "quick_assist"
+            "type": "quick_assist",
+            "dedup_key": "quick_assist"
         }
 
         try:
-            r = requests.post(
-                f"{BACKEND_URL}/api/agent/send/{ADMIN_AGENT_ID}",
+            r = backend().post(
+                f"/api/agent/send/{ADMIN_AGENT_ID}",
                 json=cmd_payload,
                 timeout=5
             )
@@ -662,6 +707,58 @@ elif page == "Admin Portal":
 
     st.markdown("---")
 
+    # ---------------------------------------------------------
+    # FLEET COMMAND (one request for many devices)
+    # ---------------------------------------------------------
+    with st.expander("📣 Fleet Command"):
+        fc_type = st.selectbox("Command type", ["cmd", "quick_assist", "restart", "shutdown"], key="fleet_type")
+        fc_text = st.text_input("Command (for cmd)", key="fleet_cmd") if fc_type == "cmd" else ""
+        fc1, fc2, fc3 = st.columns(3)
+        fc_os = fc1.text_input("OS starts with", key="fleet_os", placeholder="Windows-11")
+        fc_host = fc2.text_input("Hostname pattern", key="fleet_host", placeholder="INL-*")
+        fc_online = fc3.checkbox("Online only", value=True, key="fleet_online")
+
+        whole_fleet = not (fc_os or fc_host)
+        confirmed = True
+        if whole_fleet:
+            st.warning("No OS or hostname filter: this targets every " + ("online " if fc_online else "") + "device.")
+            confirmed = st.checkbox("Send to the whole fleet", key="fleet_all")
+        if fc_type in ("restart", "shutdown"):
+            confirmed = st.checkbox(f"I understand every matching device will {fc_type}",
+                                    key="fleet_confirm_power") and confirmed
+
+        if st.button("🚀 Send to matching devices", disabled=not confirmed):
+            fleet_cmd = {"type": fc_type}
+            if fc_type == "cmd":
+                fleet_cmd["command"] = fc_text
+            selector = {"os": fc_os or None, "hostname_pattern": fc_host or None,
+                        "online": True if fc_online else None}
+            try:
+                r = backend().post("/api/fleet/commands",
+                                   json={"command": fleet_cmd, "selector": selector, "all": whole_fleet},
+                                   timeout=10)
+                if r.status_code == 200:
+                    st.session_state["fleet_job_id"] = r.json()["job_id"]
+                    st.success(f"Queued for {r.json()['targets']} device(s) — job {r.json()['job_id']}")
+                else:
+                    st.error(f"❌ Backend error: {r.text}")
+            except Exception as e:
+                st.error(f"❌ Failed to send fleet command: {e}")
+
+        fleet_job_id = st.session_state.get("fleet_job_id")
+        if fleet_job_id:
+            try:
+                job = backend().get(f"/api/fleet/jobs/{fleet_job_id}",
+                                    params={"include_results": True}, timeout=5).json()
+                st.progress(job["completed"] / max(job["total"], 1),
+                            text=f"{job['completed']}/{job['total']} done · {job['succeeded']} ok · {job['failed']} failed")
+                if job.get("results"):
+                    st.dataframe(pd.DataFrame([{"agent_id": a, **r} for a, r in job["results"].items()]))
+            except Exception as e:
+                st.warning(f"Unable to load job {fleet_job_id}: {e}")
+
+    st.markdown("---")
+
     # ---------------------------------------------------------
     # CONNECTED DEVICES
     # ---------------------------------------------------------
@@ -683,23 +780,20 @@ elif page == "Admin Portal":
     # ---------------------------------------------------------
     # TICKET SECTION
     # ---------------------------------------------------------
-    TICKETS_FILE = "tickets.json"
-
-    def load_tickets():
-        try:
-            with open(TICKETS_FILE, "r") as f:
-                return json.load(f)
-        except Exception:
-            return []
-
-    tickets = load_tickets()
+    TICKET_PAGE_SIZE = 50
+    TICKET_EDITABLE_COLUMNS = ["status"]
+    ticket_store = get_store()
+    try:
+        # maintained by the store; no scan of the ticket history
+        status_counts = ticket_store.status_counts()
+    except Exception:
+        status_counts = {}
+    total_tickets = sum(status_counts.values())
 
-    if tickets:
-        df = pd.DataFrame(tickets).sort_values(by="ticket_id", ascending=False)
-        total_tickets = len(df)
-        unresolved_tickets = df[df["status"] == "unresolved"].shape[0]
-        pending_tickets = df[df["status"] == "pending"].shape[0]
-        resolved_tickets = df[df["status"] == "resolved"].shape[0]
+    if total_tickets:
+        unresolved_tickets = status_counts.get("unresolved", 0)
+        pending_tickets = status_counts.get("pending", 0)
+        resolved_tickets = status_counts.get("resolved", 0)
 
         stat_css = """
         <style>
@@ -718,6 +812,25 @@ elif page == "Admin Portal":
 
         st.markdown("---")
 
+        # Only the requested page is loaded (filters, sort and search run in SQLite)
+        f1, f2, f3, f4 = st.columns([3, 1, 1, 1])
+        t_search = f1.text_input("Search tickets", key="ticket_search", placeholder="issue, user, host or category")
+        t_status = f2.selectbox("Status", ["All", "unresolved", "pending", "resolved"], key="ticket_status")
+        t_sort = f3.selectbox("Sort by", ["ticket_id", "timestamp", "status", "category", "username", "hostname"],
+                              key="ticket_sort")
+        t_page = f4.number_input("Page", min_value=1, value=1, step=1, key="ticket_page")
+        page_rows, matches = ticket_store.query(
+            status=None if t_status == "All" else t_status,
+            search=t_search or None,
+            sort=t_sort,
+            limit=TICKET_PAGE_SIZE,
+            offset=(int(t_page) - 1) * TICKET_PAGE_SIZE,
+        )
+        st.caption(f"{matches} matching ticket(s) · page {int(t_page)} of {max(1, -(-matches // TICKET_PAGE_SIZE))}")
+        df = pd.DataFrame(page_rows)
+        if df.empty:
+            df = pd.DataFrame(columns=["ticket_id", "username", "issue", "category", "status", "assigned_to"])
+
         # Ticket table
         gb = GridOptionsBuilder.from_dataframe(df)
         gb.configure_pagination(enabled=True)
@@ -733,16 +846,31 @@ elif page == "Admin Portal":
         grid = AgGrid(df, gridOptions=gb.build(), height=300, theme="streamlit")
         updated_df = grid["data"]
 
-        # Update JSON when changed
-        for _, row in updated_df.iterrows():
-            orig = df[df["ticket_id"] == row["ticket_id"]]
-            if not orig.empty and orig.iloc[0]["status"] != row["status"]:
-                for t in tickets:
-                    if t["ticket_id"] == row["ticket_id"]:
-                        t["status"] = row["status"]
-                with open(TICKETS_FILE, "w") as f:
-                    json.dump(tickets, f, indent=4)
-                st.success(f"Updated ticket {row['ticket_id']} → {row['status']}")
+        # Save only the edited cells: one aligned comparison per editable column,
+        # then a single batched update by ticket_id (status changes are audited)
+        changes = {}
+        if not df.empty:
+            before = df.set_index("ticket_id")
+            after = pd.DataFrame(updated_df).set_index("ticket_id").reindex(before.index)
+            for column in TICKET_EDITABLE_COLUMNS:
+                if column not in after:
+                    continue
+                edited = after[column].notna() & (after[column] != before[column])
+                for ticket_id, value in after.loc[edited, column].items():
+                    changes.setdefault(ticket_id, {})[column] = value
+        if changes:
+            ticket_store.update_many(changes, changed_by=current_user)
+            for ticket_id, fields in changes.items():
+                st.success(f"Updated ticket {ticket_id} → {', '.join(map(str, fields.values()))}")
+
+        with st.expander("🕘 Recent status changes"):
+            history = ticket_store.status_history(limit=20)
+            if history:
+                hist_df = pd.DataFrame(history)
+                hist_df["changed_at"] = pd.to_datetime(hist_df["changed_at"], unit="s")
+                st.dataframe(hist_df)
+            else:
+                st.caption("No status changes yet.")
 
         st.markdown("---")
         admin_approval_ui()
@@ -756,11 +884,10 @@ elif page == "Admin Portal":
     # DEVICE INFO
     # ---------------------------------------------------------
     try:
-        info_res = requests.get(f"{BACKEND_URL}/api/agent/info/{selected_agent}", timeout=5)
-        if info_res.status_code != 200:
+        info_status, device_info = backend_get_json(f"/api/agent/info/{selected_agent}")
+        if info_status != 200:
             st.error("Unable to fetch system info.")
             st.stop()
-        device_info = info_res.json()
     except Exception as e:
         st.error(f"Error fetching info: {e}")
         st.stop()
@@ -770,6 +897,61 @@ elif page == "Admin Portal":
 
     st.markdown("---")
 
+    # ---------------------------------------------------------
+    # COMMAND RESULTS
+    # ---------------------------------------------------------
+    st.subheader("📜 Recent Command Results")
+    try:
+        results = backend().get("/api/commands/results",
+                                params={"agent_id": selected_agent, "limit": 20}, timeout=5).json().get("results", [])
+    except Exception:
+        results = []
+    if results:
+        res_df = pd.DataFrame(results)
+        res_df["completed_at"] = pd.to_datetime(res_df["completed_at"], unit="s")
+        st.dataframe(res_df[["completed_at", "command_id", "type", "success", "output_size", "preview"]])
+        picked = st.selectbox("View full output:", [r["command_id"] for r in results], key="result_pick")
+        if picked:
+            try:
+                full = backend().get(f"/api/commands/{picked}/result", timeout=10).json()
+                st.code(full.get("output", ""))
+            except Exception as e:
+                st.warning(f"Unable to load output: {e}")
+    else:
+        st.info("No command results for this device yet.")
+
+    with st.expander("📡 Live command output"):
+        tail_id = st.text_input("Command ID", key="tail_command_id")
+        if tail_id:
+            # only chunks after the last seen seq are fetched on each refresh
+            tail = st.session_state.setdefault("output_tail", {}).setdefault(
+                tail_id, {"seq": -1, "text": "", "done": False})
+            try:
+                r = backend().get(f"/api/commands/{tail_id}/output",
+                                  params={"after_seq": tail["seq"]}, timeout=5)
+                if r.status_code == 200:
+                    out = r.json()
+                    tail["text"] += out["output"]
+                    tail["seq"] = out["last_seq"]
+                    tail["done"] = out["done"]
+                elif r.status_code != 404:
+                    st.warning(f"Backend error: {r.text}")
+            except Exception as e:
+                st.warning(f"Unable to load output: {e}")
+            st.code(tail["text"][-200000:] or "(no output yet)")
+            st.caption("Finished" if tail["done"] else "Running…")
+            if not tail["done"] and st.button("🔄 Refresh output"):
+                st.rerun()
+
+    with st.expander("🔌 Backend latency (this portal)"):
+        stats = backend().stats()
+        if stats:
+            st.dataframe(pd.DataFrame([{"endpoint": k, **v} for k, v in sorted(stats.items())]))
+        else:
+            st.caption("No backend calls yet.")
+
+    st.markdown("---")
+
     # ---------------------------------------------------------
     # CHAT WITH USER
     # ---------------------------------------------------------
@@ -869,6 +1051,15 @@ elif page == "Proactive Health Agent":
         st.error("❌ Device data not available. Is the agent running?")
         st.stop()
 
+    # Trend from the backend's history store (no local re-sampling)
+    history = get_metrics_history(agent_id)
+    if history:
+        st.subheader("📈 Last Hour")
+        hist_df = pd.DataFrame(history)
+        hist_df["timestamp"] = pd.to_datetime(hist_df["timestamp"], unit="s")
+        value_cols = [c for c in hist_df.columns if c.endswith("_usage") or c.endswith("_usage_avg")]
+        st.line_chart(hist_df.set_index("timestamp")[value_cols])
+
     st.subheader("📊 Latest System Health Report")
     # The backend presently stores raw metrics. If you'd like predictions saved in backend,
     # implement an endpoint and have the agent send them. For now we run local model analysis.
@@ -998,9 +1189,9 @@ elif page == "Chat Support":
     # 2) Quick Assist Trigger (unchanged behavior)
     # --------------------------
     if qa_clicked:
-        payload = {"type": "quick_assist", "id": f"qa-{int(time.time())}"}
+        payload = {"type": "quick_assist", "id": f"qa-{int(time.time())}", "dedup_key": "quick_assist"}
         try:
-            r = requests.post(f"{BACKEND_URL}/api/agent/send/{agent_id}", json=payload, timeout=5)
+            r = backend().post(f"/api/agent/send/{agent_id}", json=payload, timeout=5)
             if r.status_code == 200:
                 st.success("📡 Quick Assist request sent. User's device will open Quick Assist shortly.")
             else:
@@ -1011,10 +1202,7 @@ elif page == "Chat Support":
     # --------------------------
     # 3) Load username + chat
     # --------------------------
-    try:
-        info = requests.get(f"{BACKEND_URL}/api/agent/info/{agent_id}", timeout=5).json()
-    except:
-        info = {}
+    info = get_agent_info(agent_id, fields="username") or {}
 
     username = info.get("username", agent_id)
     st.session_state["current_user"] = username
@@ -0,0 +1,456 @@
+import getpass
+import hashlib
+import json
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import psutil
+
+try:
+    from modules.metrics_sampler import get_sampler
+    from modules.heartbeat_pacer import HeartbeatPacer
+    from modules.offline_buffer import OfflineBuffer, metrics_sample
+    from modules.command_runner import DEFAULT_TIMEOUT, CommandRunner
+except ImportError:  # imported from the modules folder (agent_service.py)
+    from metrics_sampler import get_sampler
+    from heartbeat_pacer import HeartbeatPacer
+    from offline_buffer import OfflineBuffer, metrics_sample
+    from command_runner import DEFAULT_TIMEOUT, CommandRunner
+
+# Shared by the console agent (sys_agent/agent.py) and the Windows service
+# (agent_service.py -> agent_worker.py): identity, single-instance lock, the
+# payload sent to the backend and the sync loop (AgentSession).
+AGENT_ID_PREFIX = "INL"
+
+# ids written by agents from before the shared state directory; adopted once
+# so an upgraded machine keeps its history and tickets
+LEGACY_ID_FILES = [
+    os.path.abspath("agent_id.txt"),                              # console agent (cwd-relative)
+    os.path.join(os.path.expanduser("~"), ".sysai_agent_id"),     # Windows service
+]
+
+SYNC_TIMEOUT_SLACK = 15   # seconds on top of the long-poll wait before a sync gives up
+REQUEST_TIMEOUT = 15      # update, poll and result posts
+CHUNK_TIMEOUT = 5         # live output chunks (a lost one only leaves a gap)
+BATCH_TIMEOUT = 30        # outbox replay
+
+
+# ---------------------------------------------------
+# machine-wide state (id, lock)
+# ---------------------------------------------------
+def state_dir():
+    """
+    Directory shared by every agent on this machine, whatever user it runs
+    as and whatever directory it was started from. SYS_AI_AGENT_HOME overrides.
+    """
+    path = os.environ.get("SYS_AI_AGENT_HOME")
+    if not path:
+        if os.name == "nt":
+            path = os.path.join(os.environ.get("ProgramData", r"C:\ProgramData"), "SysAI")
+        elif os.access("/var/lib", os.W_OK):
+            path = "/var/lib/sysai"
+        else:
+            path = os.path.join(os.path.expanduser("~"), ".sysai")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _machine_id():
+    """The OS's own install id (survives reinstalling the agent), or None."""
+    try:
+        if os.name == "nt":
+            import winreg
+            key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Cryptography",
+                                 0, winreg.KEY_READ | winreg.KEY_WOW64_64KEY)
+            with key:
+                return winreg.QueryValueEx(key, "MachineGuid")[0]
+        if sys.platform == "darwin":
+            out = subprocess.run(["ioreg", "-rd1", "-c", "IOPlatformExpertDevice"],
+                                 capture_output=True, text=True, timeout=5).stdout
+            match = re.search(r'"IOPlatformUUID" = "([^"]+)"', out)
+            if match:
+                return match.group(1)
+        for path in ("/etc/machine-id", "/var/lib/dbus/machine-id"):
+            if os.path.exists(path):
+                value = open(path).read().strip()
+                if value:
+                    return value
+    except Exception:
+        pass
+    node = uuid.getnode()
+    if not (node >> 40) & 1:   # multicast bit set = random, not a real MAC
+        return f"mac:{node:012x}"
+    return None
+
+
+def get_agent_id():
+    """
+    INL-<hostname>-<8 hex of the machine id>: the same id for the console
+    agent and the service, and across restarts from any directory. Cached in
+    state_dir() so a later hostname change keeps the id; an id left by an
+    older agent (LEGACY_ID_FILES) is adopted instead. SYS_AI_AGENT_ID overrides.
+    """
+    override = os.environ.get("SYS_AI_AGENT_ID")
+    if override:
+        return override
+    path = os.path.join(state_dir(), "agent_id")
+    try:
+        cached = open(path).read().strip()
+        if cached:
+            return cached
+    except OSError:
+        pass
+    agent_id = _legacy_agent_id()
+    if not agent_id:
+        # no machine id at all: a random one, made stable by the cache file
+        seed = _machine_id() or str(uuid.uuid4())
+        agent_id = f"{AGENT_ID_PREFIX}-{platform.node()}-{hashlib.sha1(seed.encode()).hexdigest()[:8]}"
+    try:
+        with open(path, "w") as f:
+            f.write(agent_id)
+    except OSError:
+        pass
+    return agent_id
+
+
+def _legacy_agent_id():
+    for path in LEGACY_ID_FILES:
+        try:
+            value = open(path).read().strip()
+        except OSError:
+            continue
+        if value and len(value) <= 128 and "\n" not in value:
+            return value
+    return None
+
+
+class SingleInstance:
+    """
+    Machine-wide lock: only one agent (console or service) runs per machine.
+    The OS drops the lock when the process exits, so a crash never leaves it stale.
+    """
+
+    def __init__(self, name="agent"):
+        self.path = os.path.join(state_dir(), f"{name}.lock")
+        self._file = None
+
+    def acquire(self):
+        """True if this process now holds the lock, False if another agent does."""
+        try:
+            f = open(self.path, "a+")
+        except OSError:
+            return False
+        try:
+            f.seek(0)
+            if os.name == "nt":
+                import msvcrt
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        f.truncate(0)
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if os.name == "nt":
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        except OSError:
+            pass
+        self._file.close()
+        self._file = None
+
+
+# ---------------------------------------------------
+# payload (same schema for every agent)
+# ---------------------------------------------------
+def get_real_ip():
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        ip = s.getsockname()[0]
+        s.close()
+        return ip
+    except Exception:
+        return "0.0.0.0"
+
+
+def _username():
+    # os.getlogin() fails without a console (e.g. in the service)
+    try:
+        return os.environ.get("USERNAME") or getpass.getuser()
+    except Exception:
+        return "unknown"
+
+
+def collect_metrics():
+    # served from the background sampler; no 1s cpu_percent block per beat
+    snap = get_sampler().snapshot()
+    return {
+        "cpu_usage": snap["cpu_usage"],
+        "ram_usage": snap["ram_usage"],
+        "disk_usage": snap["disk_usage"],
+    }
+
+
+def collect_inventory():
+    """Static fields: only resent to the backend when their hash changes."""
+    try:
+        processor = platform.processor() or "Unknown"
+    except Exception:
+        processor = "Unknown"
+    return {
+        "hostname": platform.node(),
+        "username": _username(),
+        "os": platform.platform(),
+        "ip_address": get_real_ip(),
+        "device_info": {
+            "hostname": platform.node(),
+            "manufacturer": platform.machine(),
+            "processor": processor,
+            "platform": platform.platform(),
+            "boot_time": psutil.boot_time(),
+            "ram_total_gb": round(psutil.virtual_memory().total / (1024 ** 3), 2),
+        },
+    }
+
+
+def inventory_hash(inventory):
+    return hashlib.sha1(json.dumps(inventory, sort_keys=True).encode()).hexdigest()
+
+
+def build_update_payload(agent_id, interval=None):
+    """Full payload for /api/agent/update."""
+    payload = {"agent_id": agent_id, "metrics": collect_metrics(), "interval": interval}
+    payload.update(collect_inventory())
+    return payload
+
+
+def build_sync_payload(agent_id, known_inventory_hash=None, interval=None):
+    """
+    Payload for /api/agent/sync. Static inventory is only included when its
+    hash differs from the one the backend echoed back.
+    """
+    inventory = collect_inventory()
+    digest = inventory_hash(inventory)
+    payload = {"agent_id": agent_id, "metrics": collect_metrics(),
+               "inventory_hash": digest, "interval": interval}
+    if digest != known_inventory_hash:
+        payload.update(inventory)
+    return payload
+
+
+# ---------------------------------------------------
+# talking to the backend
+# ---------------------------------------------------
+def retry_after(r, default):
+    """Seconds to back off after a 429 (the backend's Retry-After hint)."""
+    try:
+        return max(1.0, float(r.headers.get("Retry-After", default)))
+    except (TypeError, ValueError):
+        return float(default)
+
+
+class AgentSession:
+    """
+    Everything an agent says to the backend, for the console agent and the
+    service alike: heartbeat + long-poll sync (update + poll against a
+    backend without /api/agent/sync), 429 Retry-After, the offline outbox,
+    command dispatch and cancellation, live output chunks and results.
+
+    run_command(ctx) -> (success, output) is the agent's own command handler;
+    it runs on a CommandRunner worker.
+    """
+
+    def __init__(self, http, agent_id, run_command, interval, outbox_path=None,
+                 default_timeout=DEFAULT_TIMEOUT):
+        self.http = http
+        self.agent_id = agent_id
+        self.interval = interval
+        self.inventory_hash = None   # last hash echoed by the backend
+        # jitter, failure backoff and the backend's next_interval hint
+        self.pacer = HeartbeatPacer(interval)
+        # undelivered samples/results, replayed through /api/agent/batch
+        self.outbox = OfflineBuffer(outbox_path or os.path.join(state_dir(), "outbox.db"))
+        self._run_command = run_command
+        # commands run on a small pool, so a long one never holds up heartbeats
+        self.runner = CommandRunner(on_result=lambda cmd, success, output: self.post_result(
+                                        cmd.get("id", ""), success, output),
+                                    on_chunk=self.post_output, default_timeout=default_timeout)
+        self._stop = threading.Event()
+
+    # ---- heartbeat ----
+    def sync(self, wait=None):
+        """
+        POST /api/agent/sync: sends the heartbeat and receives pending commands.
+        The backend holds the request up to `wait` seconds (default: the
+        current pacer interval) for new commands.
+        Returns (updated, got_commands), or None if the backend has no sync endpoint.
+        """
+        wait = self.pacer.wait if wait is None else wait
+        payload = build_sync_payload(self.agent_id, self.inventory_hash, self.interval)
+        # commands still queued/running here keep their lease on the backend
+        payload["running"] = self.runner.active()
+        try:
+            r = self.http.post("/api/agent/sync", params={"wait": wait}, json=payload,
+                               timeout=wait + SYNC_TIMEOUT_SLACK)
+            data = r.json() if r.status_code == 200 else None
+        except Exception as e:
+            # unreachable, or a 200 that isn't our JSON (proxy/captive portal page)
+            print("[ERROR] Sync failed:", e)
+            return self._failed(payload)
+        if r.status_code == 404:
+            return None
+        if data is None:
+            return self._failed(payload, r)
+        self.inventory_hash = data.get("inventory_hash")
+        self.pacer.success(data.get("next_interval"))
+        commands = data.get("commands", [])
+        self.handle_commands(commands)
+        return True, bool(commands)
+
+    def send_update(self):
+        """POST /api/agent/update (older backends). Returns (updated, got_commands)."""
+        payload = build_update_payload(self.agent_id, self.interval)
+        try:
+            r = self.http.post("/api/agent/update", json=payload, timeout=REQUEST_TIMEOUT)
+            data = r.json() if r.status_code == 200 else None
+        except Exception as e:
+            print("[ERROR] Update failed:", e)
+            return self._failed(payload)
+        if data is None:
+            return self._failed(payload, r)
+        self.pacer.success(data.get("next_interval"))
+        return True, False
+
+    def poll_commands(self):
+        try:
+            r = self.http.get(f"/api/agent/commands/{self.agent_id}", timeout=REQUEST_TIMEOUT)
+            self.handle_commands(r.json().get("commands", []))
+        except Exception as e:
+            print("[ERROR] Poll failed:", e)
+
+    def _failed(self, payload, r=None):
+        if r is not None and r.status_code == 429:
+            # backend is shedding load: stay quiet for at least as long as it asks
+            delay = retry_after(r, self.interval)
+            print(f"[WARN] Backend busy, retry after {delay:.0f}s")
+            self.pacer.failure(delay)
+        else:
+            if r is not None:
+                print(f"[WARN] Backend returned {r.status_code} / {r.text}")
+            self.pacer.failure()
+        self._buffer("metrics", metrics_sample(payload["metrics"]))
+        return False, False
+
+    def _buffer(self, kind, record):
+        try:
+            self.outbox.push(kind, record)
+        except Exception as e:
+            # disk full / locked: the record is lost, the agent keeps going
+            print(f"[ERROR] Could not buffer {kind}:", e)
+
+    def beat(self):
+        """One heartbeat (sync, or update + poll on an older backend). Returns (updated, got_commands)."""
+        result = self.sync()
+        if result is None:
+            updated, got_commands = self.send_update()
+            if updated:
+                self.poll_commands()
+        else:
+            updated, got_commands = result
+        if updated:
+            self.flush_outbox()
+        return updated, got_commands
+
+    def flush_outbox(self):
+        """Replay buffered samples/results in compressed batches."""
+        try:
+            if not len(self.outbox):
+                return
+            sent = self.outbox.replay(
+                lambda body, headers: self.http.post("/api/agent/batch", data=body, headers=headers,
+                                                     timeout=BATCH_TIMEOUT),
+                self.agent_id)
+        except Exception as e:
+            print("[ERROR] Outbox replay failed:", e)
+            return
+        if sent:
+            print(f"[INFO] Replayed {sent} buffered records")
+
+    # ---- commands ----
+    def handle_commands(self, commands):
+        """Commands run on the worker pool; this returns immediately."""
+        for cmd in commands:
+            print(f"[COMMAND] Received: {cmd}")
+            if cmd.get("type") == "cancel":
+                cancelled = self.runner.cancel(cmd.get("target", ""))
+                self.post_result(cmd.get("id", ""), cancelled,
+                                 "Cancelled" if cancelled else "Command is not running")
+            else:
+                self.runner.submit(cmd, self._run_command)
+
+    def post_result(self, command_id, success, output):
+        """Post a command result (this also acks it); buffer it if that fails."""
+        result = {"agent_id": self.agent_id, "command_id": command_id, "output": output, "success": success}
+        try:
+            r = self.http.post("/api/agent/command_response", json=result, timeout=REQUEST_TIMEOUT)
+            if r.status_code == 200:
+                return
+            print(f"[WARN] Posting the result of {command_id} returned {r.status_code}")
+        except Exception as e:
+            print(f"[ERROR] Posting the result of {command_id} failed:", e)
+        # keep it for replay so the result is not lost
+        self._buffer("result", dict(result, completed_at=time.time()))
+
+    def post_output(self, command_id, seq, text):
+        """Stream a chunk of a running command's output."""
+        self.http.post("/api/agent/command_output",
+                       json={"agent_id": self.agent_id, "command_id": command_id, "seq": seq, "output": text},
+                       timeout=CHUNK_TIMEOUT)
+
+    # ---- loop ----
+    def run(self, on_beat=None):
+        """Beat until stop(). on_beat(updated) is called after every heartbeat."""
+        self._stop.clear()
+        # spread out agents that boot at the same time
+        if self._stop.wait(self.pacer.initial_delay()):
+            return
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                updated, got_commands = self.beat()
+                if on_beat is not None:
+                    on_beat(updated)
+            except Exception as e:
+                # one bad beat must never end the loop (and with it the service)
+                print("[ERROR] Heartbeat failed:", e)
+                self.pacer.failure()
+                got_commands = False
+            # the sync call already waited; only top up to the (jittered) interval
+            if not got_commands:
+                self._stop.wait(max(0, self.pacer.next_delay() - (time.time() - started)))
+
+    def stop(self):
+        self._stop.set()
+        self.runner.shutdown()
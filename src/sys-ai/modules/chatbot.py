@@ -35,7 +35,7 @@ except Exception:
         from ticket_classifier import save_ticket, classify_ticket  # type: ignore
     except Exception:
         # lightweight fallback (won't persist)
-        def save_ticket(issue):
+        def save_ticket(issue, wait=0):
             return {"ticket_id": "INC0000000", "category": "General Support", "assigned_to": "L1", "username": getpass.getuser()}
 
         def classify_ticket(issue):
@@ -471,7 +471,8 @@ def get_chatbot_response(user_query: str, chat_history: List[Tuple[str, str]]) -
     # 2) Escalation: user requests ticket
     if detect_escalation(uq):
         issue = extract_issue_from_history(chat_history, uq)
-        ticket = save_ticket(issue)
+        # wait briefly for the classification, so the category shown is the final one
+        ticket = save_ticket(issue, wait=15)
         return (
             f"🧾 A support ticket has been created for you.\n"
             f"🎫 Ticket ID: {ticket.get('ticket_id')}\n"
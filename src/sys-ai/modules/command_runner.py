@@ -0,0 +1,300 @@
+import codecs
+import io
+import locale
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Pool size and limits for admin commands run by the agent.
+MAX_WORKERS = int(os.environ.get("SYS_AI_COMMAND_WORKERS", "4"))
+MAX_QUEUED = 32                 # commands waiting for a worker before new ones are refused
+DEFAULT_TIMEOUT = 300           # seconds, unless the command carries "timeout"
+
+# The final result carries the head and tail of the output; the full output
+# (up to MAX_STREAM_CHARS) is streamed in sequence-numbered chunks.
+RESULT_HEAD_CHARS = 32 * 1024
+RESULT_TAIL_CHARS = 32 * 1024
+MAX_STREAM_CHARS = 1024 * 1024  # matches the backend's per-command limit
+
+CHUNK_CHARS = 4096              # stream output once this much is buffered...
+CHUNK_INTERVAL = 1.0            # ...or this many seconds passed
+MAX_CHUNK_CHARS = 60 * 1024     # one request never carries more than this
+READ_CHARS = 8192               # bytes per read; output is streamed as it arrives, not per line
+RECENT_IDS = 256                # finished ids remembered to ignore redeliveries
+MAX_PENDING_CHUNKS = 256        # chunks waiting for the sender; beyond that they are dropped
+
+
+class CommandCancelled(Exception):
+    pass
+
+
+class CommandContext:
+    """
+    Passed to a command handler. run() executes a process with the command's
+    deadline and cancellation applied; emit() streams output to the backend.
+    """
+
+    def __init__(self, command, timeout, send_chunk=None):
+        self.command = command
+        self.command_id = command.get("id", "")
+        self.timeout = timeout
+        self.deadline = None    # set by start(), once a worker picks the command up
+        self.cancel_event = threading.Event()
+        # send_chunk(command_id, seq, text) must not block: it only hands the
+        # chunk to the runner's sender thread, so no network call ever runs
+        # under the lock, on the pipe reader or in the process wait loop
+        self._send_chunk = send_chunk
+        self._lock = threading.Lock()   # emit() runs on the process reader thread
+        self._pending = []
+        self._pending_chars = 0
+        self._last_flush = time.monotonic()
+        self._seq = 0
+        self._streamed = 0
+        self._head = []
+        self._head_chars = 0
+        self._tail = deque()
+        self._tail_chars = 0
+        self._total_chars = 0
+
+    def start(self):
+        """Start the timeout clock; time spent queued for a worker doesn't count."""
+        self.deadline = time.monotonic() + self.timeout
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def output(self):
+        """Head and tail of the output, with a marker for what was left out."""
+        with self._lock:
+            head, tail = "".join(self._head), "".join(self._tail)[-RESULT_TAIL_CHARS:]
+            omitted = self._total_chars - len(head) - len(tail)
+            if omitted <= 0:
+                return head + tail
+            return (head + f"\n...[{omitted} characters omitted; "
+                           f"the full output was streamed as command output]...\n" + tail)
+
+    def emit(self, text):
+        if not text:
+            return
+        with self._lock:
+            self._total_chars += len(text)
+            if self._head_chars < RESULT_HEAD_CHARS:
+                part = text[:RESULT_HEAD_CHARS - self._head_chars]
+                self._head.append(part)
+                self._head_chars += len(part)
+                text_for_tail = text[len(part):]
+            else:
+                text_for_tail = text
+            if text_for_tail:
+                self._tail.append(text_for_tail[-RESULT_TAIL_CHARS:])
+                self._tail_chars += len(self._tail[-1])
+                while self._tail_chars - len(self._tail[0]) >= RESULT_TAIL_CHARS:
+                    self._tail_chars -= len(self._tail.popleft())
+            if self._send_chunk is None:
+                return
+            self._pending.append(text)
+            self._pending_chars += len(text)
+            if self._pending_chars >= CHUNK_CHARS or time.monotonic() - self._last_flush >= CHUNK_INTERVAL:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def flush_if_idle(self):
+        """Flush what is buffered once CHUNK_INTERVAL passed, even if no new output arrived."""
+        with self._lock:
+            if time.monotonic() - self._last_flush >= CHUNK_INTERVAL:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        # numbering under the lock keeps chunks in order
+        if not self._pending or self._send_chunk is None:
+            return
+        text, self._pending, self._pending_chars = "".join(self._pending), [], 0
+        self._last_flush = time.monotonic()
+        room = MAX_STREAM_CHARS - self._streamed
+        if room <= 0:
+            return
+        if len(text) > room:
+            text = text[:room] + f"\n...[output truncated: streaming stops after {MAX_STREAM_CHARS} characters]\n"
+        self._streamed += len(text)
+        for start in range(0, len(text), MAX_CHUNK_CHARS):
+            self._send_chunk(self.command_id, self._seq, text[start:start + MAX_CHUNK_CHARS])
+            self._seq += 1
+
+    def run(self, args, shell=False):
+        """
+        Run a process, streaming its combined stdout/stderr. Returns the exit code.
+        Raises TimeoutError / CommandCancelled (after killing the process).
+        """
+        # own process group, so a timeout/cancel also stops the shell's children
+        if os.name == "nt":
+            group = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            group = {"start_new_session": True}
+        proc = subprocess.Popen(args, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                stdin=subprocess.DEVNULL, bufsize=0, **group)
+        reader = threading.Thread(target=self._pump, args=(proc.stdout,), daemon=True)
+        reader.start()
+        try:
+            while True:
+                try:
+                    code = proc.wait(timeout=0.5)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                self.flush_if_idle()
+                if self.cancelled:
+                    _kill_tree(proc)
+                    raise CommandCancelled()
+                if self.deadline is not None and time.monotonic() >= self.deadline:
+                    _kill_tree(proc)
+                    raise TimeoutError()
+        finally:
+            reader.join(timeout=2)
+        return code
+
+    def _pump(self, stream):
+        # raw reads return whatever is available, so a prompt or progress output
+        # without a newline isn't held back until the line ends
+        decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace"), translate=True)
+        for data in iter(lambda: os.read(stream.fileno(), READ_CHARS), b""):
+            self.emit(decoder.decode(data))
+        self.emit(decoder.decode(b"", final=True))
+        stream.close()
+
+
+def _kill_tree(proc):
+    try:
+        if os.name == "nt":
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except Exception:
+        proc.kill()
+
+
+class CommandRunner:
+    """
+    Bounded thread pool for admin commands, so a slow command never blocks
+    heartbeats or the commands queued behind it.
+
+    submit(command, handler): handler(ctx) -> (success, output) runs on a
+    worker; on_result(command, success, output) is called when it finishes,
+    times out, is cancelled or fails. on_chunk(command_id, seq, text) streams
+    output while it runs; it is called in order from one sender thread, and
+    chunks are dropped (leaving a gap in the live view) while it is
+    MAX_PENDING_CHUNKS behind. Redelivered commands (same id) that are
+    running or just finished are ignored.
+    """
+
+    def __init__(self, on_result, on_chunk=None, max_workers=MAX_WORKERS, default_timeout=DEFAULT_TIMEOUT):
+        self.on_result = on_result
+        self.on_chunk = on_chunk
+        self.default_timeout = default_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="command")
+        self._limit = max_workers + MAX_QUEUED
+        self._lock = threading.Lock()
+        self._active = {}                        # command_id -> CommandContext
+        self._recent = deque(maxlen=RECENT_IDS)  # finished command ids
+        self._chunks = queue.Queue(maxsize=MAX_PENDING_CHUNKS)
+        self._sender = None
+        if on_chunk is not None:
+            self._sender = threading.Thread(target=self._send_chunks, name="command-output", daemon=True)
+            self._sender.start()
+
+    def submit(self, command, handler):
+        command_id = command.get("id", "")
+        try:
+            timeout = float(command.get("timeout") or self.default_timeout)
+        except (TypeError, ValueError):
+            timeout = self.default_timeout
+        ctx = CommandContext(command, timeout, self._queue_chunk if self.on_chunk else None)
+        with self._lock:
+            if command_id and (command_id in self._active or command_id in self._recent):
+                return False
+            if len(self._active) >= self._limit:
+                busy = True
+            else:
+                busy = False
+                self._active[command_id] = ctx
+        if busy:
+            self._report(command, False, "Agent busy: too many commands running")
+            return False
+        self._pool.submit(self._run, ctx, handler)
+        return True
+
+    def cancel(self, command_id):
+        """Stop a running or queued command. Returns False if it isn't active."""
+        with self._lock:
+            ctx = self._active.get(command_id)
+        if ctx is None:
+            return False
+        ctx.cancel_event.set()
+        return True
+
+    def active(self):
+        with self._lock:
+            return list(self._active)
+
+    def shutdown(self):
+        with self._lock:
+            contexts = list(self._active.values())
+        for ctx in contexts:
+            ctx.cancel_event.set()
+        self._pool.shutdown(wait=False)
+        if self._sender is not None:
+            try:
+                self._chunks.put_nowait(None)
+            except queue.Full:
+                pass   # daemon thread; it dies with the process
+
+    def _queue_chunk(self, command_id, seq, text):
+        try:
+            self._chunks.put_nowait((command_id, seq, text))
+        except queue.Full:
+            pass  # backend slow/unreachable: a lost chunk only leaves a gap in the live view
+
+    def _send_chunks(self):
+        while True:
+            item = self._chunks.get()
+            if item is None:
+                return
+            try:
+                self.on_chunk(*item)
+            except Exception:
+                pass
+
+    def _run(self, ctx, handler):
+        try:
+            if ctx.cancelled:
+                raise CommandCancelled()
+            ctx.start()
+            success, output = handler(ctx)
+        except CommandCancelled:
+            success, output = False, ctx.output + "\n[cancelled]"
+        except TimeoutError:
+            success, output = False, ctx.output + f"\n[timed out after {ctx.timeout:.0f}s]"
+        except Exception as e:
+            success, output = False, ctx.output + f"\n[error] {e}"
+        ctx.flush()
+        with self._lock:
+            self._active.pop(ctx.command_id, None)
+            self._recent.append(ctx.command_id)
+        self._report(ctx.command, success, output)
+
+    def _report(self, command, success, output):
+        try:
+            self.on_result(command, success, output)
+        except Exception as e:
+            print("[ERROR] command result callback failed:", e)
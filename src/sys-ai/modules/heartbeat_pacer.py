@@ -0,0 +1,61 @@
+import random
+
+# Bounds for whatever interval the agent ends up using.
+MIN_INTERVAL = 1.0      # seconds
+MAX_BACKOFF = 300.0
+JITTER = 0.2            # +/- 20% on every wait
+MAX_BACKOFF_EXPONENT = 16   # 2**16 x interval is far past MAX_BACKOFF; keeps the float finite
+
+
+class HeartbeatPacer:
+    """
+    Decides how long an agent waits before its next heartbeat.
+
+    - Every wait is jittered so agents that started together drift apart.
+    - Failures back off exponentially (with jitter) up to MAX_BACKOFF.
+    - A successful response may carry the backend's `next_interval` hint, which
+      replaces the configured interval until the next hint (or failure).
+    - A Retry-After from the backend is a floor for the next wait.
+    """
+
+    def __init__(self, interval, jitter=JITTER, max_backoff=MAX_BACKOFF):
+        self.base_interval = float(interval)
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.interval = self.base_interval
+        self.failures = 0
+        self._floor = 0.0
+
+    def initial_delay(self):
+        """Random start offset, so a boot wave doesn't beat in lockstep."""
+        return random.uniform(0, self.base_interval)
+
+    def success(self, hint=None):
+        self.failures = 0
+        self._floor = 0.0
+        try:
+            hint = float(hint) if hint is not None else None
+        except (TypeError, ValueError):
+            hint = None
+        if hint:
+            self.interval = min(max(hint, MIN_INTERVAL), self.max_backoff)
+        else:
+            self.interval = self.base_interval
+
+    def failure(self, retry_after=None):
+        self.failures += 1
+        self._floor = float(retry_after or 0)
+
+    @property
+    def wait(self):
+        """Long-poll wait to request from the backend (no jitter)."""
+        return self.interval
+
+    def next_delay(self):
+        if self.failures:
+            backoff = min(self.max_backoff, self.base_interval * 2 ** min(self.failures, MAX_BACKOFF_EXPONENT))
+            # "equal jitter": keep at least half the backoff, randomize the rest
+            delay = backoff / 2 + random.uniform(0, backoff / 2)
+        else:
+            delay = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(delay, self._floor)
@@ -0,0 +1,142 @@
+import gzip
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Defaults for every client; override per call with timeout=...
+HTTP_TIMEOUT = float(os.environ.get("SYS_AI_HTTP_TIMEOUT", "10"))   # seconds
+HTTP_RETRIES = int(os.environ.get("SYS_AI_HTTP_RETRIES", "3"))
+POOL_SIZE = int(os.environ.get("SYS_AI_HTTP_POOL", "10"))
+COMPRESS_MIN_BYTES = 1024      # smaller JSON bodies are sent as-is
+
+# path segments that are ids, folded into "{id}" for the latency counters
+_ID_SEGMENT = re.compile(r"^(?=.*\d)[0-9A-Za-z_.:-]{8,}$")
+
+
+class HttpClient:
+    """
+    One keep-alive session per backend:
+
+    - pooled connections (HTTPAdapter), so calls reuse TCP/TLS connections
+    - retries with backoff on connect errors, and on 502/503/504 for idempotent
+      methods (a POST is only retried if it never reached the server)
+    - JSON bodies >= COMPRESS_MIN_BYTES are gzip-compressed; gzip responses
+      are accepted and decoded transparently
+    - per-endpoint latency counters (stats())
+    """
+
+    def __init__(self, base_url, headers=None, timeout=HTTP_TIMEOUT, retries=HTTP_RETRIES,
+                 pool_size=POOL_SIZE, compress_min=COMPRESS_MIN_BYTES):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.compress_min = compress_min
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip"})
+        self.session.headers.update(headers or {})
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+
+    # -------------------------------
+    # Requests
+    # -------------------------------
+    def request(self, method, path, json_body=None, data=None, params=None, headers=None,
+                timeout=None, endpoint=None):
+        """
+        path is relative to base_url (or a full URL). json_body is serialized
+        (and compressed when large); data is sent as-is.
+        """
+        url = path if path.startswith(("http://", "https://")) else self.base_url + path
+        headers = dict(headers or {})
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers.setdefault("Content-Type", "application/json")
+            if len(data) >= self.compress_min and "Content-Encoding" not in headers:
+                data = gzip.compress(data, compresslevel=5)
+                headers["Content-Encoding"] = "gzip"
+
+        label = endpoint or self._endpoint(method, path)
+        started = time.perf_counter()
+        ok = False
+        try:
+            r = self.session.request(method, url, data=data, params=params, headers=headers,
+                                     timeout=timeout or self.timeout)
+            ok = r.status_code < 500
+            return r
+        finally:
+            self._record(label, time.perf_counter() - started, ok)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, json=None, **kwargs):
+        return self.request("POST", path, json_body=json, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    # -------------------------------
+    # Latency counters
+    # -------------------------------
+    def _endpoint(self, method, path):
+        path = path.split("?", 1)[0]
+        if path.startswith(("http://", "https://")):
+            path = "/" + path.split("/", 3)[-1]
+        segments = ["{id}" if _ID_SEGMENT.match(s) else s for s in path.split("/")]
+        return f"{method} {'/'.join(segments)}"
+
+    def _record(self, label, seconds, ok):
+        ms = seconds * 1000
+        with self._stats_lock:
+            s = self._stats.get(label)
+            if s is None:
+                s = self._stats[label] = {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+            s["count"] += 1
+            s["errors"] += 0 if ok else 1
+            s["total_ms"] += ms
+            s["max_ms"] = max(s["max_ms"], ms)
+
+    def stats(self):
+        """endpoint -> {count, errors, avg_ms, max_ms}"""
+        with self._stats_lock:
+            return {
+                label: {
+                    "count": s["count"],
+                    "errors": s["errors"],
+                    "avg_ms": round(s["total_ms"] / s["count"], 1),
+                    "max_ms": round(s["max_ms"], 1),
+                }
+                for label, s in self._stats.items()
+            }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url, headers=None, **kwargs):
+    """Process-wide client per (base_url, headers), so every caller shares one pool."""
+    key = (base_url.rstrip("/"), tuple(sorted((headers or {}).items())))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = HttpClient(base_url, headers=headers, **kwargs)
+        return client
@@ -0,0 +1,164 @@
+"""
+Cache and circuit breakers for slow external lookups (public IP / geolocation,
+device inventory) used when tickets are created.
+
+- TTLCache: persistent (SQLite) results keyed by host. A fresh entry is
+  returned as is; a stale one (older than its TTL, younger than MAX_STALE x
+  TTL) is returned at once and refreshed on a background thread. Failed
+  results are cached too, with a shorter negative TTL.
+- CircuitBreaker: after FAILURE_THRESHOLD consecutive failures a provider is
+  skipped for RESET_AFTER seconds, then one trial call decides whether it
+  is back, so a dead provider stops adding its timeout to every ticket.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", ".."))
+LOOKUP_CACHE_DB = os.environ.get("SYS_AI_LOOKUP_CACHE", os.path.join(_REPO_ROOT, "sysai_lookup_cache.db"))
+
+MAX_STALE = 7            # stale entries are served (and refreshed) up to MAX_STALE x ttl
+FAILURE_THRESHOLD = 3
+RESET_AFTER = 300.0      # seconds a tripped breaker stays open
+
+
+class TTLCache:
+    def __init__(self, path: str = LOOKUP_CACHE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS lookup_cache (
+                key        TEXT PRIMARY KEY,
+                value      TEXT NOT NULL,
+                stored_at  REAL NOT NULL,
+                ttl        REAL NOT NULL
+            )
+        """)
+
+    def get(self, key: str):
+        """(value, age, ttl) or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT value, stored_at, ttl FROM lookup_cache WHERE key = ?",
+                                     (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), time.time() - row[1], row[2]
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO lookup_cache (key, value, stored_at, ttl) VALUES (?, ?, ?, ?)",
+                               (key, json.dumps(value), time.time(), ttl))
+
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: float,
+                    negative_ttl: Optional[float] = None,
+                    is_negative: Callable[[Any], bool] = lambda value: value is None) -> Any:
+        """
+        Cached value for key, calling loader() only when there is none or it
+        is too old to serve. Results for which is_negative() is true are
+        kept for negative_ttl (default: ttl) instead.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            value, age, entry_ttl = cached
+            if age < entry_ttl:
+                return value
+            if age < entry_ttl * MAX_STALE:
+                self._refresh_async(key, loader, ttl, negative_ttl, is_negative)
+                return value
+        return self._load(key, loader, ttl, negative_ttl, is_negative)
+
+    def _load(self, key, loader, ttl, negative_ttl, is_negative):
+        value = loader()
+        negative = is_negative(value)
+        self.set(key, value, (negative_ttl or ttl) if negative else ttl)
+        return value
+
+    def _refresh_async(self, key, loader, ttl, negative_ttl, is_negative):
+        # one refresh per key at a time
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._load(key, loader, ttl, negative_ttl, is_negative)
+            except Exception as e:
+                print(f"[ERROR] background refresh of {key} failed:", e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name=f"refresh-{key}", daemon=True).start()
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD, reset_after: float = RESET_AFTER):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+
+    def allow(self) -> bool:
+        """False while open; after reset_after lets exactly one trial call through."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self.opened_at < self.reset_after:
+                return False
+            self._trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Process-wide breaker per provider (e.g. its host name)."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+_cache: Optional[TTLCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> TTLCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TTLCache()
+        return _cache
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from collections import deque
+
+import psutil
+
+# How often the background thread samples, and how much history it keeps.
+SAMPLE_INTERVAL = float(os.environ.get("SYS_AI_SAMPLE_INTERVAL", "1.0"))   # seconds
+SAMPLE_WINDOW = float(os.environ.get("SYS_AI_SAMPLE_WINDOW", "60"))        # seconds
+
+WINDOW_FIELDS = ("cpu_usage", "ram_usage", "disk_usage", "net_sent_bps", "net_recv_bps")
+
+
+class MetricsSampler:
+    """
+    Samples CPU, RAM, disk and network counters on a background thread so
+    callers get an instant snapshot instead of blocking in cpu_percent(interval=1).
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, window=SAMPLE_WINDOW, disk_path=None):
+        self.interval = interval
+        self.disk_path = disk_path or os.path.abspath(os.sep)
+        self._samples = deque(maxlen=max(1, int(window / interval)))
+        self._lock = threading.Lock()
+        self._last_net = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        # cpu_percent(None) measures since the previous call, so prime it once
+        psutil.cpu_percent(interval=None)
+        time.sleep(0.1)
+        self._take_sample()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._take_sample()
+            except Exception:
+                pass
+
+    def _take_sample(self):
+        now = time.time()
+        net = psutil.net_io_counters()
+        sent_bps = recv_bps = 0.0
+        if self._last_net is not None:
+            prev_ts, prev = self._last_net
+            elapsed = max(now - prev_ts, 1e-6)
+            sent_bps = max(0, net.bytes_sent - prev.bytes_sent) / elapsed
+            recv_bps = max(0, net.bytes_recv - prev.bytes_recv) / elapsed
+        self._last_net = (now, net)
+
+        try:
+            disk = psutil.disk_usage(self.disk_path).percent
+        except Exception:
+            disk = 0.0
+
+        sample = {
+            "timestamp": now,
+            "cpu_usage": psutil.cpu_percent(interval=None),
+            "ram_usage": psutil.virtual_memory().percent,
+            "disk_usage": disk,
+            "net_sent_bps": round(sent_bps, 1),
+            "net_recv_bps": round(recv_bps, 1),
+        }
+        with self._lock:
+            self._samples.append(sample)
+
+    def snapshot(self):
+        """
+        Latest sample plus min/avg/max over the window, e.g.
+        {"cpu_usage": 12.5, ..., "window": {"cpu_usage": {"min": .., "avg": .., "max": ..}, ...}}
+        """
+        with self._lock:
+            samples = list(self._samples)
+        if not samples:
+            self._take_sample()
+            with self._lock:
+                samples = list(self._samples)
+
+        latest = dict(samples[-1])
+        latest["window"] = {
+            field: {
+                "min": min(s[field] for s in samples),
+                "avg": round(sum(s[field] for s in samples) / len(samples), 1),
+                "max": max(s[field] for s in samples),
+            }
+            for field in WINDOW_FIELDS
+        }
+        latest["window_seconds"] = round(samples[-1]["timestamp"] - samples[0]["timestamp"], 1)
+        return latest
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    """Process-wide sampler, started on first use."""
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = MetricsSampler()
+            _sampler.start()
+        return _sampler
@@ -0,0 +1,113 @@
+import gzip
+import json
+import sqlite3
+import threading
+import time
+
+# Rows kept on disk while the backend is unreachable; the oldest are dropped first.
+MAX_ROWS = 20000
+REPLAY_BATCH = 500
+MAX_BATCH_BYTES = 4 * 1024 * 1024   # uncompressed JSON per batch; the backend inflates up to 16 MB
+REJECTED = {400, 413, 422}          # the backend will never take this batch as it is
+
+
+class OfflineBuffer:
+    """
+    Bounded on-disk ring buffer for data the agent could not deliver
+    (metrics samples and command results).
+
+    push() appends a record; once MAX_ROWS are stored the oldest are dropped.
+    replay() sends the backlog oldest-first in gzip-compressed batches (at most
+    REPLAY_BATCH rows and MAX_BATCH_BYTES) to /api/agent/batch and deletes
+    each batch only after the backend accepted it. A batch the backend
+    rejects outright (REJECTED) is split, and a single rejected record is
+    dropped, so one bad record can't block the outbox.
+    """
+
+    def __init__(self, path, max_rows=MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind    TEXT NOT NULL,
+                payload TEXT NOT NULL
+            )
+        """)
+
+    def push(self, kind, record):
+        """kind: "metrics" (sample with "timestamp") or "result" (command result)."""
+        with self._lock:
+            self._conn.execute("INSERT INTO outbox (kind, payload) VALUES (?, ?)", (kind, json.dumps(record)))
+            self._conn.execute(
+                "DELETE FROM outbox WHERE seq <= (SELECT MAX(seq) FROM outbox) - ?", (self.max_rows,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def replay(self, post, agent_id, batch_size=REPLAY_BATCH, max_bytes=MAX_BATCH_BYTES):
+        """
+        post(body, headers) -> response (e.g. a requests.post partial).
+        Returns the number of records delivered; stops at the first failure
+        that may be temporary (unreachable, 429, 5xx, ...).
+        """
+        sent = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT seq, kind, payload FROM outbox ORDER BY seq LIMIT ?", (batch_size,)).fetchall()
+            if not rows:
+                return sent
+            # always at least one row, so an oversized record is still tried (and dropped if refused)
+            size, end = 0, 0
+            while end < len(rows) and (end == 0 or size + len(rows[end][2]) <= max_bytes):
+                size += len(rows[end][2])
+                end += 1
+            delivered, ok = self._send(post, agent_id, rows[:end])
+            sent += delivered
+            if not ok:
+                return sent
+
+    def _send(self, post, agent_id, rows):
+        """(records delivered, False if replay should stop for now)."""
+        batch = {"agent_id": agent_id, "metrics": [], "results": []}
+        for _, kind, payload in rows:
+            batch["metrics" if kind == "metrics" else "results"].append(json.loads(payload))
+        body = gzip.compress(json.dumps(batch).encode())
+        try:
+            r = post(body, {"Content-Type": "application/json", "Content-Encoding": "gzip"})
+        except Exception:
+            return 0, False
+        if r.status_code == 200:
+            self._delete(rows)
+            return len(rows), True
+        if r.status_code not in REJECTED:
+            return 0, False
+        if len(rows) == 1:
+            print(f"[WARN] Dropping a buffered {rows[0][1]} record the backend rejected ({r.status_code})")
+            self._delete(rows)
+            return 0, True
+        mid = len(rows) // 2
+        first, ok = self._send(post, agent_id, rows[:mid])
+        if not ok:
+            return first, False
+        second, ok = self._send(post, agent_id, rows[mid:])
+        return first + second, ok
+
+    def _delete(self, rows):
+        # rows are a contiguous run of the seq-ordered outbox
+        with self._lock:
+            self._conn.execute("DELETE FROM outbox WHERE seq BETWEEN ? AND ?", (rows[0][0], rows[-1][0]))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def metrics_sample(metrics, ts=None):
+    """A buffered metrics sample: the heartbeat's metrics plus their timestamp."""
+    return dict(metrics, timestamp=ts or time.time())
@@ -1,10 +1,9 @@
-import psutil
-import shutil
 import subprocess
 import json
 import boto3
 from datetime import datetime, timedelta
 from modules.system_updates import check_pending_updates
+from modules.metrics_sampler import get_sampler
 
 bedrock = boto3.client(service_name="bedrock-runtime", region_name="us-east-1")
 
@@ -38,15 +37,15 @@ def ask_ai(summary_text):
 # 2. PERFORMANCE METRICS
 #############################################
 def get_system_metrics():
-    cpu = psutil.cpu_percent(interval=1)
-    ram = psutil.virtual_memory().percent
-    disk = shutil.disk_usage("C:\\").used * 100 / shutil.disk_usage("C:\\").total
+    # instant snapshot from the background sampler (no 1s block per page render)
+    snap = get_sampler().snapshot()
 
     return {
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "cpu_usage": round(cpu, 1),
-        "ram_usage": round(ram, 1),
-        "disk_usage": round(disk, 1)
+        "cpu_usage": round(snap["cpu_usage"], 1),
+        "ram_usage": round(snap["ram_usage"], 1),
+        "disk_usage": round(snap["disk_usage"], 1),
+        "cpu_window": snap["window"]["cpu_usage"]
     }
 
 #############################################
@@ -1,10 +1,10 @@
-import psutil
 import time
 import json
 import boto3
 import datetime
 import os
 from modules.ticket_classifier import save_ticket  # Reuse your ticket system
+from modules.metrics_sampler import get_sampler
 
 # AWS Bedrock client
 bedrock = boto3.client(service_name="bedrock-runtime", region_name="us-east-1")
@@ -13,16 +13,14 @@ HEALTH_LOG_FILE = "system_health_log.json"
 
 
 def get_system_metrics():
-    """Collects system health metrics (CPU, RAM, Disk)."""
-    cpu_usage = psutil.cpu_percent(interval=1)
-    ram = psutil.virtual_memory()
-    disk = psutil.disk_usage("/")
+    """Collects system health metrics (CPU, RAM, Disk) from the background sampler."""
+    snap = get_sampler().snapshot()
 
     metrics = {
         "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "cpu_usage": cpu_usage,
-        "ram_usage": ram.percent,
-        "disk_usage": disk.percent,
+        "cpu_usage": snap["cpu_usage"],
+        "ram_usage": snap["ram_usage"],
+        "disk_usage": snap["disk_usage"],
     }
     return metrics
 
@@ -117,7 +115,8 @@ def run_health_scan():
             f"AI Suggestion: {suggestion}"
         )
         ticket = save_ticket(issue_desc)
-        print(f"🎟️ Auto Ticket Created: {ticket['ticket_id']} | {ticket['category']}")
+        # category/assignee are filled in by background enrichment a moment later
+        print(f"🎟️ Auto Ticket Created: {ticket['ticket_id']}")
         return metrics, suggestion, ticket
 
     return metrics, suggestion, None
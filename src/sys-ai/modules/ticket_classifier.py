@@ -1,40 +1,42 @@
-import os
-import re
 import json
 import socket
+import sqlite3
 import platform
 import psutil
 import requests
 import getpass
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import urlparse
 
 import boto3
 
 # AWS Bedrock client
 bedrock = boto3.client(service_name="bedrock-runtime", region_name="us-east-1")
+MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
 
-TICKET_FILE = "tickets.json"
+VALID_CATEGORIES = [
+    "Network Issue", "Hardware Issue", "Software Issue",
+    "Authentication Issue", "Performance Issue", "General Support"
+]
+
+# Ticket enrichment runs off the caller's thread: one pool for the per-ticket
+# pipelines, one for the lookups they fan out (kept apart so a full pipeline
+# pool can never wait on lookups queued behind it).
+ENRICH_WORKERS = 4
+_pipeline_pool = ThreadPoolExecutor(max_workers=ENRICH_WORKERS, thread_name_prefix="ticket-enrich")
+_lookup_pool = ThreadPoolExecutor(max_workers=ENRICH_WORKERS * 2, thread_name_prefix="ticket-lookup")
 
 
 # -------------------------------------------------------------
-# 1) 🔢 Generate Incremental Ticket ID
+# 1) 🔢 Ticket storage (SQLite; ticket numbers allocated atomically)
 # -------------------------------------------------------------
-def generate_ticket_id():
-    if os.path.exists(TICKET_FILE) and os.path.getsize(TICKET_FILE) > 0:
-        try:
-            with open(TICKET_FILE, "r", encoding="utf-8") as file:
-                tickets = json.load(file)
-
-            # Find last valid ticket ID
-            for t in reversed(tickets):
-                if re.match(r"INC\d{7}$", t["ticket_id"]):
-                    last_num = int(t["ticket_id"][3:])
-                    return f"INC{last_num + 1:07d}"
-
-        except (json.JSONDecodeError, ValueError):
-            pass
-
-    return "INC0000001"
+try:
+    from modules.ticket_store import get_store
+    from modules.lookup_cache import get_breaker, get_cache
+except ImportError:  # imported from the modules folder
+    from ticket_store import get_store
+    from lookup_cache import get_breaker, get_cache
 
 
 # -------------------------------------------------------------
@@ -51,8 +53,6 @@ def summarize_issue(user_text):
     """
 
     try:
-        model_id = "anthropic.claude-3-sonnet-20240229-v1:0"
-
         prompt = f"""
         Convert the user's message into a short IT issue title.
         Rules:
@@ -84,13 +84,13 @@ def summarize_issue(user_text):
             ]
         })
 
-        response = bedrock.invoke_model(modelId=model_id, body=body)
+        response = bedrock.invoke_model(modelId=MODEL_ID, body=body)
         result = json.loads(response["body"].read())
         return result["content"][0]["text"].strip()
 
     except Exception:
         # Fallback – return first words as title
-        return user_text.split(".")[0][:50]
+        return quick_title(user_text)
 
 
 # -------------------------------------------------------------
@@ -98,8 +98,6 @@ def summarize_issue(user_text):
 # -------------------------------------------------------------
 def classify_ticket(issue_text):
     try:
-        model_id = "anthropic.claude-3-sonnet-20240229-v1:0"
-
         body = json.dumps({
             "anthropic_version": "bedrock-2023-05-31",
             "max_tokens": 30,
@@ -113,55 +111,154 @@ def classify_ticket(issue_text):
             ]
         })
 
-        response = bedrock.invoke_model(modelId=model_id, body=body)
+        response = bedrock.invoke_model(modelId=MODEL_ID, body=body)
         raw_output = json.loads(response["body"].read())["content"][0]["text"].strip()
+        return match_category(raw_output) or "General Support"
 
-        valid = [
-            "Network Issue", "Hardware Issue", "Software Issue",
-            "Authentication Issue", "Performance Issue", "General Support"
-        ]
-        for v in valid:
-            if v.lower() in raw_output.lower():
-                return v
-
+    except Exception:
         return "General Support"
 
+
+def match_category(text):
+    """The first valid category named in the model's answer, or None."""
+    for v in VALID_CATEGORIES:
+        if v.lower() in str(text).lower():
+            return v
+    return None
+
+
+# Cheap local guess, used for the placeholder ticket and when the model is unavailable
+CATEGORY_KEYWORDS = {
+    "Network Issue": ("network", "wifi", "wi-fi", "internet", "vpn", "dns", "ethernet", "connectivity"),
+    "Authentication Issue": ("login", "log in", "password", "locked out", "authentication", "sign in", "mfa"),
+    "Performance Issue": ("slow", "lag", "hang", "freez", "cpu", "ram", "memory", "performance"),
+    "Hardware Issue": ("boot", "hot", "heat", "battery", "keyboard", "mouse", "touchpad", "trackpad",
+                       "screen", "monitor", "printer", "hardware"),
+    "Software Issue": ("install", "software", "office", "teams", "outlook", "crash", "update",
+                       "application", "app ", "not opening"),
+}
+
+
+def guess_category(text):
+    text = str(text).lower()
+    for category, words in CATEGORY_KEYWORDS.items():
+        if any(w in text for w in words):
+            return category
+    return "General Support"
+
+
+def quick_title(user_text):
+    """Title without a model call: the first sentence, shortened."""
+    return user_text.split(".")[0][:50]
+
+
+# -------------------------------------------------------------
+# 3b) 🧠🎯 Title + Category in one model call
+# -------------------------------------------------------------
+def analyze_issue(user_text):
+    """
+    (title, category) from a single Bedrock round trip instead of
+    summarize_issue() followed by classify_ticket().
+    """
+    try:
+        prompt = f"""
+        Read the user's IT problem and answer with JSON only, no other text:
+        {{"title": "<3-6 word issue title>", "category": "<one of: {', '.join(VALID_CATEGORIES)}>"}}
+
+        Title rules: pure issue name, no sentences, suggestions or greetings.
+        Examples: "Network Connectivity Issue", "System Heating Issue", "Authentication Issue".
+
+        User: {user_text}
+        """
+
+        body = json.dumps({
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": 80,
+            "messages": [
+                {"role": "user", "content": [{"type": "text", "text": prompt}]}
+            ]
+        })
+
+        response = bedrock.invoke_model(modelId=MODEL_ID, body=body)
+        raw_output = json.loads(response["body"].read())["content"][0]["text"].strip()
+        # tolerate text around the JSON object
+        parsed = json.loads(raw_output[raw_output.index("{"):raw_output.rindex("}") + 1])
+        title = str(parsed.get("title") or "").strip() or quick_title(user_text)
+        category = match_category(parsed.get("category")) or guess_category(user_text)
+        return title, category
+
     except Exception:
-        return "General Support"
+        return quick_title(user_text), guess_category(user_text)
 
 
 # -------------------------------------------------------------
 # 4) 🌍 Detect User Location (IP-based)
 # -------------------------------------------------------------
+# Public IP / location and the device inventory barely change: both are
+# cached per host (modules/lookup_cache.py), failures for a shorter time.
+LOCATION_TTL = 24 * 3600
+LOCATION_NEGATIVE_TTL = 300
+DEVICE_INFO_TTL = 3600
+DEVICE_INFO_NEGATIVE_TTL = 60
+LOOKUP_TIMEOUT = 5
+
+
 def get_user_location():
     """
     Multi-provider lookup for stable user location.
     Always returns a readable city/region/country.
     """
+    try:
+        return get_cache().get_or_load(
+            f"location:{socket.gethostname()}", _lookup_user_location,
+            ttl=LOCATION_TTL, negative_ttl=LOCATION_NEGATIVE_TTL,
+            is_negative=lambda location: location == "Unknown",
+        )
+    except sqlite3.Error:
+        return _lookup_user_location()
 
-    def fetch_json(url):
-        try:
-            return requests.get(url, timeout=5).json()
-        except Exception:
-            return None
 
-    # ---------------------------
-    # 1) Try ipify (IPv4 only)
-    # ---------------------------
+def _provider_call(url, parse):
+    """
+    parse(response) -> value. An error or empty value counts against the
+    provider's circuit breaker; while it is open the provider is skipped.
+    """
+    breaker = get_breaker(urlparse(url).netloc)
+    if not breaker.allow():
+        return None
     try:
-        ip_data = fetch_json("https://api.ipify.org?format=json")
-        ip = ip_data.get("ip") if ip_data else None
+        r = requests.get(url, timeout=LOOKUP_TIMEOUT)
+        r.raise_for_status()
+        value = parse(r)
     except Exception:
-        ip = None
-
-    # If still no IP, try 2nd provider
-    if not ip:
-        try:
-            ipv4 = fetch_json("https://ipv4.icanhazip.com")
-            if ipv4:
-                ip = ipv4.strip()
-        except Exception:
-            ip = None
+        value = None
+    if value:
+        breaker.success()
+    else:
+        breaker.failure()
+    return value
+
+
+def _location_from(data):
+    # Unified fields from different providers
+    if not isinstance(data, dict):
+        return None
+    return (
+        data.get("city")
+        or data.get("region")
+        or data.get("country")
+        or data.get("country_name")
+        or (data.get("location") or {}).get("city")
+        or None
+    )
+
+
+def _lookup_user_location():
+    # ---------------------------
+    # 1) Try ipify (IPv4 only), then icanhazip (plain text)
+    # ---------------------------
+    ip = (_provider_call("https://api.ipify.org?format=json", lambda r: r.json().get("ip"))
+          or _provider_call("https://ipv4.icanhazip.com", lambda r: r.text.strip()))
 
     # If still no IP — last fallback
     if not ip:
@@ -179,34 +276,31 @@ def get_user_location():
         "https://ipwho.is/",
     ]
 
-    location = None
     for url in providers:
         if not url:
             continue
-        data = fetch_json(url)
-        if not data:
-            continue
-
-        # Unified fields from different providers
-        location = (
-            data.get("city")
-            or data.get("region")
-            or data.get("country")
-            or data.get("country_name")
-            or data.get("location", {}).get("city")
-            or None
-        )
-
+        location = _provider_call(url, lambda r: _location_from(r.json()))
         if location:
-            break
+            return location
 
-    return location or "Unknown"
+    return "Unknown"
 
 
 # -------------------------------------------------------------
 # 5) 💻 Collect Device Information
 # -------------------------------------------------------------
 def collect_device_info():
+    try:
+        return get_cache().get_or_load(
+            f"device_info:{socket.gethostname()}", _scan_device_info,
+            ttl=DEVICE_INFO_TTL, negative_ttl=DEVICE_INFO_NEGATIVE_TTL,
+            is_negative=lambda info: "error" in info,
+        )
+    except sqlite3.Error:
+        return _scan_device_info()
+
+
+def _scan_device_info():
     try:
         return {
             "os": platform.system(),
@@ -226,48 +320,59 @@ def collect_device_info():
 # -------------------------------------------------------------
 # 6) 💾 Save Ticket
 # -------------------------------------------------------------
-def save_ticket(user_text):
-    ticket_id = generate_ticket_id()
-    username = getpass.getuser().capitalize()
-    hostname = socket.gethostname()
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    location = get_user_location()
-    device_info = collect_device_info()
-
-    summarized_issue = summarize_issue(user_text)
-    category = classify_ticket(summarized_issue)
-
-    # Convert device info dict → pretty JSON string (fixes [object Object])
-    device_info_str = json.dumps(device_info, indent=2)
+def save_ticket(user_text, wait=0):
+    """
+    Write the ticket at once with a quick title and keyword category, then
+    enrich it in the background: location and device info are looked up in
+    parallel with one combined title+category model call, and the ticket is
+    updated when all three are in.
 
+    wait: seconds to wait for the enrichment; the enriched ticket is returned
+    if it finishes in time, otherwise the placeholder.
+    """
     new_ticket = {
-        "ticket_id": ticket_id,
-        "username": username,
-        "issue": summarized_issue,
-        "category": category,
+        "username": getpass.getuser().capitalize(),
+        "issue": quick_title(user_text),
+        "category": guess_category(user_text),
         "status": "unresolved",
         "assigned_to": "L1",
-        "hostname": hostname,
-        "location": location,
-        "timestamp": timestamp,
-        "device_info": device_info_str   # 🔥 FIXED!
+        "hostname": socket.gethostname(),
+        "location": "Pending",
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "device_info": "",
     }
 
-    # Load / append
-    tickets = []
-    if os.path.exists(TICKET_FILE) and os.path.getsize(TICKET_FILE) > 0:
+    # the INC number is allocated in the same transaction as the insert
+    ticket = get_store().create(new_ticket)
+    future = _pipeline_pool.submit(_enrich_ticket, ticket["ticket_id"], user_text)
+    if wait:
         try:
-            with open(TICKET_FILE, "r") as f:
-                tickets = json.load(f)
-        except json.JSONDecodeError:
-            tickets = []
+            ticket.update(future.result(timeout=wait))
+        except Exception:
+            pass  # still running (or failed): the placeholder stands for now
+    return ticket
 
-    tickets.append(new_ticket)
 
-    with open(TICKET_FILE, "w") as f:
-        json.dump(tickets, f, indent=4)
+def _enrich_ticket(ticket_id, user_text):
+    location = _lookup_pool.submit(get_user_location)
+    device_info = _lookup_pool.submit(collect_device_info)
+    title, category = analyze_issue(user_text)   # runs while the lookups are in flight
 
-    return new_ticket
+    fields = {"issue": title, "category": category}
+    try:
+        fields["location"] = location.result()
+    except Exception:
+        fields["location"] = "Unknown"
+    try:
+        # Convert device info dict → pretty JSON string (fixes [object Object])
+        fields["device_info"] = json.dumps(device_info.result(), indent=2)
+    except Exception as e:
+        fields["device_info"] = json.dumps({"error": str(e)})
+    try:
+        get_store().update(ticket_id, **fields)
+    except Exception as e:
+        print(f"[ERROR] ticket enrichment for {ticket_id} failed:", e)
+    return fields
 
 
 # -------------------------------------------------------------
@@ -278,5 +383,5 @@ if __name__ == "__main__":
         issue = input("Describe your issue: ")
         if issue.lower() == "exit":
             break
-        t = save_ticket(issue)
+        t = save_ticket(issue, wait=30)
         print("\nCreated ticket:", t)
@@ -0,0 +1,401 @@
+"""
+Ticket storage.
+
+Tickets live in one SQLite table (WAL) instead of tickets.json:
+- The ticket number is the table's AUTOINCREMENT key, allocated inside the
+  insert's transaction, so concurrent callers (portal, chatbot, monitors)
+  never get the same INC number and nothing is re-read or rewritten per ticket.
+- The legacy tickets.json files (repo root and src/sys-ai, depending on the
+  directory the app was started from) are imported once. Tickets whose
+  number is already taken are renumbered; the old number is kept as legacy_id.
+- Edits are applied as targeted updates by ticket_id (update_many(): one
+  transaction per batch); every status transition is recorded in
+  ticket_status_history with who made it and when.
+- The admin portal reads one page at a time (query()): status, category,
+  username, hostname and timestamp are indexed, per-status counts are kept
+  by triggers (status_counts()) and text search uses an FTS5 index, or LIKE
+  when the SQLite build has no FTS5.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", ".."))
+
+TICKETS_DB = os.environ.get("SYS_AI_TICKETS_DB", os.path.join(_REPO_ROOT, "sysai_tickets.db"))
+LEGACY_TICKET_FILES = (
+    os.path.join(_REPO_ROOT, "tickets.json"),
+    os.path.join(_REPO_ROOT, "src", "sys-ai", "tickets.json"),
+)
+
+TICKET_PREFIX = "INC"
+TICKET_ID_RE = re.compile(r"INC(\d{7})$")
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Listing filters / sort keys (ticket_id sorts by number).
+INDEXED_FIELDS = ("status", "category", "username", "hostname", "timestamp")
+SORT_COLUMNS = {"ticket_id": "seq", **{f: f for f in INDEXED_FIELDS}}
+SEARCH_FIELDS = ("issue", "category", "username", "hostname")
+MAX_PAGE_SIZE = 500
+SQL_VARIABLES = 500     # ids per IN (...) lookup, below SQLite's parameter limit
+
+# Stored as columns; any other key is kept in the row's `extra` JSON.
+TICKET_FIELDS = ("username", "issue", "category", "status", "assigned_to",
+                 "hostname", "location", "timestamp", "device_info", "legacy_id")
+
+
+def format_ticket_id(seq: int) -> str:
+    return f"{TICKET_PREFIX}{seq:07d}"
+
+
+def _created_at(ticket: Dict[str, Any]) -> Optional[float]:
+    try:
+        return time.mktime(datetime.strptime(ticket["timestamp"], TIMESTAMP_FORMAT).timetuple())
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class TicketStore:
+    def __init__(self, path: str = TICKETS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        # timeout: other processes (portal, monitors) may hold the write lock briefly
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f"{f} TEXT" for f in TICKET_FIELDS)
+        self._conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS tickets (
+                seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+                ticket_id  TEXT UNIQUE,
+                created_at REAL,
+                {columns},
+                extra      TEXT
+            );
+            CREATE TABLE IF NOT EXISTS migrations (
+                name       TEXT PRIMARY KEY,
+                applied_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS ticket_status_history (
+                id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                ticket_id  TEXT NOT NULL,
+                old_status TEXT,
+                new_status TEXT,
+                changed_at REAL NOT NULL,
+                changed_by TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_status_history_ticket ON ticket_status_history (ticket_id, changed_at);
+        """)
+        self._fts = False
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._ensure_query_schema()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _ensure_query_schema(self):
+        """Indexes, status counters and the search index (built once per database)."""
+        for field in INDEXED_FIELDS:
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_tickets_{field} ON tickets ({field}, seq)")
+
+        def exists(kind, name):
+            return self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = ? AND name = ?",
+                                      (kind, name)).fetchone() is not None
+
+        if not exists("trigger", "tickets_count_insert"):
+            # NULL status is counted under ''
+            for sql in (
+                "CREATE TABLE IF NOT EXISTS ticket_status_counts (status TEXT PRIMARY KEY, n INTEGER NOT NULL)",
+                """CREATE TRIGGER tickets_count_insert AFTER INSERT ON tickets BEGIN
+                     INSERT OR IGNORE INTO ticket_status_counts (status, n) VALUES (COALESCE(NEW.status, ''), 0);
+                     UPDATE ticket_status_counts SET n = n + 1 WHERE status = COALESCE(NEW.status, '');
+                   END""",
+                """CREATE TRIGGER tickets_count_delete AFTER DELETE ON tickets BEGIN
+                     UPDATE ticket_status_counts SET n = n - 1 WHERE status = COALESCE(OLD.status, '');
+                   END""",
+                """CREATE TRIGGER tickets_count_update AFTER UPDATE OF status ON tickets
+                   WHEN OLD.status IS NOT NEW.status BEGIN
+                     UPDATE ticket_status_counts SET n = n - 1 WHERE status = COALESCE(OLD.status, '');
+                     INSERT OR IGNORE INTO ticket_status_counts (status, n) VALUES (COALESCE(NEW.status, ''), 0);
+                     UPDATE ticket_status_counts SET n = n + 1 WHERE status = COALESCE(NEW.status, '');
+                   END""",
+                "DELETE FROM ticket_status_counts",
+                """INSERT INTO ticket_status_counts (status, n)
+                   SELECT COALESCE(status, ''), COUNT(*) FROM tickets GROUP BY COALESCE(status, '')""",
+            ):
+                self._conn.execute(sql)
+
+        if exists("table", "tickets_fts"):
+            self._fts = True
+            return
+        columns = ", ".join(SEARCH_FIELDS)
+        new = ", ".join(f"NEW.{f}" for f in SEARCH_FIELDS)
+        old = ", ".join(f"OLD.{f}" for f in SEARCH_FIELDS)
+        try:
+            self._conn.execute(f"CREATE VIRTUAL TABLE tickets_fts USING fts5({columns}, "
+                               f"content='tickets', content_rowid='seq')")
+        except sqlite3.OperationalError:
+            return   # no FTS5 in this SQLite build: query() falls back to LIKE
+        for sql in (
+            f"""CREATE TRIGGER tickets_fts_insert AFTER INSERT ON tickets BEGIN
+                  INSERT INTO tickets_fts (rowid, {columns}) VALUES (NEW.seq, {new});
+                END""",
+            f"""CREATE TRIGGER tickets_fts_delete AFTER DELETE ON tickets BEGIN
+                  INSERT INTO tickets_fts (tickets_fts, rowid, {columns}) VALUES ('delete', OLD.seq, {old});
+                END""",
+            f"""CREATE TRIGGER tickets_fts_update AFTER UPDATE OF {columns} ON tickets BEGIN
+                  INSERT INTO tickets_fts (tickets_fts, rowid, {columns}) VALUES ('delete', OLD.seq, {old});
+                  INSERT INTO tickets_fts (rowid, {columns}) VALUES (NEW.seq, {new});
+                END""",
+            "INSERT INTO tickets_fts (tickets_fts) VALUES ('rebuild')",
+        ):
+            self._conn.execute(sql)
+        self._fts = True
+
+    # -------------------------------
+    # rows <-> ticket dicts
+    # -------------------------------
+    def _row(self, row) -> Dict[str, Any]:
+        ticket = {"ticket_id": row[0]}
+        for field, value in zip(TICKET_FIELDS, row[1:-1]):
+            if value is not None:
+                ticket[field] = value
+        if row[-1]:
+            ticket.update(json.loads(row[-1]))
+        return ticket
+
+    _SELECT = f"SELECT ticket_id, {', '.join(TICKET_FIELDS)}, extra FROM tickets"
+
+    def _insert_locked(self, ticket: Dict[str, Any], seq: Optional[int] = None,
+                       created_at: Optional[float] = None) -> Dict[str, Any]:
+        """Insert inside the caller's transaction; seq=None takes the next number."""
+        extra = {k: v for k, v in ticket.items() if k not in TICKET_FIELDS and k != "ticket_id"}
+        # nested values (older tickets stored device_info as an object) become JSON text
+        values = [json.dumps(v) if isinstance(v, (dict, list)) else v
+                  for v in (ticket.get(f) for f in TICKET_FIELDS)]
+        cur = self._conn.execute(
+            f"INSERT INTO tickets (seq, created_at, {', '.join(TICKET_FIELDS)}, extra) "
+            f"VALUES (?, ?, {', '.join('?' for _ in TICKET_FIELDS)}, ?)",
+            [seq, _created_at(ticket) or created_at] + values + [json.dumps(extra) if extra else None],
+        )
+        ticket_id = format_ticket_id(cur.lastrowid)
+        self._conn.execute("UPDATE tickets SET ticket_id = ? WHERE seq = ?", (ticket_id, cur.lastrowid))
+        return {"ticket_id": ticket_id, **{k: v for k, v in ticket.items() if k != "ticket_id"}}
+
+    # -------------------------------
+    # API
+    # -------------------------------
+    def create(self, ticket: Dict[str, Any]) -> Dict[str, Any]:
+        """Store a new ticket and return it with its allocated ticket_id."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                created = self._insert_locked(ticket, created_at=time.time())
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return created
+
+    def get(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(f"{self._SELECT} WHERE ticket_id = ?", (ticket_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def all(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(f"{self._SELECT} ORDER BY seq").fetchall()
+        return [self._row(r) for r in rows]
+
+    def update(self, ticket_id: str, changed_by: Optional[str] = None, **fields) -> bool:
+        """Set column fields (status, username, ...) on one ticket."""
+        return self.update_many({ticket_id: fields}, changed_by) > 0
+
+    def update_many(self, changes: Dict[str, Dict[str, Any]], changed_by: Optional[str] = None) -> int:
+        """
+        Apply {ticket_id: {field: value}} in one transaction and return how many
+        tickets changed. Tickets with the same set of changed fields share one
+        executemany; status transitions go to ticket_status_history.
+        """
+        changes = {tid: {k: v for k, v in fields.items() if k in TICKET_FIELDS}
+                   for tid, fields in changes.items()}
+        changes = {tid: fields for tid, fields in changes.items() if fields}
+        if not changes:
+            return 0
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = list(changes)
+                old_status = {}
+                for i in range(0, len(ids), SQL_VARIABLES):
+                    chunk = ids[i:i + SQL_VARIABLES]
+                    old_status.update(self._conn.execute(
+                        f"SELECT ticket_id, status FROM tickets WHERE ticket_id IN ({', '.join('?' for _ in chunk)})",
+                        chunk).fetchall())
+
+                groups: Dict[Tuple[str, ...], List[List[Any]]] = {}
+                history = []
+                for tid, fields in changes.items():
+                    if tid not in old_status:
+                        continue
+                    names = tuple(sorted(fields))
+                    groups.setdefault(names, []).append([fields[n] for n in names] + [tid])
+                    if "status" in fields and fields["status"] != old_status[tid]:
+                        history.append((tid, old_status[tid], fields["status"], now, changed_by))
+                for names, rows in groups.items():
+                    assignments = ", ".join(f"{n} = ?" for n in names)
+                    self._conn.executemany(f"UPDATE tickets SET {assignments} WHERE ticket_id = ?", rows)
+                if history:
+                    self._conn.executemany(
+                        "INSERT INTO ticket_status_history (ticket_id, old_status, new_status, changed_at, changed_by) "
+                        "VALUES (?, ?, ?, ?, ?)", history)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return sum(len(rows) for rows in groups.values())
+
+    def status_history(self, ticket_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Newest status transitions, for one ticket or all of them."""
+        clause, params = ("WHERE ticket_id = ? ", [ticket_id]) if ticket_id else ("", [])
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ticket_id, old_status, new_status, changed_at, changed_by FROM ticket_status_history "
+                f"{clause}ORDER BY id DESC LIMIT ?", params + [limit]).fetchall()
+        return [dict(zip(("ticket_id", "old_status", "new_status", "changed_at", "changed_by"), r)) for r in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
+
+    def status_counts(self) -> Dict[str, int]:
+        """{status: tickets}, from the trigger-maintained counters (no table scan)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, n FROM ticket_status_counts WHERE n > 0").fetchall()
+        return dict(rows)
+
+    def query(self, status: Optional[str] = None, category: Optional[str] = None,
+              username: Optional[str] = None, hostname: Optional[str] = None,
+              search: Optional[str] = None, sort: str = "ticket_id", descending: bool = True,
+              limit: int = 50, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        One page of tickets matching every given filter, plus the total number
+        of matches. Filters are exact matches; search is a word-prefix text
+        search over issue, category, username and hostname.
+        """
+        where, params = [], []
+        for field, value in (("status", status), ("category", category),
+                             ("username", username), ("hostname", hostname)):
+            if value is not None:
+                where.append(f"{field} = ?")
+                params.append(value)
+        if search and re.search(r"\w", search):
+            if self._fts:
+                where.append("seq IN (SELECT rowid FROM tickets_fts WHERE tickets_fts MATCH ?)")
+                params.append(_fts_query(search))
+            else:
+                # same semantics without FTS5: every word, anywhere in a search field
+                for word in re.findall(r"\w+", search):
+                    where.append("(" + " OR ".join(f"{f} LIKE ? ESCAPE '\\'" for f in SEARCH_FIELDS) + ")")
+                    params.extend(["%" + word.replace("_", "\\_") + "%"] * len(SEARCH_FIELDS))
+        clause = f" WHERE {' AND '.join(where)}" if where else ""
+        column = SORT_COLUMNS.get(sort, "seq")
+        direction = "DESC" if descending else "ASC"
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"{self._SELECT}{clause} ORDER BY {column} {direction}, seq {direction} LIMIT ? OFFSET ?",
+                params + [limit, max(0, int(offset))],
+            ).fetchall()
+            if not where:
+                total = self._conn.execute("SELECT COALESCE(SUM(n), 0) FROM ticket_status_counts").fetchone()[0]
+            elif where == ["status = ?"]:
+                row = self._conn.execute("SELECT n FROM ticket_status_counts WHERE status = ?", params).fetchone()
+                total = row[0] if row else 0
+            else:
+                total = self._conn.execute(f"SELECT COUNT(*) FROM tickets{clause}", params).fetchone()[0]
+        return [self._row(r) for r in rows], total
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # -------------------------------
+    # one-shot import of tickets.json
+    # -------------------------------
+    def migrate_json(self, json_paths: Iterable[str] = LEGACY_TICKET_FILES) -> int:
+        """
+        Import legacy tickets.json files (each at most once). Tickets keep their
+        INC number when it is free; the rest are renumbered after the highest
+        number in use, in file order.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                imported = self._migrate_locked(json_paths)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return imported
+
+    def _migrate_locked(self, json_paths) -> int:
+        pending = []
+        for path in json_paths:
+            name = f"tickets_json:{os.path.abspath(path)}"
+            if self._conn.execute("SELECT 1 FROM migrations WHERE name = ?", (name,)).fetchone():
+                continue
+            legacy = []
+            if os.path.exists(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        legacy = json.load(f)
+                except (OSError, ValueError):
+                    legacy = []
+            pending.extend(t for t in legacy if isinstance(t, dict))
+            self._conn.execute("INSERT INTO migrations (name, applied_at) VALUES (?, ?)", (name, time.time()))
+
+        # first pass keeps free numbers, so renumbering never steals one
+        renumber = []
+        for ticket in pending:
+            match = TICKET_ID_RE.match(str(ticket.get("ticket_id", "")))
+            seq = int(match.group(1)) if match else None
+            if seq and not self._conn.execute("SELECT 1 FROM tickets WHERE seq = ?", (seq,)).fetchone():
+                self._insert_locked(ticket, seq)
+            else:
+                renumber.append(ticket)
+        for ticket in renumber:
+            legacy_id = ticket.get("ticket_id")
+            self._insert_locked(dict(ticket, legacy_id=legacy_id) if legacy_id else ticket)
+        return len(pending)
+
+
+def _fts_query(text: str) -> str:
+    """User text -> FTS5 query: every word must match as a prefix."""
+    words = re.findall(r"\w+", text)
+    return " ".join('"' + w + '"*' for w in words)
+
+
+_store: Optional[TicketStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> TicketStore:
+    """Process-wide store; imports the legacy tickets.json files on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            store = TicketStore()
+            store.migrate_json()
+            _store = store
+        return _store
@@ -1,15 +1,16 @@
 # sys_agent/agent.py
-import requests
-import platform
-import psutil
-import socket
 import time
 import subprocess
-import json
 import os
-import uuid
+import sys
 import webbrowser
 
+# shared agent libraries live in src/sys-ai/modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "sys-ai"))
+from modules.http_client import get_client
+from modules.command_runner import CommandCancelled
+from modules.agent_core import AgentSession, SingleInstance, get_agent_id
+
 def launch_quick_assist():
     """
     Launch Quick Assist (Store version + Win32 version support)
@@ -56,93 +57,24 @@ def launch_quick_assist():
 # configure your backend url here
 BACKEND_URL = "http://172.16.1.41:8000"   # change as needed
 
-# ---------------------------------------------------
-# Unique persistent agent id per machine
-# ---------------------------------------------------
-def get_agent_id():
-    agent_file = "agent_id.txt"
-    if not os.path.exists(agent_file):
-        hostname = platform.node()
-        unique = str(uuid.uuid4()).split("-")[0]
-        agent_id = f"INL-{hostname}-{unique}"
-        with open(agent_file, "w") as f:
-            f.write(agent_id)
-        return agent_id
-    return open(agent_file, "r").read().strip()
-
-AGENT_ID = get_agent_id()
+# pooled keep-alive session with retries, gzip and latency counters
+http = get_client(BACKEND_URL)
 
-# ---------------------------------------------------
-# Real LAN IP detection (works in most networks)
-# ---------------------------------------------------
-def get_real_ip():
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-        s.close()
-        return ip
-    except:
-        return "0.0.0.0"
+# seconds between heartbeats; /api/agent/sync also long-polls for this long,
+# so commands still arrive immediately. The backend may adjust it per response
+# (next_interval); waits are jittered and failures back off exponentially.
+HEARTBEAT_INTERVAL = 5
 
-# ---------------------------------------------------
-# metrics and device info
-# ---------------------------------------------------
-def collect_metrics():
-    return {
-        "cpu_usage": psutil.cpu_percent(interval=1),
-        "ram_usage": psutil.virtual_memory().percent,
-        "disk_usage": psutil.disk_usage(os.path.abspath(os.sep)).percent
-    }
-
-def collect_device_info():
-    try:
-        proc = platform.processor()
-    except:
-        proc = "Unknown"
-    return {
-        "hostname": platform.node(),
-        "manufacturer": platform.machine(),
-        "processor": proc,
-        "platform": platform.platform(),
-        "boot_time": psutil.boot_time()
-    }
-
-# ---------------------------------------------------
-# send update
-# ---------------------------------------------------
-def send_update():
-    try:
-        ip = get_real_ip()  # or existing ip detection
-    except Exception:
-        ip = "0.0.0.0"
-
-    payload = {
-        "agent_id": AGENT_ID,
-        "hostname": platform.node(),
-        "username": os.environ.get("USERNAME", "unknown"),
-        "os": platform.platform(),
-        "ip_address": ip,
-        "metrics": collect_metrics(),
-        "device_info": collect_device_info()
-    }
-
-    try:
-        r = requests.post(f"{BACKEND_URL}/api/agent/update", json=payload, timeout=5)
-        if r.status_code == 200:
-            print("[INFO] Agent info updated")
-            return True
-        else:
-            print(f"[WARN] Registration returned {r.status_code} / {r.text}")
-            return False
-    except Exception as e:
-        print("[ERROR] Update failed:", e)
-        return False
+# INL-<hostname>-<machine hash>: stable no matter which directory the agent
+# is started from (shared with the Windows service)
+AGENT_ID = get_agent_id()
 
 # ---------------------------------------------------
 # run commands (from admin)
 # ---------------------------------------------------
-def run_command(cmd):
+def run_command(ctx):
+    """Runs on a CommandRunner worker; ctx carries the command, timeout and cancellation."""
+    cmd = ctx.command
     try:
         ctype = cmd.get("type")
         if ctype == "shutdown":
@@ -155,67 +87,50 @@ def run_command(cmd):
             success, msg = launch_quick_assist()
             return success, msg
         if ctype == "cmd":
-            result = subprocess.getoutput(cmd.get("command", ""))
-            return True, result
+            # output is streamed to the backend while it runs
+            code = ctx.run(cmd.get("command", ""), shell=True)
+            return code == 0, ctx.output
         return False, "Unknown command type"
+    except (TimeoutError, CommandCancelled):
+        raise
     except Exception as e:
         return False, str(e)
 
-# ---------------------------------------------------
-# send command response to backend
-# ---------------------------------------------------
-def send_command_response(cmd_id, success, output):
-    payload = {
-        "agent_id": AGENT_ID,
-        "command_id": cmd_id,
-        "output": output,
-        "success": success
-    }
-    try:
-        requests.post(f"{BACKEND_URL}/api/agent/command_response", json=payload, timeout=5)
-    except Exception as e:
-        print("[ERROR] send_command_response failed:", e)
-
-# ---------------------------------------------------
-# poll backend for commands
-# ---------------------------------------------------
-def poll_commands():
-    try:
-        r = requests.get(f"{BACKEND_URL}/api/agent/commands/{AGENT_ID}", timeout=5)
-        commands = r.json().get("commands", [])
-        for cmd in commands:
-            print(f"[COMMAND] Received: {cmd}")
-            success, output = run_command(cmd)
-            send_command_response(cmd.get("id", ""), success, output)
-    except Exception as e:
-        print("[ERROR] Poll failed:", e)
+# sync loop, outbox, results and output streaming (shared with the Windows service)
+session = AgentSession(http, AGENT_ID, run_command, HEARTBEAT_INTERVAL)
 
 # ---------------------------------------------------
 # main
 # ---------------------------------------------------
 if __name__ == "__main__":
+    # one agent per machine: the console agent and the service share this lock
+    instance = SingleInstance()
+    if not instance.acquire():
+        print(f"[ERROR] Another SysAI agent is already running on this machine (lock: {instance.path})")
+        sys.exit(1)
     print(f"[INFO] Starting SysAI Agent (agent_id={AGENT_ID})")
     browser_opened_flag = os.path.join(os.path.dirname(__file__), ".opened_browser")
 
+    def open_portal(updated):
+        # If registration/update succeeded and browser not opened yet, open demo URL
+        try:
+            if updated and not os.path.exists(browser_opened_flag):
+                # Build URL to Streamlit app on admin machine (adjust port if needed)
+                streamlit_url = f"http://172.16.1.41:8501/?agent_id={AGENT_ID}"
+                print(f"[INFO] Opening streamlit URL in default browser: {streamlit_url}")
+                try:
+                    webbrowser.open(streamlit_url, new=2)  # open new tab if possible
+                    # create flag file to avoid repeated opens
+                    open(browser_opened_flag, "w").write(str(time.time()))
+                except Exception as e:
+                    print("[WARN] Could not open browser automatically:", e)
+        except Exception:
+            pass
+
     try:
-        while True:
-            updated = send_update()
-            # If registration/update succeeded and browser not opened yet, open demo URL
-            try:
-                if updated and not os.path.exists(browser_opened_flag):
-                    # Build URL to Streamlit app on admin machine (adjust port if needed)
-                    streamlit_url = f"http://172.16.1.41:8501/?agent_id={AGENT_ID}"
-                    print(f"[INFO] Opening streamlit URL in default browser: {streamlit_url}")
-                    try:
-                        webbrowser.open(streamlit_url, new=2)  # open new tab if possible
-                        # create flag file to avoid repeated opens
-                        open(browser_opened_flag, "w").write(str(time.time()))
-                    except Exception as e:
-                        print("[WARN] Could not open browser automatically:", e)
-            except Exception:
-                pass
-
-            poll_commands()
-            time.sleep(5)
+        session.run(on_beat=open_portal)
     except KeyboardInterrupt:
         print("[INFO] Agent stopped by user")
+    finally:
+        session.stop()
+        instance.release()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# backend is imported as a package from the repo root; the agent/portal
+# modules import each other from src/sys-ai/modules (as agent_service.py does)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src", "sys-ai", "modules"))
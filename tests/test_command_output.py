@@ -0,0 +1,67 @@
+from backend.command_output import (
+    MAX_RESULT_CHARS, MAX_STREAM_CHARS, RESULT_HEAD_CHARS, RESULT_TAIL_CHARS, CommandOutputs, cap_result,
+)
+
+
+def test_chunks_are_ordered_and_deduplicated():
+    outputs = CommandOutputs()
+    assert outputs.append("c", "a", "two", seq=2)
+    assert outputs.append("c", "a", "zero", seq=0)
+    assert outputs.append("c", "a", "one", seq=1)
+    assert not outputs.append("c", "a", "one again", seq=1)
+    assert outputs.append("c", "a", "three")          # seq=None appends after the last
+
+    out = outputs.get("c")
+    assert [c["seq"] for c in out["chunks"]] == [0, 1, 2, 3]
+    assert out["output"] == "zeroonetwothree"
+    assert out["last_seq"] == 3 and not out["done"]
+
+
+def test_tail_after_seq():
+    outputs = CommandOutputs()
+    for seq, text in enumerate("abc"):
+        outputs.append("c", "a", text, seq)
+    out = outputs.get("c", after_seq=1)
+    assert out["output"] == "c" and out["last_seq"] == 2
+    assert outputs.get("c", after_seq=2)["chunks"] == []
+    assert outputs.get("c", after_seq=2)["last_seq"] == 2
+
+
+def test_other_agents_cannot_write_to_a_command():
+    outputs = CommandOutputs()
+    outputs.append("c", "a", "mine", 0)
+    assert not outputs.append("c", "b", "not mine", 1)
+    assert outputs.get("c")["output"] == "mine"
+
+
+def test_stream_is_truncated_once():
+    outputs = CommandOutputs()
+    assert outputs.append("c", "a", "x" * (MAX_STREAM_CHARS - 10), 0)
+    assert outputs.append("c", "a", "y" * 100, 1)
+    assert not outputs.append("c", "a", "z", 2)
+
+    out = outputs.get("c")
+    assert out["truncated"]
+    assert out["output"].count("y") == 10
+    assert "output truncated" in out["output"]
+
+
+def test_finish_marks_done():
+    outputs = CommandOutputs()
+    outputs.finish("missing")
+    assert outputs.get("missing") is None
+    outputs.append("c", "a", "text", 0)
+    outputs.finish("c")
+    assert outputs.get("c")["done"]
+
+
+def test_cap_result_keeps_head_and_tail():
+    assert cap_result(None) is None
+    short = "ok" * 100
+    assert cap_result(short) == short
+
+    output = "h" * RESULT_HEAD_CHARS + "m" * 100000 + "t" * RESULT_TAIL_CHARS
+    capped = cap_result(output)
+    assert len(capped) <= MAX_RESULT_CHARS
+    assert capped.startswith("h" * RESULT_HEAD_CHARS) and capped.endswith("t" * RESULT_TAIL_CHARS)
+    assert "100000 characters omitted" in capped
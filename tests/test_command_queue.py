@@ -0,0 +1,178 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from backend.command_queue import MAX_ATTEMPTS, VISIBILITY_TIMEOUT, CommandQueue
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "queue.db")
+
+
+@pytest.fixture
+def queue(db_path):
+    q = CommandQueue(path=db_path)
+    yield q
+    q.close()
+
+
+def expire_leases(q, agent_id):
+    for command_id in q._leased.get(agent_id, {}):
+        q._leased[agent_id][command_id] = time.time() - 1
+
+
+def test_lease_then_ack(queue):
+    queued, duplicate = queue.enqueue("a", {"type": "cmd", "command": "dir"})
+    assert not duplicate and queued["id"]
+
+    assert queue.lease("a") == [queued]
+    assert queue.lease("a") == []          # leased: invisible until expiry
+    assert queue.pending_count("a") == 1
+
+    entry = queue.ack("a", queued["id"])
+    assert entry["command"] == queued and entry["attempts"] == 1
+    assert queue.ack("a", queued["id"]) is None
+    assert queue.pending_count("a") == 0
+
+
+def test_ack_from_another_agent_is_ignored(queue):
+    queued, _ = queue.enqueue("a", {"type": "cmd"})
+    queue.lease("a")
+    assert queue.ack("b", queued["id"]) is None
+    assert queue.pending_count("a") == 1
+
+
+def test_dedup_key_collapses_until_acked(queue):
+    first, _ = queue.enqueue("a", {"type": "quick_assist", "dedup_key": "qa"})
+    again, duplicate = queue.enqueue("a", {"type": "quick_assist", "dedup_key": "qa"})
+    assert duplicate and again["id"] == first["id"]
+    # other agents have their own keys
+    assert not queue.enqueue("b", {"type": "quick_assist", "dedup_key": "qa"})[1]
+
+    queue.lease("a")
+    queue.ack("a", first["id"])
+    assert not queue.enqueue("a", {"type": "quick_assist", "dedup_key": "qa"})[1]
+
+
+def test_expired_lease_is_redelivered_then_dropped(queue):
+    dropped = []
+    queue.on_drop = lambda agent_id, entry: dropped.append((agent_id, entry))
+    queued, _ = queue.enqueue("a", {"type": "cmd"})
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        assert queue.lease("a") == [queued]
+        assert queue._entries[queued["id"]]["attempts"] == attempt
+        expire_leases(queue, "a")
+
+    assert queue.lease("a") == []
+    assert queue.pending_count("a") == 0
+    assert [(agent_id, e["command"]["id"], e["attempts"]) for agent_id, e in dropped] == \
+        [("a", queued["id"], MAX_ATTEMPTS)]
+
+
+def test_on_drop_errors_do_not_break_lease(queue):
+    def boom(agent_id, entry):
+        raise RuntimeError("listener failed")
+    queue.on_drop = boom
+    queue.enqueue("a", {"type": "cmd"})
+    for _ in range(MAX_ATTEMPTS):
+        queue.lease("a")
+        expire_leases(queue, "a")
+    assert queue.lease("a") == []
+
+
+def test_deliver_once_types_are_not_redelivered(queue):
+    for ctype in ("shutdown", "restart"):
+        queued, _ = queue.enqueue("a", {"type": ctype})
+        assert queue.lease("a") == [queued]
+        expire_leases(queue, "a")
+        assert queue.lease("a") == []
+        assert queue.ack("a", queued["id"]) is None
+    assert queue.pending_count("a") == 0
+
+
+def test_lease_length_follows_command_timeout(queue):
+    assert queue.lease_seconds({"type": "cmd"}) >= VISIBILITY_TIMEOUT
+    assert queue.lease_seconds({"type": "cmd", "timeout": 1800}) > 1800
+    assert queue.lease_seconds({"type": "cmd", "timeout": "bogus"}) >= VISIBILITY_TIMEOUT
+    assert queue.lease_seconds({"type": "cmd", "visibility_timeout": 5}) == 5
+
+
+def test_extend_keeps_a_running_command_leased(queue):
+    queued, _ = queue.enqueue("a", {"type": "cmd"})
+    queue.lease("a")
+    expire_leases(queue, "a")
+    assert queue.extend("a", [queued["id"], "unknown"]) == 1
+    assert queue.lease("a") == []
+    assert queue._entries[queued["id"]]["attempts"] == 1
+
+
+def test_cancel_pending_only_before_delivery(queue):
+    waiting, _ = queue.enqueue("a", {"type": "cmd"})
+    assert queue.cancel_pending("a", waiting["id"])["command"] == waiting
+    assert queue.lease("a") == []
+
+    leased, _ = queue.enqueue("a", {"type": "cmd"})
+    queue.lease("a")
+    assert queue.cancel_pending("a", leased["id"]) is None
+    assert queue.pending_count("a") == 1
+
+
+def test_unacked_commands_survive_a_restart(db_path):
+    q = CommandQueue(path=db_path)
+    kept, _ = q.enqueue("a", {"type": "cmd", "command": "one"})
+    acked, _ = q.enqueue("a", {"type": "cmd", "command": "two"})
+    q.lease("a")
+    q.ack("a", acked["id"])
+    q.close()
+
+    restarted = CommandQueue(path=db_path)
+    try:
+        # leases are not persisted: everything unacked is handed out again
+        assert restarted.lease("a") == [kept]
+    finally:
+        restarted.close()
+
+
+def test_migrate_json_collapses_repeats_once(db_path, tmp_path):
+    legacy = tmp_path / "commands_db.json"
+    legacy.write_text(json.dumps({
+        "a": [{"type": "quick_assist", "id": "1"}, {"type": "quick_assist", "id": "2"},
+              {"type": "cmd", "command": "dir", "id": "3"}, "not a command"],
+        "b": [{"type": "quick_assist", "id": "4"}],
+    }))
+    q = CommandQueue(path=db_path)
+    try:
+        assert q.migrate_json(str(legacy)) == 3
+        assert [c["id"] for c in q.lease("a")] == ["1", "3"]
+        assert [c["id"] for c in q.lease("b")] == ["4"]
+        assert q.migrate_json(str(legacy)) == 0
+    finally:
+        q.close()
+
+    restarted = CommandQueue(path=db_path)
+    try:
+        assert restarted.migrate_json(str(legacy)) == 0
+    finally:
+        restarted.close()
+
+
+def test_lease_wait_wakes_up_on_enqueue(queue):
+    async def wait_for_command():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        threading.Timer(0.2, queue.enqueue, args=("a", {"type": "cmd", "id": "late"})).start()
+        commands = await queue.lease_wait("a", 5)
+        return commands, loop.time() - started
+
+    commands, waited = asyncio.run(wait_for_command())
+    assert [c["id"] for c in commands] == ["late"]
+    assert waited < 2
+
+
+def test_lease_wait_times_out_empty(queue):
+    assert asyncio.run(queue.lease_wait("a", 0.2)) == []
@@ -0,0 +1,75 @@
+import time
+
+from backend.presence import ONLINE_WINDOW, PRESENCE_GRACE, PresenceTracker
+
+
+def transitions(tracker):
+    return [(e["agent_id"], e["online"]) for e in tracker.events_since()]
+
+
+def test_touch_and_sweep_emit_transitions():
+    tracker = PresenceTracker()
+    tracker.touch("a", 1000)
+    tracker.touch("a", 1010)                  # already online: no event
+    assert tracker.sweep(1010 + ONLINE_WINDOW) == 0
+    assert tracker.sweep(1010 + ONLINE_WINDOW + 1) == 1
+    tracker.touch("a", 2000)
+    assert transitions(tracker) == [("a", True), ("a", False), ("a", True)]
+
+
+def test_window_follows_heartbeat_interval():
+    tracker = PresenceTracker()
+    tracker.touch("slow", 1000, interval=300)
+    tracker.touch("fast", 1000, interval=5)
+    tracker.sweep(1000 + ONLINE_WINDOW + 1)
+    assert transitions(tracker)[-1] == ("fast", False)
+
+    deadline = 1000 + 2 * 300 + PRESENCE_GRACE
+    assert tracker.sweep(deadline) == 0
+    assert tracker.sweep(deadline + 1) == 1
+    assert transitions(tracker)[-1] == ("slow", False)
+
+
+def test_superseded_deadline_does_not_expire_agent():
+    tracker = PresenceTracker()
+    tracker.touch("a", 1000, interval=5)
+    tracker.touch("a", 1000, interval=300)
+    assert tracker.sweep(1000 + ONLINE_WINDOW + 1) == 0
+    assert transitions(tracker) == [("a", True)]
+
+
+def test_queries_reflect_current_state():
+    tracker = PresenceTracker()
+    now = time.time()
+    tracker.touch("gone", now - 3600)
+    tracker.touch("slow", now - 120, interval=300)
+    tracker.touch("here", now)
+    tracker.sweep(now)
+
+    assert tracker.online_agents() == ["slow", "here"]
+    assert tracker.online_many(["gone", "slow", "here", "unknown"]) == [False, True, True, False]
+    assert tracker.is_online("here") and not tracker.is_online("gone")
+    # a slow-paced agent inside its window is not reported offline
+    assert [a["agent_id"] for a in tracker.offline_for(60, now=now)] == ["gone"]
+
+
+def test_load_seeds_without_events():
+    tracker = PresenceTracker()
+    now = time.time()
+    tracker.load({
+        "recent": {"last_seen": now - 5},
+        "slow": {"last_seen": now - 200, "heartbeat_interval": 300},
+        "old": {"last_seen": now - 3600},
+    }, now=now)
+    assert sorted(tracker.online_agents()) == ["recent", "slow"]
+    assert tracker.events_since() == []
+
+
+def test_listeners_get_every_transition():
+    tracker = PresenceTracker()
+    seen = []
+    tracker.add_listener(lambda e: seen.append((e["agent_id"], e["online"])))
+    tracker.add_listener(lambda e: 1 / 0)     # a failing listener doesn't stop the others
+    tracker.touch("a", 1000)
+    tracker.sweep(1000 + ONLINE_WINDOW + 1)
+    assert seen == [("a", True), ("a", False)]
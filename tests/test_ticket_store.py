@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+from ticket_store import TicketStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = TicketStore(str(tmp_path / "tickets.db"))
+    yield s
+    s.close()
+
+
+def ticket(**fields):
+    base = {"username": "alice", "issue": "printer jammed", "category": "Hardware",
+            "status": "pending", "timestamp": "2025-01-02 10:00:00"}
+    base.update(fields)
+    return base
+
+
+def test_create_allocates_sequential_ids(store):
+    first = store.create(ticket())
+    second = store.create(ticket(issue="vpn drops"))
+    assert (first["ticket_id"], second["ticket_id"]) == ("INC0000001", "INC0000002")
+    assert store.get("INC0000002")["issue"] == "vpn drops"
+    assert store.count() == 2
+
+
+def test_migrate_json_keeps_free_numbers_and_renumbers_clashes(store, tmp_path):
+    store.create(ticket(issue="already here"))                       # takes INC0000001
+    root = tmp_path / "tickets.json"
+    app = tmp_path / "app_tickets.json"
+    root.write_text(json.dumps([
+        ticket(ticket_id="INC0000001", issue="clashes with the store"),
+        ticket(ticket_id="INC0000005", issue="keeps its number",
+               device_info={"hostname": "pc1"}, custom="kept in extra"),
+    ]))
+    app.write_text(json.dumps([ticket(ticket_id="INC0000005", issue="clashes with the other file"), "junk"]))
+
+    assert store.migrate_json([str(root), str(app)]) == 3
+    assert store.get("INC0000005")["issue"] == "keeps its number"
+    assert json.loads(store.get("INC0000005")["device_info"]) == {"hostname": "pc1"}
+    assert store.get("INC0000005")["custom"] == "kept in extra"
+
+    renumbered = {t["issue"]: t for t in store.all() if t.get("legacy_id")}
+    assert renumbered["clashes with the store"]["ticket_id"] == "INC0000006"
+    assert renumbered["clashes with the store"]["legacy_id"] == "INC0000001"
+    assert renumbered["clashes with the other file"]["ticket_id"] == "INC0000007"
+
+    # each file is imported once, and new tickets continue after the highest number
+    assert store.migrate_json([str(root), str(app)]) == 0
+    assert store.create(ticket())["ticket_id"] == "INC0000008"
+
+
+def test_migrate_json_ignores_missing_and_broken_files(store, tmp_path):
+    broken = tmp_path / "broken.json"
+    broken.write_text("{not json")
+    assert store.migrate_json([str(tmp_path / "missing.json"), str(broken)]) == 0
+    assert store.count() == 0
+
+
+def test_update_many_applies_changes_and_records_status_history(store):
+    ids = [store.create(ticket())["ticket_id"] for _ in range(3)]
+    changed = store.update_many({
+        ids[0]: {"status": "resolved"},
+        ids[1]: {"status": "unresolved", "assigned_to": "L2"},
+        ids[2]: {"not_a_column": "ignored"},
+        "INC9999999": {"status": "resolved"},
+    }, changed_by="admin")
+    assert changed == 2
+    assert store.get(ids[0])["status"] == "resolved"
+    assert store.get(ids[1])["assigned_to"] == "L2"
+    assert store.get(ids[2])["status"] == "pending"
+
+    history = store.status_history()
+    assert {(h["ticket_id"], h["old_status"], h["new_status"], h["changed_by"]) for h in history} == {
+        (ids[0], "pending", "resolved", "admin"),
+        (ids[1], "pending", "unresolved", "admin"),
+    }
+    # same status again: updated, but no transition recorded
+    assert store.update(ids[0], status="resolved")
+    assert len(store.status_history(ids[0])) == 1
+
+
+def test_status_counts_follow_inserts_and_updates(store):
+    ids = [store.create(ticket())["ticket_id"] for _ in range(3)]
+    store.create(ticket(status=None))
+    assert store.status_counts() == {"pending": 3, "": 1}
+
+    store.update_many({ids[0]: {"status": "resolved"}, ids[1]: {"status": "resolved"}})
+    assert store.status_counts() == {"pending": 1, "resolved": 2, "": 1}
+
+    rows, total = store.query(status="resolved")
+    assert total == 2 and {r["ticket_id"] for r in rows} == {ids[0], ids[1]}
+
+
+def test_status_counts_are_rebuilt_for_an_existing_database(tmp_path):
+    path = str(tmp_path / "tickets.db")
+    first = TicketStore(path)
+    first.create(ticket())
+    first.create(ticket(status="resolved"))
+    first.close()
+
+    reopened = TicketStore(path)
+    try:
+        assert reopened.status_counts() == {"pending": 1, "resolved": 1}
+    finally:
+        reopened.close()
+
+
+def test_query_filters_search_and_pages(store):
+    for n in range(5):
+        store.create(ticket(username="bob" if n % 2 else "alice", issue=f"outlook crash number{n}"))
+    store.create(ticket(issue="printer offline"))
+
+    rows, total = store.query(username="alice", limit=2)
+    assert total == 4 and len(rows) == 2
+    assert rows[0]["ticket_id"] == "INC0000006"                  # newest first
+
+    rows, total = store.query(search="outl crash")
+    assert total == 5
+    rows, total = store.query(search="printer", username="alice")
+    assert total == 1 and rows[0]["issue"] == "printer offline"
+    assert store.query(search="   ")[1] == 6